@@ -0,0 +1,72 @@
+"""Runs the benchmark suite.
+
+Examples::
+
+    # quick sweep, results are written to benchmark-results.json
+    python -m benchmarks
+    # store a baseline, later runs are compared against it
+    python -m benchmarks --output baseline.json
+    python -m benchmarks --compare baseline.json
+    # full sweep (up to 1e6 particles) of the map cases only
+    python -m benchmarks --profile full --case "^map"
+"""
+
+import argparse
+import re
+import sys
+
+import benchmarks.cases  # noqa: F401, registers the cases
+from benchmarks.harness import CASES, compare, load_results, run_cases, save_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--profile", choices=("quick", "full"), default="quick")
+    parser.add_argument(
+        "--case", default=None, help="regular expression selecting cases"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed runs per measurement"
+    )
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument(
+        "--compare", default=None, help="baseline results to compare to"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="time or memory ratio to the baseline reported as regression",
+    )
+    parser.add_argument("--list", action="store_true", help="lists the cases and exits")
+    args = parser.parse_args(argv)
+
+    names = sorted(n for n in CASES if args.case is None or re.search(args.case, n))
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    results = run_cases(names, profile=args.profile, repeat=args.repeat)
+    save_results(results, args.output)
+    if args.compare is None:
+        return 0
+
+    comparisons = compare(results, load_results(args.compare), threshold=args.threshold)
+    regressions = [c for c in comparisons if c["regression"]]
+    for c in comparisons:
+        print(
+            "%-40s %-45s time x%.2f memory x%.2f%s"
+            % (
+                c["case"],
+                " ".join("%s=%s" % item for item in c["params"].items()),
+                c["time_ratio"],
+                c["memory_ratio"],
+                "  REGRESSION" if c["regression"] else "",
+            )
+        )
+    print("%d of %d measurements regressed" % (len(regressions), len(comparisons)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+from functools import lru_cache
+
+import numpy as np
+
+from benchmarks.harness import case
+from uwb.algorithm import BasicParticleFilter, MNMAParticleFilter
+from uwb.generator import BlobGenerator
+from uwb.map import NoiseMapGM, NoiseMapNormal
+
+STEP_SIZE = 10
+MAPS = {"normal": NoiseMapNormal, "gm": NoiseMapGM}
+MAP_SEED = 0
+
+
+def _generator(grid, dim, rng, measurements_per_location=20):
+    return BlobGenerator(
+        grid_dims=[grid] * dim,
+        step_size=STEP_SIZE,
+        measurements_per_location=measurements_per_location,
+        modal_range=(1, 3),
+        deviation=1.0,
+        rng=rng,
+    )
+
+
+@lru_cache(maxsize=None)
+def _noise_map(kind, grid, dim):
+    """Built maps are shared by all cases querying them, so they use a fixed seed."""
+    noise_map = MAPS[kind](_generator(grid, dim, MAP_SEED))
+    noise_map.gen()
+    return noise_map
+
+
+def _particles(n, grid, dim, rng):
+    """Particles spread uniformly over the grid."""
+    return rng.uniform(0, (grid + 1) * STEP_SIZE, (n, dim))
+
+
+@case("basic_pf.update_weights", ("particles", "measurements", "dim"))
+def basic_pf_update_weights(particles, measurements, dim, rng):
+    pf = BasicParticleFilter(
+        rng.standard_normal((particles, dim)), np.ones(particles) / particles, rng=rng
+    )
+    z = rng.standard_normal((measurements, dim))
+    return lambda: pf.update_weights(z), particles
+
+
+@case("basic_pf.resample", ("particles", "dim"))
+def basic_pf_resample(particles, dim, rng):
+    pf = BasicParticleFilter(
+        rng.standard_normal((particles, dim)), np.ones(particles) / particles, rng=rng
+    )
+    return pf.resample, particles
+
+
+def _mnmapf(kind, particles, grid, dim, rng):
+    return MNMAParticleFilter(
+        _particles(particles, grid, dim, rng),
+        np.ones(particles) / particles,
+        map=_noise_map(kind, grid, dim),
+        rng=rng,
+    )
+
+
+for _kind in MAPS:
+
+    @case("mnmapf[%s].update_weights" % _kind, ("particles", "measurements", "grid"))
+    def mnmapf_update_weights(particles, measurements, grid, rng, kind=_kind, dim=3):
+        pf = _mnmapf(kind, particles, grid, dim, rng)
+        z = _particles(measurements, grid, dim, rng)
+        return lambda: pf.update_weights(z), particles
+
+    @case("mnmapf[%s].resample" % _kind, ("particles", "grid"))
+    def mnmapf_resample(particles, grid, rng, kind=_kind, dim=3):
+        return _mnmapf(kind, particles, grid, dim, rng).resample, particles
+
+    @case("map[%s].gen" % _kind, ("grid", "dim"), unit="positions/s")
+    def map_gen(grid, dim, rng, kind=_kind):
+        generator = _generator(grid, dim, rng)
+        generator.gen()
+        return MAPS[kind](generator).gen, grid**dim
+
+    @case("map[%s].conditioned_probability" % _kind, ("particles", "grid", "dim"))
+    def map_conditioned_probability(particles, grid, dim, rng, kind=_kind):
+        noise_map = _noise_map(kind, grid, dim)
+        x = _particles(particles, grid, dim, rng)
+        z = x + rng.standard_normal((particles, dim))
+        return lambda: noise_map.conditioned_probability(z, x), particles
+
+    @case(
+        "map[%s].conditioned_log_likelihood" % _kind,
+        ("particles", "measurements", "grid"),
+        unit="particle-measurement pairs/s",
+    )
+    def map_conditioned_log_likelihood(
+        particles, measurements, grid, rng, kind=_kind, dim=3
+    ):
+        noise_map = _noise_map(kind, grid, dim)
+        x = _particles(particles, grid, dim, rng)
+        z = _particles(measurements, grid, dim, rng)
+        return (
+            lambda: noise_map.conditioned_log_likelihood(z, x),
+            particles * measurements,
+        )
+
+    @case("map[%s].sample_from" % _kind, ("particles", "grid", "dim"))
+    def map_sample_from(particles, grid, dim, rng, kind=_kind):
+        noise_map = _noise_map(kind, grid, dim)
+        x = _particles(particles, grid, dim, rng)
+        return lambda: noise_map.sample_from(x, rng=rng), particles
+
+
+@case("blob_gen.gen", ("grid", "dim"), unit="positions/s")
+def blob_gen(grid, dim, rng):
+    return _generator(grid, dim, rng).gen, grid**dim
+
+
+@case("blob_gen.get_closest_position", ("particles", "grid", "dim"), unit="lookups/s")
+def blob_gen_get_closest_position(particles, grid, dim, rng):
+    generator = _generator(grid, dim, rng)
+    x = _particles(particles, grid, dim, rng)
+    return lambda: generator.get_closest_position(x), particles
@@ -0,0 +1,190 @@
+import json
+import math
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+# values of the swept parameters, one axis is varied at a time around the defaults
+AXES = {
+    "particles": {
+        "quick": [100, 1000, 10000],
+        "full": [100, 1000, 10000, 100000, 1000000],
+    },
+    "measurements": {"quick": [1, 10], "full": [1, 10, 100]},
+    "grid": {"quick": [5, 10], "full": [5, 10, 20, 40]},
+    "dim": {"quick": [2, 3], "full": [2, 3]},
+}
+DEFAULTS = {"particles": 10000, "measurements": 10, "grid": 10, "dim": 3}
+
+CASES = {}
+
+
+def case(name, axes, unit="particle-updates/s"):
+    """Registers a benchmark case.
+
+    The decorated function receives the values of its axes and a numpy Generator ``rng`` as
+    keyword arguments, prepares the benchmarked state drawing all random numbers from ``rng``
+    and returns a callable running the hot path once together with the number of items
+    processed per run, e.g. particles.
+
+    Args:
+        name: name of the case.
+        axes: names of the parameters swept for this case, see :data:`AXES`.
+        unit: Optional; unit of the reported throughput.
+    """
+
+    def register(setup):
+        CASES[name] = (setup, tuple(axes), unit)
+        return setup
+
+    return register
+
+
+def sweep(axes, profile="quick"):
+    """Parameter sets varying one axis at a time around :data:`DEFAULTS`."""
+    seen = []
+    for axis in axes:
+        for value in AXES[axis][profile]:
+            params = {a: DEFAULTS[a] for a in axes}
+            params[axis] = value
+            if params not in seen:
+                seen.append(params)
+                yield params
+
+
+def measure(run, items, repeat=3, min_time=0.05):
+    """Measures wall time, peak traced memory and throughput of a callable.
+
+    The callable is run once for warm up. Short runs are looped such that every timing covers
+    at least :attr:`min_time` seconds, the wall time per run is the minimum over
+    :attr:`repeat` timings. The peak memory is traced in one additional run.
+    """
+    start = time.perf_counter()
+    run()
+    number = max(1, math.ceil(min_time / max(time.perf_counter() - start, 1e-9)))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    wall_time = min(times)
+    return {
+        "wall_time": wall_time,
+        "median_time": statistics.median(times),
+        "peak_memory": peak_memory,
+        "throughput": items / wall_time if wall_time > 0 else float("inf"),
+    }
+
+
+def run_cases(names=None, profile="quick", repeat=3, seed=0, log=print):
+    """Runs the sweeps of the selected cases.
+
+    Args:
+        names: Optional; names of the cases to run, all registered cases if not provided.
+        profile: Optional; ``quick`` or ``full`` values of :data:`AXES`.
+        repeat: Optional; number of timed runs per parameter set.
+        seed: Optional; seed of the numpy Generator passed to every parameter set of a case.
+        log: Optional; called with a line per finished measurement.
+
+    Returns:
+        Results as JSON serializable dictionary.
+    """
+    results = []
+    for name in names or sorted(CASES):
+        setup, axes, unit = CASES[name]
+        for params in sweep(axes, profile):
+            run, items = setup(rng=np.random.default_rng(seed), **params)
+            result = {"case": name, "params": params, "unit": unit}
+            result.update(measure(run, items, repeat=repeat))
+            results.append(result)
+            if log is not None:
+                log(_format(result))
+    return {"machine": machine_info(), "profile": profile, "results": results}
+
+
+def machine_info():
+    """Description of the machine and library versions the results were measured on."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(results, path):
+    """Writes results as JSON."""
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    """Reads results written by :func:`save_results`."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=1.25):
+    """Compares results to a baseline measured with the same parameters.
+
+    Args:
+        results: results of :func:`run_cases`.
+        baseline: earlier results of :func:`run_cases`, e.g. read with :func:`load_results`.
+        threshold: Optional; ratio of wall time or peak memory to the baseline above which a
+          measurement is a regression.
+
+    Returns:
+        List of comparisons with the time and memory ratio per measurement present in both
+        results and whether it regressed.
+    """
+    reference = {_key(r): r for r in baseline["results"]}
+    comparisons = []
+    for result in results["results"]:
+        base = reference.get(_key(result))
+        if base is None:
+            continue
+        time_ratio = result["wall_time"] / max(base["wall_time"], 1e-12)
+        memory_ratio = result["peak_memory"] / max(base["peak_memory"], 1)
+        comparisons.append(
+            {
+                "case": result["case"],
+                "params": result["params"],
+                "time_ratio": time_ratio,
+                "memory_ratio": memory_ratio,
+                "regression": time_ratio > threshold or memory_ratio > threshold,
+            }
+        )
+    return comparisons
+
+
+def _key(result):
+    """Identifies a measurement by its case and parameters."""
+    return result["case"], tuple(sorted(result["params"].items()))
+
+
+def _format(result):
+    """One line summary of a measurement."""
+    params = " ".join("%s=%s" % item for item in result["params"].items())
+    return "%-40s %-45s %10.3f ms %10.1f MiB %12.4g %s" % (
+        result["case"],
+        params,
+        result["wall_time"] * 1e3,
+        result["peak_memory"] / 2**20,
+        result["throughput"],
+        result["unit"],
+    )
@@ -1,4 +1,5 @@
 import numpy as np
+from scipy.stats import multivariate_normal
 
 from uwb.algorithm import BasicParticleFilter
 
@@ -24,3 +25,46 @@ def test_resample():
 
     bpf.resample()
     assert np.allclose(bpf.weights, np.ones(10) * 0.1)
+
+
+def test_update_weights_matches_reference():
+    particles = np.random.randn(50, 3) * 5.0
+    z = np.random.randn(4, 3) * 5.0
+    bpf = BasicParticleFilter(particles, np.ones(50) / 50)
+
+    expected = np.ones(50)
+    for item in z:
+        expected *= multivariate_normal.pdf(particles, mean=item, cov=bpf.data_cov)
+    expected /= expected.sum()
+
+    bpf.update_weights(z)
+    assert np.allclose(bpf.weights, expected)
+
+
+def test_update_weights_no_underflow():
+    bpf = BasicParticleFilter(np.random.randn(100, 3), np.ones(100) * 0.01)
+
+    # densities of far away measurements underflow if multiplied directly
+    bpf.update_weights(np.ones((200, 3)) * 50.0)
+    assert np.all(np.isfinite(bpf.weights))
+    assert np.abs(np.sum(bpf.weights) - 1) < 1e-6
+
+
+def test_adaptive_resampling():
+    bpf = BasicParticleFilter(
+        np.random.randn(100, 3), np.ones(100) * 0.01, ess_threshold=0.5
+    )
+    assert bpf.ess == 100
+
+    # uninformative measurements keep the weights uniform
+    bpf.update_weights(np.empty((0, 3)))
+    assert not bpf.maybe_resample()
+    assert bpf.n_resamples == 0
+
+    bpf.update_weights(np.ones((50, 3)) * 3.0)
+    assert bpf.ess < 50
+    assert bpf.maybe_resample()
+    assert bpf.n_resamples == 1
+    assert isinstance(bpf.n_resamples, int)
+    assert bpf.ess == 100
+    assert len(bpf.ess_trace) == 1
@@ -0,0 +1,40 @@
+import numpy as np
+
+import benchmarks.cases  # noqa: F401, registers the cases
+from benchmarks.harness import CASES, DEFAULTS, compare, measure, sweep
+
+
+def test_sweep_varies_one_axis_at_a_time():
+    params = list(sweep(("particles", "dim")))
+    assert {"particles": DEFAULTS["particles"], "dim": DEFAULTS["dim"]} in params
+    assert len(params) == len({tuple(sorted(p.items())) for p in params})
+    for p in params:
+        assert p["particles"] == DEFAULTS["particles"] or p["dim"] == DEFAULTS["dim"]
+
+
+def test_compare_detects_regressions():
+    result = measure(lambda: sum(range(100)), items=100, repeat=2, min_time=0.001)
+    assert result["throughput"] > 0
+
+    baseline = {"results": [{"case": "a", "params": {"particles": 10}, **result}]}
+    slower = dict(result, wall_time=result["wall_time"] * 2)
+    results = {
+        "results": [
+            {"case": "a", "params": {"particles": 10}, **slower},
+            {"case": "b", "params": {"particles": 10}, **result},  # not in baseline
+        ]
+    }
+    (comparison,) = compare(results, baseline, threshold=1.5)
+    assert comparison["case"] == "a"
+    assert comparison["regression"]
+    assert not compare(baseline, baseline)[0]["regression"]
+
+
+def test_cases_are_reproducible():
+    setup, _, _ = CASES["mnmapf[gm].resample"]
+    particles = []
+    for _ in range(2):
+        run, _ = setup(particles=100, grid=5, rng=np.random.default_rng(0))
+        run()
+        particles.append(run.__self__.particles.copy())
+    assert np.array_equal(*particles)
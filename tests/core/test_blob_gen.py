@@ -69,3 +69,81 @@ def test_closest_position_in_grid():
     assert tuple(np.asarray(pos[0])) == (0, 0, 0)  # position (10, 10, 10)
     assert tuple(np.asarray(pos[1])) == (1, 3, 5)  # position (20, 40, 60)
     assert tuple(np.asarray(pos[2])) == (0, 1, 2)  # position (10, 20, 30)
+
+
+def test_reproducible_generation():
+    kwargs = dict(
+        grid_dims=[3, 4, 5],
+        step_size=10,
+        measurements_per_location=50,
+        modal_range=(1, 3),
+        deviation=1.0,
+    )
+    first = BlobGenerator(**kwargs, rng=42).gen()
+    second = BlobGenerator(**kwargs, rng=np.random.default_rng(42)).gen()
+    assert np.array_equal(first, second)
+    assert first.shape == (3, 4, 5, 50, 3)
+
+    # samples stay close to their grid position
+    positions = np.stack(
+        np.meshgrid(*[(np.arange(n) + 1) * 10 for n in (3, 4, 5)], indexing="ij"),
+        axis=-1,
+    )
+    assert np.all(np.abs(first.mean(axis=3) - positions) < 5.0)
+
+
+def test_memory_mapped_storage(tmp_path):
+    kwargs = dict(
+        grid_dims=[3, 4, 5],
+        step_size=10,
+        measurements_per_location=20,
+        modal_range=(1, 3),
+        deviation=1.0,
+        chunk_size=7,
+    )
+    in_memory = BlobGenerator(**kwargs, rng=0).gen()
+    bg = BlobGenerator(
+        **kwargs, rng=0, storage=str(tmp_path / "samples.npy"), dtype=np.float32
+    )
+    samples = bg.gen()
+
+    assert isinstance(samples, np.memmap)
+    assert samples.dtype == np.float32
+    assert np.allclose(samples, in_memory, atol=1e-4)
+
+    data, idx, _ = next(iter(bg))
+    assert idx == (0, 0, 0)
+    assert np.array_equal(data, samples[0, 0, 0])
+    assert np.array_equal(np.load(tmp_path / "samples.npy"), samples)
+
+
+def test_closest_cell_non_cubic_grid():
+    bg = BlobGenerator(
+        grid_dims=[5, 2, 3],
+        step_size=10,
+        measurements_per_location=10,
+        modal_range=(1, 1),
+    )
+    coordinates = np.random.uniform(-20, 80, (1000, 3))
+
+    # reference: nearest grid position per dimension by brute force
+    expected = np.stack(
+        [
+            np.argmin(np.abs(coordinates[:, i, None] - bg.grid[i]), axis=1)
+            for i in range(3)
+        ],
+        axis=-1,
+    )
+    out = np.empty(1000, dtype=np.intp)
+    cells, idxs = bg.get_closest_cell(coordinates, out=out)
+    assert cells is out
+    assert np.array_equal(idxs, expected)
+    assert np.array_equal(cells, np.ravel_multi_index(tuple(expected.T), bg.shape))
+
+    pos_idxs, pos = bg.get_closest_position(coordinates)
+    assert np.array_equal(pos_idxs, expected)
+    assert np.array_equal(pos, (expected + 1) * 10)
+
+    # ties between two positions map to the upper one
+    _, idxs = bg.get_closest_cell(np.array([[15.0, 15.0, 25.0]]))
+    assert tuple(idxs[0]) == (1, 1, 2)
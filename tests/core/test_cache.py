@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+from omegaconf import OmegaConf
+
+from uwb.map import NoiseMapNormal
+from uwb.util.builder import create_noise_map, noise_map_cache_key
+from uwb.util.cache import MapCache
+
+
+def _config(**map_cfg):
+    return OmegaConf.create(
+        {
+            "seed": 0,
+            "generator": {
+                "name": "BlobGenerator",
+                "grid_dims": [2, 4, 6],
+                "step_size": 10,
+                "measurements_per_location": 50,
+                "modal_range": [1, 3],
+                "deviation": 1.0,
+                "storage": None,
+            },
+            "map": {"name": "NoiseMapNormal", "n_jobs": 1, **map_cfg},
+        }
+    )
+
+
+def test_cache_key():
+    assert noise_map_cache_key(_config()) == noise_map_cache_key(_config())
+    assert noise_map_cache_key(_config()) == noise_map_cache_key(_config(n_jobs=4))
+
+    other_seed = _config()
+    other_seed.seed = 1
+    assert noise_map_cache_key(_config()) != noise_map_cache_key(other_seed)
+
+
+def test_cached_noise_map(tmp_path):
+    cache = MapCache(str(tmp_path))
+    built = create_noise_map(_config(), cache=cache)
+    cached = create_noise_map(_config(), cache=cache)
+
+    assert isinstance(cached, NoiseMapNormal)
+    assert isinstance(cached.means, np.memmap)  # loaded instead of rebuilt
+    assert np.array_equal(cached.means, built.means)
+
+
+def test_cache_eviction(tmp_path):
+    cache = MapCache(str(tmp_path), max_size=1)
+    cfg = _config()
+    create_noise_map(cfg, cache=cache)
+    cfg.seed = 1
+    create_noise_map(cfg, cache=cache)
+
+    # only the most recent entry is kept
+    assert cache.get(noise_map_cache_key(cfg)) is not None
+    cfg.seed = 0
+    assert cache.get(noise_map_cache_key(cfg)) is None
+
+
+def test_cache_entries_follow_umask(tmp_path):
+    mask = os.umask(0o022)
+    try:
+        cache = MapCache(str(tmp_path))
+        create_noise_map(_config(), cache=cache)
+    finally:
+        os.umask(mask)
+
+    (entry,) = os.listdir(str(tmp_path))
+    assert os.stat(os.path.join(str(tmp_path), entry)).st_mode & 0o777 == 0o755
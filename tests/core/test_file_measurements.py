@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from uwb.generator import FileMeasurements
+from uwb.generator.file_measurements import save_binary
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+
+def test_csv_batches():
+    measurements = FileMeasurements(
+        "measurements/test_measurements.csv", 3, chunk_size=4
+    )
+    batches = list(measurements)
+
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+    assert np.array_equal(
+        np.concatenate(batches),
+        np.genfromtxt(
+            os.path.join(ROOT, "measurements/test_measurements.csv"), delimiter=","
+        ),
+    )
+
+
+def test_npy_batches(tmp_path):
+    data = np.random.randn(100, 3)
+    np.save(tmp_path / "measurements.npy", data)
+    batches = list(FileMeasurements(str(tmp_path / "measurements.npy"), 32))
+
+    assert [len(b) for b in batches] == [32, 32, 32, 4]
+    assert isinstance(batches[0], np.memmap)  # views into the mapped file
+    assert np.array_equal(np.concatenate(batches), data)
+
+
+def test_binary_batches(tmp_path):
+    data = np.random.randn(100, 3)
+    save_binary(str(tmp_path / "measurements.bin"), data)
+    batches = list(FileMeasurements(str(tmp_path / "measurements.bin"), 50))
+
+    assert [len(b) for b in batches] == [50, 50]
+    assert isinstance(batches[0], np.memmap)
+    assert batches[0].dtype == np.float32
+    assert np.allclose(np.concatenate(batches), data, atol=1e-6)
+
+
+def test_csv_missing_values_and_header(tmp_path):
+    # only the first and the last chunk need the fallback parser
+    path = tmp_path / "measurements.csv"
+    path.write_text("x,y,z\n1,2,3\n4,5,6\n7,8,9\n4,,6\n7,8,9\n")
+    batches = list(FileMeasurements(str(path), 2, chunk_size=2))
+
+    assert [len(b) for b in batches] == [2, 2, 2]
+    expected = np.genfromtxt(path, delimiter=",")
+    assert np.array_equal(np.concatenate(batches), expected, equal_nan=True)
+    assert np.isnan(batches[0][0]).all() and np.isnan(batches[2][0, 1])
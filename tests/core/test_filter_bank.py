@@ -0,0 +1,86 @@
+import numpy as np
+
+from uwb.algorithm import MNMAParticleFilter, MNMAParticleFilterBank
+from uwb.generator import BlobGenerator
+from uwb.map import NoiseMapGM, NoiseMapNormal
+
+
+def _particles(K, N):
+    return np.random.uniform(5.0, 45.0, size=(K, N, 3)), np.ones((K, N)) / N
+
+
+def test_update_weights_matches_single_filters():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    for noise_map in (NoiseMapNormal(generator=bg), NoiseMapGM(generator=bg)):
+        noise_map.gen()
+        particles, weights = _particles(4, 20)
+        bank = MNMAParticleFilterBank(particles, weights, map=noise_map)
+        filters = [
+            MNMAParticleFilter(particles[k].copy(), weights[k].copy(), map=noise_map)
+            for k in range(4)
+        ]
+
+        z = [
+            np.array([[11.0, 12.0, 13.0], [20.0, 20.0, 20.0]]),
+            None,  # no new measurements for this tag
+            np.array([[15.0, 35.0, 45.0]]),
+            np.random.uniform(5.0, 45.0, size=(5, 3)),
+        ]
+        bank.update_weights(z)
+        for pf, z_k in zip(filters, z):
+            if z_k is not None:
+                pf.update_weights(z_k)
+
+        assert np.allclose(bank.weights, np.stack([pf.weights for pf in filters]))
+        assert np.allclose(bank.weights.sum(axis=1), 1.0)
+
+
+def test_resample():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    particles, weights = _particles(3, 50)
+    bank = MNMAParticleFilterBank(particles, weights, map=noise_map)
+
+    bank.update_weights(np.random.uniform(5.0, 45.0, size=(3, 2, 3)))
+    untouched = bank.particles[1].copy()
+    bank.resample(tags=[0, 2])
+    assert np.array_equal(bank.particles[1], untouched)
+    assert np.allclose(bank.weights[[0, 2]], 1 / 50)
+
+    bank.resample()
+    assert bank.particles.shape == (3, 50, 3)
+    assert np.allclose(bank.weights, 1 / 50)
+
+
+def test_adaptive_resampling():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    particles, weights = _particles(3, 50)
+    bank = MNMAParticleFilterBank(particles, weights, map=noise_map, ess_threshold=0.5)
+
+    # only the second tag receives measurements and degenerates
+    bank.update_weights([None, np.random.uniform(5.0, 45.0, size=(20, 3)), None])
+    assert bank.ess[1] < 25
+    assert bank.maybe_resample()
+    assert tuple(bank.n_resamples) == (0, 1, 0)
+    assert np.allclose(bank.ess, 50)
@@ -1,7 +1,8 @@
 import numpy as np
+from scipy.stats import multivariate_normal
 
 from uwb.generator import BlobGenerator
-from uwb.map import NoiseMapGM
+from uwb.map import NoiseMap, NoiseMapGM
 
 
 def test_generate_normal_noise_map():
@@ -56,3 +57,200 @@ def test_samples_from():
 
     samples = noise_map.sample_from(np.array([[1.0, 1.0, 1.0], [20.0, 20.0, 20.0]]))
     assert samples.shape == (2, 3)
+
+
+def test_conditioned_log_likelihood():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+
+    z = np.array([[11.0, 12.0, 13.0], [20.0, 20.0, 20.0], [14.0, 35.0, 40.0]])
+    particles = np.array([[12.0, 13.0, 14.0], [20.0, 20.0, 21.0], [15.0, 33.0, 41.0]])
+    log_prob = noise_map.conditioned_log_likelihood(z, particles)
+    assert log_prob.shape == (3, 3)
+
+    # the diagonal holds the pairwise probabilities
+    prob = noise_map.conditioned_probability(z, particles)
+    assert np.allclose(np.exp(np.diag(log_prob)), prob)
+
+
+def test_samples_from_components():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+
+    weights, means, _ = noise_map[(1, 2, 3)]
+    samples = noise_map.sample_from(np.tile([[21.0, 29.0, 40.0]], (20000, 1)))
+    expected_mean = weights @ means + np.array([20.0, 30.0, 40.0])
+    assert np.allclose(samples.mean(axis=0), expected_mean, atol=0.5)
+
+
+def test_dense_parameters():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+
+    K = noise_map.weights.shape[-1]
+    assert noise_map.means.shape == (2, 4, 6, K, 3)
+    assert noise_map.chol.shape == (2, 4, 6, K, 3, 3)
+    assert noise_map.mask.shape == (2, 4, 6, K)
+    assert np.all(noise_map.mask[..., 0])
+    assert np.allclose(noise_map.weights.sum(axis=-1), 1.0)
+    assert np.all(noise_map.weights[~noise_map.mask] == 0)
+
+    z = np.array([[21.0, 30.0, 41.0]])
+    weights, means, covs = noise_map[(1, 2, 3)]
+    expected = sum(
+        w * multivariate_normal.pdf(z[0], mean=m + [20.0, 30.0, 40.0], cov=c)
+        for w, m, c in zip(weights, means, covs)
+    )
+    prob = noise_map.conditioned_probability(z, np.array([[21.0, 29.0, 40.0]]))
+    assert np.allclose(prob, expected)
+
+
+def test_rank_deficient_components_are_floored():
+    bg = BlobGenerator(
+        grid_dims=[4, 4, 4],
+        step_size=10,
+        measurements_per_location=50,
+        modal_range=(1, 5),
+        deviation=10.0,
+        rng=0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+    assert "covs" not in noise_map._param_names
+
+    # clusters of up to 3 samples in 3D are rank deficient, all others are kept
+    n_floored = 0
+    for samples, idx, _ in bg:
+        labels = noise_map.db.fit(samples).labels_
+        for k in range(labels.max() + 1):
+            sample_cov = np.cov(samples[labels == k].T)
+            cov = noise_map.covs[tuple(idx) + (k,)]
+            if np.sum(labels == k) <= 3:
+                assert np.all(np.linalg.eigvalsh(cov) >= noise_map.min_variance * 0.99)
+                n_floored += 1
+            else:
+                assert np.allclose(cov, sample_cov)
+    assert n_floored > 0
+
+
+def test_parallel_generation():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    bg.gen()
+    serial = NoiseMapGM(generator=bg)
+    serial.gen()
+    parallel = NoiseMapGM(generator=bg)
+    parallel.gen(n_jobs=2, chunk_size=5)
+
+    assert np.array_equal(serial.weights, parallel.weights)
+    assert np.array_equal(serial.means, parallel.means)
+    assert np.array_equal(serial.covs, parallel.covs)
+    assert np.array_equal(serial.mask, parallel.mask)
+
+
+def test_save_load(tmp_path):
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapGM(generator=bg, eps=1.5)
+    noise_map.gen()
+    noise_map.save(str(tmp_path / "map"))
+
+    loaded = NoiseMap.load(str(tmp_path / "map"))
+    assert isinstance(loaded, NoiseMapGM)
+    assert loaded.db.eps == 1.5
+    assert loaded.min_variance == noise_map.min_variance
+    assert np.array_equal(loaded.mask, noise_map.mask)
+    assert np.array_equal(loaded.weights, noise_map.weights)
+
+    z = np.array([[11.0, 12.0, 13.0], [20.0, 20.0, 20.0]])
+    particles = np.array([[12.0, 13.0, 14.0], [20.0, 20.0, 21.0]])
+    assert np.allclose(
+        loaded.conditioned_log_likelihood(z, particles),
+        noise_map.conditioned_log_likelihood(z, particles),
+    )
+    assert loaded.sample_from(particles).shape == (2, 3)
+
+
+def test_grouped_cells_match_per_particle_evaluation():
+    bg = BlobGenerator(
+        grid_dims=[4, 4, 4],
+        step_size=10,
+        measurements_per_location=60,
+        modal_range=(1, 3),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+
+    # many particles in few cells, batched for two tags
+    particles = np.random.uniform(14, 26, (2, 300, 3))
+    z = np.random.uniform(10, 30, (2, 5, 3))
+    z_paired = np.random.uniform(10, 30, (300, 3))
+    grouped = noise_map.conditioned_log_likelihood(z, particles)
+    grouped_prob = noise_map.conditioned_probability(z_paired, particles[0])
+
+    noise_map.group_cells = False
+    assert np.allclose(grouped, noise_map.conditioned_log_likelihood(z, particles))
+    assert np.allclose(
+        grouped_prob, noise_map.conditioned_probability(z_paired, particles[0])
+    )
+
+
+def test_grouped_cells_broadcast_batch_dimensions():
+    bg = BlobGenerator(
+        grid_dims=[4, 4, 4],
+        step_size=10,
+        measurements_per_location=30,
+        modal_range=(1, 2),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+
+    # leading dimensions of z and particles broadcast against each other
+    shapes = [
+        ((3, 5, 3), (7, 3), (3, 7, 5)),
+        ((3, 5, 3), (1, 7, 3), (3, 7, 5)),
+        ((2, 1, 5, 3), (3, 7, 3), (2, 3, 7, 5)),
+        ((5, 3), (3, 7, 3), (3, 7, 5)),
+    ]
+    for z_shape, particles_shape, expected in shapes:
+        z = np.random.uniform(10, 30, z_shape)
+        particles = np.random.uniform(14, 26, particles_shape)
+        noise_map.group_cells = True
+        grouped = noise_map.conditioned_log_likelihood(z, particles)
+        noise_map.group_cells = False
+        ungrouped = noise_map.conditioned_log_likelihood(z, particles)
+        assert grouped.shape == expected
+        assert np.allclose(grouped, ungrouped)
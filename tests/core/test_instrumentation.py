@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+from uwb.algorithm import BasicParticleFilter, MNMAParticleFilter
+from uwb.generator import BlobGenerator
+from uwb.map import NoiseMapNormal
+from uwb.util.instrumentation import (
+    HistogramSink,
+    Instrumentation,
+    JsonLinesSink,
+    PrometheusSink,
+)
+
+
+def _mnmapf():
+    bg = BlobGenerator(
+        grid_dims=[3, 3, 3],
+        step_size=10,
+        measurements_per_location=30,
+        modal_range=(1, 1),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    return MNMAParticleFilter(
+        np.random.uniform(10, 30, (50, 3)), np.ones(50) / 50, map=noise_map
+    )
+
+
+def test_stages_are_recorded():
+    pf = _mnmapf()
+    update_weights = MNMAParticleFilter.update_weights
+
+    with Instrumentation(HistogramSink()) as instrumentation:
+        for _ in range(3):
+            pf.update_weights(np.random.uniform(10, 30, (4, 3)))
+            pf.resample()
+    summary = instrumentation.sink.summary()
+
+    # original methods are restored
+    assert MNMAParticleFilter.update_weights is update_weights
+
+    assert summary["filter.update_weights"]["count"] == 3
+    assert summary["filter.update_weights"]["particles"] == 150
+    assert summary["filter.update_weights"]["measurements"] == 12
+    assert summary["filter.resample"]["count"] == 3
+    assert summary["filter.resample"]["ess"] == 50
+    assert 0 <= summary["filter.normalize"]["entropy"] <= np.log(50) + 1e-9
+    # NoiseMapNormal calls the instrumented NoiseMap implementation, recorded once
+    assert summary["map.conditioned_log_likelihood"]["count"] == 3
+    assert summary["map.sample_from"]["count"] == 3
+    assert summary["generator.get_closest_cell"]["count"] == 6
+    assert all(s["mean_duration"] > 0 for s in summary.values())
+
+
+def test_single_instrumentation():
+    with Instrumentation(HistogramSink()):
+        with pytest.raises(RuntimeError):
+            Instrumentation(HistogramSink()).enable()
+
+
+def test_json_lines_and_prometheus_sinks(tmp_path):
+    pf = BasicParticleFilter(np.random.randn(20, 3), np.ones(20) / 20)
+    json_sink = JsonLinesSink(str(tmp_path / "stages.jsonl"))
+    with Instrumentation(json_sink, stages=["filter.update_weights"]):
+        pf.update_weights(np.random.randn(5, 3))
+        pf.resample()
+    json_sink.close()
+
+    (line,) = open(tmp_path / "stages.jsonl").read().splitlines()
+    record = json.loads(line)
+    assert record["stage"] == "filter.update_weights"
+    assert record["measurements"] == 5
+
+    prom_sink = PrometheusSink(str(tmp_path / "uwb.prom"))
+    with Instrumentation(prom_sink):
+        pf.update_weights(np.random.randn(5, 3))
+        pf.resample()
+    text = open(tmp_path / "uwb.prom").read()
+    assert 'uwb_stage_duration_seconds_count{stage="filter.resample"} 1' in text
+    assert (
+        'uwb_stage_duration_seconds_bucket{stage="filter.resample",le="+Inf"} 1' in text
+    )
+    assert 'uwb_stage_ess{stage="filter.resample"} 20.0' in text
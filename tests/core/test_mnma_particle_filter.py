@@ -1,6 +1,6 @@
 import numpy as np
 
-from uwb.algorithm import MNMAParticleFilter
+from uwb.algorithm import DynamicModel, MNMAParticleFilter
 from uwb.generator import BlobGenerator
 from uwb.map import NoiseMapGM, NoiseMapNormal
 
@@ -49,3 +49,68 @@ def test_resample():
     mnmapf.resample()
     assert np.allclose(mnmapf.weights, np.ones(10) * 0.1)
     assert len(mnmapf.particles) == 10
+
+
+def test_step_moves_particles_with_velocities():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 1),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    particles = np.random.uniform(10, 20, (20, 3))
+    velocities = np.tile(np.arange(20.0)[:, None], (1, 3))
+    mnmapf = MNMAParticleFilter(
+        particles,
+        np.ones(20) / 20,
+        map=noise_map,
+        dynamics=DynamicModel(std=0.0),
+        init_velocities=velocities,
+    )
+
+    # without resampling particles move exactly by their velocities
+    assert not mnmapf.step(np.empty((0, 3)), resample=False)
+    assert np.allclose(mnmapf.particles, particles + velocities)
+
+    # resampled particles inherit the velocities of their ancestors
+    mnmapf.update_weights(np.full((5, 3), 10.0))
+    ancestors = np.argmax(mnmapf.weights)
+    mnmapf.weights[:] = 0.0
+    mnmapf.weights[ancestors] = 1.0
+    mnmapf.resample()
+    assert np.allclose(mnmapf.velocities, velocities[ancestors])
+
+
+def test_step_reuses_buffers():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 1),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    mnmapf = MNMAParticleFilter(
+        np.random.uniform(10, 20, (20, 3)),
+        np.ones(20) / 20,
+        map=noise_map,
+        dynamics=DynamicModel(std=0.1, rng=0),
+    )
+    buffers = {id(mnmapf.particles), id(mnmapf.velocities), id(mnmapf._scratch)}
+    weights = mnmapf.weights
+
+    for _ in range(5):
+        mnmapf.step(np.random.uniform(10, 20, (3, 3)), resample=True)
+        assert np.isclose(mnmapf.weights.sum(), 1)
+    assert mnmapf.weights is weights
+    assert {
+        id(mnmapf.particles),
+        id(mnmapf.velocities),
+        id(mnmapf._scratch),
+    } == buffers
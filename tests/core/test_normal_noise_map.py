@@ -1,7 +1,8 @@
 import numpy as np
+from scipy.stats import multivariate_normal
 
 from uwb.generator import BlobGenerator
-from uwb.map import NoiseMapNormal
+from uwb.map import NoiseMap, NoiseMapNormal
 
 
 def test_generate_normal_noise_map():
@@ -57,3 +58,346 @@ def test_samples_from():
 
     samples = noise_map.sample_from(np.array([[1.0, 1.0, 1.0], [20.0, 20.0, 20.0]]))
     assert samples.shape == (2, 3)
+
+
+def test_conditioned_log_likelihood():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    z = np.array([[11.0, 12.0, 13.0], [20.0, 20.0, 20.0], [14.0, 35.0, 40.0]])
+    particles = np.array([[12.0, 13.0, 14.0], [20.0, 20.0, 21.0], [15.0, 33.0, 41.0]])
+    log_prob = noise_map.conditioned_log_likelihood(z, particles)
+    assert log_prob.shape == (3, 3)
+
+    # the diagonal holds the pairwise probabilities
+    prob = noise_map.conditioned_probability(z, particles)
+    assert np.allclose(np.exp(np.diag(log_prob)), prob)
+
+
+def test_precomputed_factors():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    assert np.allclose(
+        noise_map.chol @ np.swapaxes(noise_map.chol, -1, -2), noise_map.covs
+    )
+    assert np.allclose(noise_map.log_det, np.linalg.slogdet(noise_map.covs)[1])
+
+    z = np.array([[12.0, 11.0, 15.0]])
+    prob = noise_map.conditioned_probability(z, np.array([[12.0, 13.0, 14.0]]))
+    expected = multivariate_normal.pdf(
+        z[0], mean=noise_map.means[0, 0, 0] + 10, cov=noise_map.covs[0, 0, 0]
+    )
+    assert np.allclose(prob, expected)
+
+
+def test_degenerated_positions():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=2,  # covariances of rank one
+        modal_range=(1, 1),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg, dtype=np.float32)
+    noise_map.gen()
+
+    assert noise_map.chol.dtype == np.float32
+    assert np.all(np.isfinite(noise_map.inv_chol))
+    log_prob = noise_map.conditioned_log_likelihood(
+        np.array([[11.0, 12.0, 13.0]]), np.array([[12.0, 13.0, 14.0]])
+    )
+    assert np.all(np.isfinite(log_prob))
+
+
+def test_only_degenerate_positions_are_regularized():
+    bg = BlobGenerator(
+        grid_dims=[3, 3, 3],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 1),
+        deviation=10.0,
+        rng=0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    for samples, idx, _ in bg:
+        assert np.allclose(noise_map.covs[tuple(idx)], np.cov(samples.T))
+
+    # three samples in 3D give rank deficient covariances
+    noise_map = NoiseMapNormal(generator=bg, min_variance=noise_map.min_variance)
+    samples, idx, _ = next(iter(bg))
+    noise_map.partial_fit(samples[:3], idx)
+    noise_map.partial_fit(samples[3:], (1, 1, 1))
+    noise_map.finalize()
+    assert np.linalg.eigvalsh(noise_map.covs[tuple(idx)]).min() >= (
+        noise_map.min_variance * 0.99
+    )
+    assert np.allclose(noise_map.covs[1, 1, 1], np.cov(samples[3:].T))
+
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    samples = noise_map.sample_from(np.tile([[21.0, 29.0, 40.0]], (20000, 1)))
+    expected_mean = noise_map.means[1, 2, 3] + np.array([20.0, 30.0, 40.0])
+    assert np.allclose(samples.mean(axis=0), expected_mean, atol=0.2)
+    assert np.allclose(np.cov(samples.T), noise_map.covs[1, 2, 3], atol=0.5)
+
+
+def test_parallel_generation():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    bg.gen()
+    serial = NoiseMapNormal(generator=bg)
+    serial.gen()
+    parallel = NoiseMapNormal(generator=bg)
+    parallel.gen(n_jobs=2, chunk_size=5)
+
+    assert np.array_equal(serial.means, parallel.means)
+    assert np.array_equal(serial.covs, parallel.covs)
+    assert np.array_equal(serial.chol, parallel.chol)
+
+
+def test_partial_fit():
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    samples = bg.gen()
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    incremental = NoiseMapNormal(generator=bg)
+    idxs = np.stack(np.meshgrid(*[np.arange(n) for n in (2, 4, 6)], indexing="ij"), -1)
+    idxs = np.repeat(idxs[..., None, :], 100, axis=-2)
+    for batch in (slice(0, 30), slice(30, 31), slice(31, 100)):  # rounds of a survey
+        incremental.partial_fit(
+            samples[..., batch, :].reshape(-1, 3), idxs[..., batch, :].reshape(-1, 3)
+        )
+
+    assert incremental._dirty.all()
+    prob = incremental.conditioned_probability(
+        np.array([[11.0, 12.0, 13.0]]), np.array([[12.0, 13.0, 14.0]])
+    )
+    assert not incremental._dirty.any()  # finalized lazily by the query
+    assert np.allclose(
+        prob,
+        noise_map.conditioned_probability(
+            np.array([[11.0, 12.0, 13.0]]), np.array([[12.0, 13.0, 14.0]])
+        ),
+    )
+    assert np.all(incremental.counts == 100)
+    assert np.allclose(incremental.means, noise_map.means)
+    assert np.allclose(incremental.covs, noise_map.covs)
+    assert np.allclose(incremental.chol, noise_map.chol)
+
+    # folding in new samples of one position only updates that position
+    noise_map.partial_fit(np.array([[11.0, 21.0, 31.0], [12.0, 19.0, 33.0]]), (0, 1, 2))
+    noise_map.finalize()
+    expected = np.concatenate(
+        [samples[0, 1, 2], [[11.0, 21.0, 31.0], [12.0, 19.0, 33.0]]]
+    )
+    assert noise_map.counts[0, 1, 2] == 102
+    assert np.allclose(noise_map.means[0, 1, 2], expected.mean(axis=0) - [10, 20, 30])
+    assert np.allclose(noise_map.covs[0, 1, 2], np.cov(expected.T))
+    assert np.allclose(noise_map.covs[1, 1, 2], incremental.covs[1, 1, 2])
+
+
+def test_save_load(tmp_path):
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg, dtype=np.float32)
+    noise_map.gen()
+    noise_map.save(str(tmp_path / "map"))
+
+    loaded = NoiseMap.load(str(tmp_path / "map"))
+    assert isinstance(loaded, NoiseMapNormal)
+    assert isinstance(loaded.chol, np.memmap)
+    assert loaded.dtype == np.float32
+    assert loaded.generator.shape == (2, 4, 6)
+    assert np.array_equal(loaded.means, noise_map.means)
+    assert np.array_equal(loaded.inv_chol, noise_map.inv_chol)
+
+    z = np.array([[11.0, 12.0, 13.0], [20.0, 20.0, 20.0]])
+    particles = np.array([[12.0, 13.0, 14.0], [20.0, 20.0, 21.0]])
+    assert np.allclose(
+        loaded.conditioned_log_likelihood(z, particles),
+        noise_map.conditioned_log_likelihood(z, particles),
+    )
+
+    in_memory = NoiseMapNormal.load(str(tmp_path / "map"), mmap=False)
+    assert not isinstance(in_memory.chol, np.memmap)
+
+
+def test_grouped_cells_match_per_particle_evaluation():
+    bg = BlobGenerator(
+        grid_dims=[4, 4, 4],
+        step_size=10,
+        measurements_per_location=60,
+        modal_range=(1, 3),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    # many particles in few cells, batched for two tags
+    particles = np.random.uniform(14, 26, (2, 300, 3))
+    z = np.random.uniform(10, 30, (2, 5, 3))
+    z_paired = np.random.uniform(10, 30, (300, 3))
+    grouped = noise_map.conditioned_log_likelihood(z, particles)
+    grouped_prob = noise_map.conditioned_probability(z_paired, particles[0])
+
+    noise_map.group_cells = False
+    assert np.allclose(grouped, noise_map.conditioned_log_likelihood(z, particles))
+    assert np.allclose(
+        grouped_prob, noise_map.conditioned_probability(z_paired, particles[0])
+    )
+
+
+def test_grouped_cells_broadcast_batch_dimensions():
+    bg = BlobGenerator(
+        grid_dims=[4, 4, 4],
+        step_size=10,
+        measurements_per_location=30,
+        modal_range=(1, 2),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+
+    # leading dimensions of z and particles broadcast against each other
+    shapes = [
+        ((3, 5, 3), (7, 3), (3, 7, 5)),
+        ((3, 5, 3), (1, 7, 3), (3, 7, 5)),
+        ((2, 1, 5, 3), (3, 7, 3), (2, 3, 7, 5)),
+        ((5, 3), (3, 7, 3), (3, 7, 5)),
+    ]
+    for z_shape, particles_shape, expected in shapes:
+        z = np.random.uniform(10, 30, z_shape)
+        particles = np.random.uniform(14, 26, particles_shape)
+        noise_map.group_cells = True
+        grouped = noise_map.conditioned_log_likelihood(z, particles)
+        noise_map.group_cells = False
+        ungrouped = noise_map.conditioned_log_likelihood(z, particles)
+        assert grouped.shape == expected
+        assert np.allclose(grouped, ungrouped)
+
+
+def test_partial_fit_read_only_and_untouched_cells(tmp_path):
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    noise_map.save(str(tmp_path / "map"))
+
+    # memory-mapped maps are copied on the first update, the stored map is unchanged
+    loaded = NoiseMap.load(str(tmp_path / "map"))
+    loaded.partial_fit(np.array([[11.0, 21.0, 31.0], [12.0, 19.0, 33.0]]), (0, 1, 2))
+    loaded.finalize()
+    assert loaded.counts[0, 1, 2] == 102
+    stored = NoiseMap.load(str(tmp_path / "map"))
+    assert stored.counts[0, 1, 2] == 100
+    assert np.array_equal(stored.means, noise_map.means)
+
+    # pending updates are finalized before saving
+    loaded.partial_fit(np.array([[13.0, 20.0, 29.0]]), (0, 1, 2))
+    loaded.save(str(tmp_path / "updated"))
+    updated = NoiseMap.load(str(tmp_path / "updated"))
+    loaded.finalize()
+    assert updated.counts[0, 1, 2] == 103
+    assert np.array_equal(updated.means, loaded.means)
+    assert np.array_equal(updated.chol, loaded.chol)
+
+    # positions without samples are standard normal around their position
+    fresh = NoiseMapNormal(generator=bg)
+    fresh.partial_fit(np.array([[11.0, 21.0, 31.0], [12.0, 19.0, 33.0]]), (0, 1, 2))
+    samples = fresh.sample_from(np.tile([[10.0, 10.0, 10.0]], (20000, 1)), rng=0)
+    assert np.allclose(samples.mean(axis=0), [10, 10, 10], atol=0.05)
+    assert np.allclose(np.cov(samples.T), np.eye(3), atol=0.05)
+    assert np.allclose(
+        fresh.conditioned_log_likelihood(
+            np.array([[10.0, 10.0, 10.0], [11.0, 10.0, 10.0]]),
+            np.array([[10.0, 10.0, 10.0]]),
+        ),
+        multivariate_normal([10, 10, 10]).logpdf([[10, 10, 10], [11, 10, 10]]),
+    )
+
+
+def test_partial_fit_keeps_raw_estimates(tmp_path):
+    bg = BlobGenerator(
+        grid_dims=[2, 4, 6],
+        step_size=10,
+        measurements_per_location=100,
+        modal_range=(1, 5),
+        deviation=1.0,
+        rng=0,
+    )
+    samples = bg.gen()
+    idxs = np.stack(np.meshgrid(*[np.arange(n) for n in (2, 4, 6)], indexing="ij"), -1)
+    idxs = np.repeat(idxs[..., None, :], 100, axis=-2)
+    extra = np.array([[11.0, 21.0, 31.0], [12.0, 19.0, 33.0]])
+
+    # updates of a built and reloaded map match a build from all samples
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    noise_map.save(str(tmp_path / "map"))
+    loaded = NoiseMap.load(str(tmp_path / "map"))
+    loaded.partial_fit(extra, (0, 1, 2))
+    expected = NoiseMapNormal(generator=bg, min_variance=noise_map.min_variance)
+    expected.partial_fit(samples.reshape(-1, 3), idxs.reshape(-1, 3))
+    expected.partial_fit(extra, (0, 1, 2))
+    expected.finalize()
+    loaded.finalize()
+    assert np.allclose(loaded.covs, expected.covs)
+    assert np.allclose(loaded.means, expected.means)
+
+    # the floor of maps built incrementally does not depend on the rounds
+    rounds, single = NoiseMapNormal(generator=bg), NoiseMapNormal(generator=bg)
+    for noise_map in (rounds, single):
+        noise_map.partial_fit(extra, (0, 0, 0))  # degenerate position
+    for batch in (slice(0, 50), slice(50, 100)):
+        rounds.partial_fit(samples[1, 1, 1, batch], (1, 1, 1))
+        rounds.finalize()
+    single.partial_fit(samples[1, 1, 1], (1, 1, 1))
+    single.finalize()
+    assert rounds.min_variance is None
+    assert np.allclose(rounds.covs, single.covs)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from uwb.algorithm import BasicParticleFilter
+from uwb.algorithm.resampling import SCHEMES, resample_indices
+
+
+@pytest.mark.parametrize("scheme", list(SCHEMES))
+def test_resample_indices(scheme):
+    weights = np.array([0.0, 0.5, 0.0, 0.25, 0.25])
+    idx = resample_indices(weights, scheme)
+
+    assert idx.shape == (5,)
+    assert np.all(weights[idx] > 0)  # particles without weight are never selected
+
+
+@pytest.mark.parametrize("scheme", list(SCHEMES))
+def test_resample_indices_batched(scheme):
+    weights = np.random.uniform(size=(4, 1000))
+    weights[:, ::2] = 0.0
+    weights /= weights.sum(axis=1, keepdims=True)
+    idx = resample_indices(weights, scheme)
+
+    assert idx.shape == (4, 1000)
+    assert np.all((idx >= 0) & (idx < 1000))
+    assert np.all(idx % 2 == 1)
+
+
+@pytest.mark.parametrize("scheme", ["stratified", "systematic", "residual"])
+def test_low_variance_schemes_keep_counts(scheme):
+    weights = np.array([0.5, 0.25, 0.125, 0.125])
+    counts = np.bincount(resample_indices(weights, scheme), minlength=4)
+    assert tuple(counts) == (2, 1, 0, 1) or tuple(counts) == (2, 1, 1, 0)
+
+
+def test_unknown_scheme():
+    with pytest.raises(ValueError):
+        resample_indices(np.ones(3) / 3, "unknown")
+
+
+@pytest.mark.parametrize("scheme", list(SCHEMES))
+def test_basic_particle_filter_schemes(scheme):
+    bpf = BasicParticleFilter(
+        np.random.randn(100, 3), np.ones(100) * 0.01, resample_scheme=scheme
+    )
+    bpf.update_weights(np.array([[1.0, 1.0, 1.0], [2.0, 2.0, 2.0]]))
+    bpf.resample()
+
+    assert bpf.particles.shape == (100, 3)
+    assert np.allclose(bpf.weights, np.ones(100) * 0.01)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from uwb.algorithm import (
+    BasicParticleFilter,
+    DynamicModel,
+    MNMAParticleFilter,
+    MNMAParticleFilterBank,
+)
+from uwb.algorithm.resampling import SCHEMES, resample_indices
+from uwb.generator import BlobGenerator
+from uwb.map import NoiseMapGM
+from uwb.util.rng import make_rng, spawn_rngs, tag_rng
+
+
+def _noise_map():
+    bg = BlobGenerator(
+        grid_dims=[3, 3, 3],
+        step_size=10,
+        measurements_per_location=30,
+        modal_range=(1, 2),
+        deviation=1.0,
+        rng=0,
+    )
+    noise_map = NoiseMapGM(generator=bg)
+    noise_map.gen()
+    return noise_map
+
+
+def test_make_rng():
+    assert isinstance(make_rng(0).bit_generator, np.random.PCG64)
+    assert isinstance(make_rng(0, "philox").bit_generator, np.random.Philox)
+    rng = np.random.default_rng(0)
+    assert make_rng(rng) is rng
+    with pytest.raises(ValueError):
+        make_rng(0, "mt19937")
+
+
+def test_spawned_and_tag_streams():
+    first, second = spawn_rngs(0, 2)
+    assert first.random() != second.random()
+    assert [r.random() for r in spawn_rngs(0, 2)] == [
+        r.random() for r in spawn_rngs(0, 2)
+    ]
+
+    assert tag_rng(0, "tag-1").random() == tag_rng(0, "tag-1").random()
+    assert tag_rng(0, "tag-1").random() != tag_rng(0, "tag-2").random()
+    assert tag_rng(0, "tag-1").random() != tag_rng(1, "tag-1").random()
+
+
+@pytest.mark.parametrize("scheme", list(SCHEMES))
+def test_resampling_is_reproducible(scheme):
+    weights = np.random.dirichlet(np.ones(50), size=3)
+    assert np.array_equal(
+        resample_indices(weights, scheme, rng=1),
+        resample_indices(weights, scheme, rng=1),
+    )
+
+
+def _run(create, z, rng):
+    pf = create(rng)
+    for _ in range(3):
+        pf.step(z, resample=True)
+    return pf.particles
+
+
+def test_filters_are_reproducible():
+    noise_map = _noise_map()
+    init = np.random.uniform(10, 30, (2, 40, 3))
+    weights = np.ones((2, 40)) / 40
+    creators = [
+        lambda rng: BasicParticleFilter(
+            init[0], weights[0], dynamics=DynamicModel(std=0.1, rng=rng), rng=rng
+        ),
+        lambda rng: MNMAParticleFilter(
+            init[0], weights[0], map=noise_map, resample_scheme="systematic", rng=rng
+        ),
+        lambda rng: MNMAParticleFilterBank(init, weights, map=noise_map, rng=rng),
+    ]
+    z = np.random.uniform(10, 30, (4, 3))
+    for create in creators:
+        batch = z if create is not creators[2] else [z, z[:2]]
+        first = _run(create, batch, tag_rng(0, "tag"))
+        assert np.array_equal(first, _run(create, batch, tag_rng(0, "tag")))
+        assert not np.array_equal(first, _run(create, batch, tag_rng(1, "tag")))
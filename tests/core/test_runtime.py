@@ -0,0 +1,118 @@
+import asyncio
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from uwb.algorithm import ParticleFilter
+from uwb.runtime import (
+    ReplaySource,
+    TagQueue,
+    TrackingPipeline,
+    UDPSource,
+    decode_packet,
+    encode_packet,
+)
+
+
+class RecordingFilter(ParticleFilter):
+    """Filter recording its measurement batches, optionally slowed down."""
+
+    def __init__(self, delay=0.0):
+        super().__init__(np.zeros((4, 3)), np.ones(4) / 4)
+        self.delay = delay
+        self.batches = []
+
+    def step(self, z, resample=None):
+        time.sleep(self.delay)
+        self.batches.append(np.asarray(z))
+
+
+def test_packet_round_trip():
+    measurements = np.random.randn(5, 3).astype(np.float32)
+    tag, timestamp, decoded = decode_packet(encode_packet(7, measurements, 1.5))
+    assert (tag, timestamp) == (7, 1.5)
+    assert np.array_equal(decoded, measurements)
+
+    with pytest.raises(ValueError):
+        decode_packet(encode_packet(7, measurements)[:-4])
+
+
+def test_tag_queue_stale_batches():
+    queue = TagQueue(max_pending=3)
+    dropped = sum(queue.put(np.full((1, 3), i), received=i) for i in range(4))
+    assert dropped == 1  # oldest batch made room
+    assert len(queue) == 3
+
+    # batches received at 1 and 2 are stale at time 3.5 with a budget of 1
+    z, received, n_stale = queue.take(3.5, 1.0, policy="merge")
+    assert np.array_equal(z[:, 0], [1, 2, 3])
+    assert (received, n_stale) == (1, 2)
+    assert queue.take(3.5, 1.0) is None
+
+    for i in range(3):
+        queue.put(np.full((1, 3), i), received=i)
+    z, received, n_stale = queue.take(2.5, 1.0, policy="drop")
+    assert np.array_equal(z[:, 0], [2])
+    assert n_stale == 2
+
+
+def test_replay_pipeline_processes_all_tags():
+    streams = {tag: [np.full((2, 3), i) for i in range(10)] for tag in range(3)}
+    pipeline = TrackingPipeline(
+        ReplaySource(streams),
+        lambda tag: RecordingFilter(),
+        latency_budget=None,
+        max_pending=10,  # the replay may outpace the filters, nothing is dropped
+    )
+    metrics = asyncio.run(pipeline.run())
+
+    assert metrics.received == metrics.processed == 30
+    for tag in range(3):
+        assert [b[0, 0] for b in pipeline.filters[tag].batches] == list(range(10))
+    assert metrics.latency_percentiles()[50] >= 0.0
+    assert metrics.snapshot()["queue_depth"] == {"0": 0, "1": 0, "2": 0}
+
+
+def test_slow_filter_merges_stale_batches():
+    streams = {0: [np.full((1, 3), i) for i in range(20)]}
+    pipeline = TrackingPipeline(
+        ReplaySource(streams, interval=0.002),
+        lambda tag: RecordingFilter(delay=0.02),
+        latency_budget=0.01,
+        max_pending=100,
+        policy="merge",
+    )
+    metrics = asyncio.run(pipeline.run())
+
+    # the filter falls behind and catches up with merged batches, nothing is lost
+    batches = pipeline.filters[0].batches
+    assert metrics.merged > 0
+    assert len(batches) < 20
+    assert np.array_equal(np.concatenate(batches)[:, 0], np.arange(20))
+
+
+def test_udp_source():
+    async def run():
+        source = UDPSource()
+        await source.start()
+        pipeline = TrackingPipeline(source, lambda tag: RecordingFilter())
+        task = asyncio.ensure_future(pipeline.run())
+
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for tag in (1, 2):
+            sender.sendto(encode_packet(tag, np.ones((3, 3))), source.address)
+        sender.sendto(b"garbage", source.address)
+        sender.close()
+
+        while pipeline.metrics.processed < 2:
+            await asyncio.sleep(0.01)
+        pipeline.stop()
+        await task
+        return source, pipeline
+
+    source, pipeline = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert set(pipeline.filters) == {1, 2}
+    assert source.malformed == 1
+    assert pipeline.filters[1].batches[0].shape == (3, 3)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from uwb.algorithm import MNMAParticleFilter
+from uwb.generator import BlobGenerator
+from uwb.map import NoiseMapNormal
+from uwb.runtime import SharedNoiseMap, TrackingServer, attach_shared_map, shard_of
+from uwb.util.rng import tag_rng
+
+
+def _noise_map():
+    bg = BlobGenerator(
+        grid_dims=[4, 4, 4],
+        step_size=10,
+        measurements_per_location=50,
+        modal_range=(1, 1),
+        deviation=1.0,
+        rng=0,
+    )
+    noise_map = NoiseMapNormal(generator=bg)
+    noise_map.gen()
+    return noise_map
+
+
+def _create_filter(tag, noise_map):
+    rng = tag_rng(0, tag)
+    return MNMAParticleFilter(
+        rng.uniform(10, 40, (100, 3)), np.ones(100) / 100, map=noise_map, rng=rng
+    )
+
+
+def test_shard_of_is_stable():
+    shards = [shard_of(tag, 4) for tag in range(100)]
+    assert shards == [shard_of(tag, 4) for tag in range(100)]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_attach_shared_map():
+    noise_map = _noise_map()
+    with SharedNoiseMap(noise_map) as shared:
+        attached = attach_shared_map(shared.descriptor)
+        assert isinstance(attached, NoiseMapNormal)
+        assert not attached.means.flags.writeable
+        assert np.array_equal(attached.inv_chol, noise_map.inv_chol)
+
+        z = np.random.uniform(10, 40, (3, 3))
+        particles = np.random.uniform(10, 40, (20, 3))
+        assert np.allclose(
+            attached.conditioned_log_likelihood(z, particles),
+            noise_map.conditioned_log_likelihood(z, particles),
+        )
+        del attached
+
+
+def test_tracking_server():
+    server = TrackingServer(_noise_map(), _create_filter, n_workers=2)
+    assert server.stop() == []  # not running
+    server.start()
+    descriptor = server._shared.descriptor
+    for _ in range(5):
+        for tag in range(6):
+            server.submit(tag, np.full((4, 3), 10.0 + 5 * tag))
+    results = server.results(timeout=10)
+    results += server.stop()
+
+    # every batch was processed exactly once
+    assert sorted(tag for tag, _, _ in results) == sorted(list(range(6)) * 5)
+    for tag, estimate, ess in results:
+        assert estimate.shape == (3,)
+        assert np.all(np.isfinite(estimate))
+        assert 1 <= ess <= 100
+
+    assert server.stop() == []  # stopping twice is a no-op
+
+    # shared memory is released
+    name, _, _ = next(iter(descriptor["arrays"].values()))
+    with pytest.raises(FileNotFoundError):
+        attach_shared_map({"meta": None, "arrays": {"means": (name, (1,), "<f8")}})
+
+
+def test_tracking_server_is_reproducible():
+    noise_map = _noise_map()
+    estimates = []
+    for n_workers in (1, 2):
+        server = TrackingServer(noise_map, _create_filter, n_workers=n_workers)
+        server.start()
+        for _ in range(3):
+            for tag in range(4):
+                server.submit(tag, np.full((4, 3), 10.0 + 5 * tag))
+        results = server.results(timeout=10) + server.stop()
+
+        per_tag = {}
+        for tag, estimate, _ in results:
+            per_tag.setdefault(tag, []).append(estimate)
+        estimates.append(per_tag)
+    for tag in range(4):
+        assert np.array_equal(estimates[0][tag], estimates[1][tag])
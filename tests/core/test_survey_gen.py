@@ -0,0 +1,78 @@
+import numpy as np
+
+from uwb.algorithm import MNMAParticleFilter
+from uwb.generator import SurveyGenerator
+from uwb.map import NoiseMap, NoiseMapGM, NoiseMapNormal
+
+
+def _corridor_survey(n_points=40, n_samples=30):
+    rng = np.random.default_rng(0)
+    points = np.stack(
+        [np.linspace(0, 100, n_points), rng.uniform(0, 2, n_points), np.ones(n_points)],
+        axis=-1,
+    )
+    measurements = [p + rng.standard_normal((n_samples, 3)) for p in points]
+    return SurveyGenerator(points, measurements)
+
+
+def test_closest_survey_points():
+    sg = _corridor_survey()
+    coordinates = np.random.uniform(-10, 110, (500, 3))
+
+    # reference: brute force nearest survey point
+    expected = np.argmin(
+        np.linalg.norm(coordinates[:, None] - sg.points[None], axis=-1), axis=1
+    )
+    out = np.empty(500, dtype=np.intp)
+    cells, idxs = sg.get_closest_cell(coordinates, out=out)
+    assert cells is out
+    assert np.array_equal(cells, expected)
+    assert np.array_equal(idxs[:, 0], expected)
+
+    _, pos = sg.get_closest_position(coordinates)
+    assert np.array_equal(pos, sg.points[expected])
+    assert sg.shape == (40,)
+    assert sg.dim == 3
+
+
+def test_noise_maps_on_survey_points(tmp_path):
+    sg = _corridor_survey()
+    for noise_map in (NoiseMapNormal(sg), NoiseMapGM(sg)):
+        noise_map.gen()
+        assert noise_map.means.shape[0] == 40  # parameters of measured points only
+
+        mnmapf = MNMAParticleFilter(
+            sg.points[::2] + 0.5, np.ones(20) / 20, map=noise_map
+        )
+        mnmapf.update_weights(sg.points[10] + np.random.standard_normal((5, 3)))
+        assert np.argmax(mnmapf.weights) == 5
+        mnmapf.resample()
+        assert mnmapf.particles.shape == (20, 3)
+
+        noise_map.save(tmp_path / type(noise_map).__name__)
+        loaded = NoiseMap.load(tmp_path / type(noise_map).__name__)
+        assert isinstance(loaded.generator, SurveyGenerator)
+        z = np.random.uniform(0, 100, (4, 3))
+        assert np.allclose(
+            loaded.conditioned_log_likelihood(z, sg.points),
+            noise_map.conditioned_log_likelihood(z, sg.points),
+        )
+
+
+def test_noise_map_with_unequal_sample_counts():
+    sg = _corridor_survey()
+    sg.measurements = [m[: 10 + i % 7] for i, m in enumerate(sg.measurements)]
+    noise_map = NoiseMapNormal(sg)
+    noise_map.gen(chunk_size=8)
+
+    assert np.array_equal(noise_map.counts, [10 + i % 7 for i in range(40)])
+    assert np.allclose(
+        noise_map.means + sg.points, [m.mean(axis=0) for m in sg.measurements]
+    )
+
+    parallel = NoiseMapGM(sg)
+    parallel.gen(n_jobs=2, chunk_size=8)
+    serial = NoiseMapGM(sg)
+    serial.gen(chunk_size=8)
+    assert np.array_equal(parallel.weights, serial.weights)
+    assert np.array_equal(parallel.chol, serial.chol)
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from uwb.generator import BlobGenerator
+from uwb.map import (
+    NoiseMap,
+    NoiseMapGM,
+    NoiseMapNormal,
+    TiledNoiseMapGM,
+    TiledNoiseMapNormal,
+    load_tiled,
+    save_tiled,
+)
+
+
+def _blob_generator():
+    return BlobGenerator(
+        grid_dims=[5, 6, 7],
+        step_size=10,
+        measurements_per_location=40,
+        modal_range=(1, 3),
+        deviation=1.0,
+        rng=0,
+    )
+
+
+@pytest.mark.parametrize(
+    "map_cls, tiled_cls",
+    [(NoiseMapNormal, TiledNoiseMapNormal), (NoiseMapGM, TiledNoiseMapGM)],
+)
+def test_tiled_map_matches_dense_map(tmp_path, map_cls, tiled_cls):
+    noise_map = map_cls(_blob_generator())
+    noise_map.gen()
+    save_tiled(noise_map, str(tmp_path), (2, 4, 3))  # border tiles are padded
+
+    tiled = load_tiled(str(tmp_path), max_tiles=4)
+    assert isinstance(tiled, tiled_cls)
+    assert tiled.means.shape == noise_map.means.shape
+
+    # particles spread over all tiles
+    particles = np.random.uniform(0, 80, (200, 3))
+    z = np.random.uniform(0, 80, (6, 3))
+    assert np.allclose(
+        tiled.conditioned_log_likelihood(z, particles),
+        noise_map.conditioned_log_likelihood(z, particles),
+    )
+    assert np.allclose(
+        tiled.conditioned_probability(particles + 1.0, particles),
+        noise_map.conditioned_probability(particles + 1.0, particles),
+    )
+    assert tiled.sample_from(particles).shape == (200, 3)
+    assert len(tiled.store) <= 4
+
+
+def test_tile_cache_counters(tmp_path):
+    noise_map = NoiseMapNormal(_blob_generator())
+    noise_map.gen()
+    noise_map.save(str(tmp_path / "dense"))
+
+    # tiles are built from the memory-mapped map
+    save_tiled(
+        NoiseMap.load(str(tmp_path / "dense")), str(tmp_path / "tiles"), (3, 3, 3)
+    )
+    tiled = load_tiled(str(tmp_path / "tiles"), max_tiles=2)
+
+    # particles inside a single tile load it once and hit afterwards
+    particles = np.random.uniform(10, 30, (50, 3))
+    for _ in range(3):
+        tiled.sample_from(particles)
+    assert tiled.store.misses == 1
+    assert tiled.store.hits > 0
+    assert np.array_equal(tiled.means[1, 2, 0], noise_map.means[1, 2, 0])
+
+    for method in (tiled.gen, lambda: tiled.save(str(tmp_path / "copy"))):
+        with pytest.raises(TypeError):
+            method()
+
+
+def test_tile_store_is_thread_safe(tmp_path):
+    noise_map = NoiseMapNormal(_blob_generator())
+    noise_map.gen()
+    save_tiled(noise_map, str(tmp_path), (1, 2, 2))
+    tiled = load_tiled(str(tmp_path), max_tiles=2)  # constant eviction
+
+    particles = np.random.uniform(0, 80, (300, 3))
+    expected = noise_map._gather(noise_map.means, noise_map._lookup(particles)[0])
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(
+            pool.map(
+                lambda _: tiled._gather(tiled.means, tiled._lookup(particles)[0]),
+                range(32),
+            )
+        )
+    assert all(np.array_equal(r, expected) for r in results)
+    assert len(tiled.store) <= 2
+
+
+@pytest.mark.parametrize("map_cls", [NoiseMapNormal, NoiseMapGM])
+def test_tiles_are_loaded_once_per_batch(tmp_path, map_cls):
+    noise_map = map_cls(_blob_generator())
+    noise_map.gen()
+    save_tiled(noise_map, str(tmp_path), (3, 3, 4))  # 8 tiles
+    tiled = load_tiled(str(tmp_path), max_tiles=2)
+
+    # all parameters of a tile are gathered while it is loaded
+    particles = np.random.uniform(0, 70, (300, 3))
+    z = np.random.uniform(0, 70, (4, 3))
+    assert np.allclose(
+        tiled.conditioned_log_likelihood(z, particles),
+        noise_map.conditioned_log_likelihood(z, particles),
+    )
+    assert (tiled.store.misses, tiled.store.hits) == (8, 0)
+
+    empty = np.empty((0, 3))
+    assert noise_map.conditioned_log_likelihood(z, empty).shape == (0, 4)
+    assert tiled.conditioned_log_likelihood(z, empty).shape == (0, 4)
+    assert tiled.sample_from(empty).shape == (0, 3)
+    with pytest.raises(TypeError):
+        tiled.covs
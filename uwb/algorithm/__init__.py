@@ -1,5 +1,6 @@
 from uwb.algorithm.basic_particle_filter import BasicParticleFilter
 from uwb.algorithm.dynamic_model import DynamicModel
+from uwb.algorithm.filter_bank import MNMAParticleFilterBank
 from uwb.algorithm.mnma_particle_filter import MNMAParticleFilter
 from uwb.algorithm.particle_filter import ParticleFilter
 
@@ -8,4 +9,5 @@ __all__ = [
     "DynamicModel",
     "ParticleFilter",
     "MNMAParticleFilter",
+    "MNMAParticleFilterBank",
 ]
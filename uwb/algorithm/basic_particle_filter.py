@@ -1,7 +1,8 @@
 import numpy as np
-from scipy.stats import multivariate_normal
+from scipy.linalg import solve_triangular
 
 from uwb.algorithm.particle_filter import ParticleFilter
+from uwb.util.gaussian import log_normalizer, robust_cholesky
 
 
 class BasicParticleFilter(ParticleFilter):
@@ -14,48 +15,78 @@ class BasicParticleFilter(ParticleFilter):
         init_particles: Numpy array of initial particle distribution with format (N, d) where N, d
           is the number of particles and d the dimension respectively.
         init_weights: Numpy array of normalized weights with format (N,).
+        resample_scheme: Optional; resampling scheme (see :class:`uwb.algorithm.ParticleFilter`).
+        ess_threshold: Optional; adaptive resampling threshold (see
+          :class:`uwb.algorithm.ParticleFilter`).
+        dynamics: Optional; dynamic model used by :meth:`step`.
+        init_velocities: Optional; initial particle velocities with format (N, d).
+        rng: Optional; numpy Generator or seed used for resampling.
     """
 
-    def __init__(self, init_particles, init_weights):
+    def __init__(
+        self,
+        init_particles,
+        init_weights,
+        resample_scheme="multinomial",
+        ess_threshold=None,
+        dynamics=None,
+        init_velocities=None,
+        rng=None,
+    ):
         """Initialized and computes data covariance."""
-        super().__init__(init_particles, init_weights)
-        self.data_cov = np.cov(init_particles.T)
+        super().__init__(
+            init_particles,
+            init_weights,
+            resample_scheme=resample_scheme,
+            ess_threshold=ess_threshold,
+            dynamics=dynamics,
+            init_velocities=init_velocities,
+            rng=rng,
+        )
+        self._jitter = np.empty_like(self.particles)
+        self._update_data_cov()
 
     def update_weights(self, z):
         """Update weights particles as means and covariance of data distribution
 
+        The data covariance is factorized once per resampling and shared by all particles, so the
+        summed log density of the batch reduces to whitened sufficient statistics of the
+        measurements. Weights are accumulated and normalized in log space.
+
         Args:
             z: measurements collected by sensor for weight updates
                 expected shape (N, d) where N is the batch size
         """
-        # unfortunately normal implementation doesn't seem to support batch dim
-        # needs to be reimplemented for performance reasons
-        for item in z:
-            for i, p in enumerate(self.particles):
-                self.weights[i] *= multivariate_normal.pdf(
-                    item, mean=p, cov=self.data_cov
-                )
-            self.weights = self.weights / np.sum(self.weights)
+        z = np.asarray(z, dtype=float)
+        if len(z) == 0:
+            return
+
+        chol = self._data_chol
+        z_white = solve_triangular(chol, z.T, lower=True).T
+        p_white = solve_triangular(chol, self.particles.T, lower=True).T
 
-        # normalize weights
+        # sum_j |z_j - p|^2 = sum_j |z_j - z_mean|^2 + N * |z_mean - p|^2
+        z_mean = z_white.mean(axis=0)
+        mahalanobis = np.sum((z_white - z_mean) ** 2) + len(z) * np.sum(
+            (p_white - z_mean) ** 2, axis=1
+        )
+        self._reweight(len(z) * log_normalizer(chol) - 0.5 * mahalanobis)
 
     def resample(self):
-        """Resampling according to weights of particles"""
-        M = len(self.particles)
-        acc_weights = np.cumsum(self.weights)
-        acc_weights[-1] = 1  # in case of rounding errors
-
-        uniform_samples = np.random.uniform(0.0, 1.0, M)  # samples uniform from [0,1)
-        positions = np.searchsorted(
-            acc_weights, uniform_samples
-        )  # find matching positions
-
-        # again same problem as in update_weigth
-        for i, p in enumerate(positions):
-            self.particles[i] = multivariate_normal.rvs(
-                mean=self.particles[p], cov=self.data_cov
-            )
-
-        # update covariance
+        """Resampling according to weights of particles
+
+        Ancestors are selected with the configured scheme and jittered with one draw from the
+        data distribution using the cached Cholesky factor of the data covariance.
+        """
+        self._select_ancestors(self._resample_indices())
+        self.rng.standard_normal(out=self._jitter)
+        # matmul into a separate buffer, writing into its input allocates a temporary
+        self.particles += np.matmul(self._jitter, self._data_chol.T, out=self._scratch)
+
+        self._update_data_cov()
+        self._reset_weights()
+
+    def _update_data_cov(self):
+        """Estimates the data covariance from the particles and caches its Cholesky factor."""
         self.data_cov = np.cov(self.particles.T)
-        self.weights = np.ones_like(self.weights) * (1 / M)
+        self._data_chol = robust_cholesky(self.data_cov)
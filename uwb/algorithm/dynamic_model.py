@@ -9,23 +9,38 @@ class DynamicModel:
 
     Attributes:
       std: Standard deviation used in dynamic model for updating velocities.
+      rng: Optional; seed or numpy Generator drawing the velocity noise.
     """
 
-    def __init__(self, std=1):
+    def __init__(self, std=1, rng=None):
         """Initializes standard deviation."""
         self.std = std
+        self.rng = np.random.default_rng(rng)
 
     def step(self, pos, vel):
         """Performs one time step for the positions according to dynamics."""
-        return DynamicModel.transition_function(pos, vel, std=self.std)
+        return DynamicModel.transition_function(pos, vel, std=self.std, rng=self.rng)
+
+    def step_inplace(self, pos, vel, noise=None):
+        """Performs one time step overwriting positions and velocities.
+
+        Args:
+            pos: Numpy float64 array of positions, updated in place.
+            vel: Numpy float64 array of velocities with the format of pos, updated in place.
+            noise: Optional; preallocated float64 buffer with the format of vel receiving the
+              velocity noise, avoids allocations in tight loops.
+        """
+        if noise is None:
+            noise = np.empty_like(vel)
+        pos += vel
+        self.rng.standard_normal(out=noise)
+        noise *= self.std
+        vel += noise
 
     @staticmethod
-    def transition_function(current_pos, current_vel, std=1):
+    def transition_function(current_pos, current_vel, std=1, rng=None):
         """Performs one time step for the position according to dynamics."""
-        next_state = np.copy(current_pos)
-        next_state += current_vel
-        next_vel = np.copy(current_vel)
-        next_vel += (np.random.randn(np.prod(current_vel.shape)) * std).reshape(
-            current_vel.shape
-        )
+        noise = np.random.default_rng(rng).standard_normal(np.shape(current_vel))
+        next_state = current_pos + current_vel
+        next_vel = current_vel + noise * std
         return next_state, next_vel
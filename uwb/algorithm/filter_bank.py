@@ -0,0 +1,125 @@
+import numpy as np
+
+from uwb.algorithm.particle_filter import ParticleFilter
+from uwb.algorithm.resampling import resample_indices
+from uwb.map import NoiseMap
+
+
+class MNMAParticleFilterBank(ParticleFilter):
+    """Runs K independent Measurement Noise Map Augmented Particle Filters as one tensor.
+
+    Every filter tracks one tag. All tags share the same noise map, particles are held with
+    format (K, N, d) and weights with format (K, N), such that weight updates and resampling
+    run in one vectorized pass for all tags. See :class:`uwb.algorithm.MNMAParticleFilter` for
+    the single tag filter.
+
+    Attributes:
+        init_particles: initial positions for particles with format (K, N, d)
+        init_weights: initial weights for particles with format (K, N)
+        map: Noise Map for location which was previously empirically estimated.
+        resample_scheme: Optional; resampling scheme (see :class:`uwb.algorithm.ParticleFilter`).
+        ess_threshold: Optional; adaptive resampling threshold (see
+          :class:`uwb.algorithm.ParticleFilter`).
+        dynamics: Optional; dynamic model used by :meth:`step`, moves all tags at once.
+        init_velocities: Optional; initial particle velocities with format (K, N, d).
+        rng: Optional; numpy Generator or seed used for resampling.
+    """
+
+    def __init__(
+        self,
+        init_particles,
+        init_weights,
+        map: NoiseMap,
+        resample_scheme="multinomial",
+        ess_threshold=None,
+        dynamics=None,
+        init_velocities=None,
+        rng=None,
+    ):
+        """Initializes particles, weights and noise map."""
+        super().__init__(
+            init_particles,
+            init_weights,
+            resample_scheme=resample_scheme,
+            ess_threshold=ess_threshold,
+            dynamics=dynamics,
+            init_velocities=init_velocities,
+            rng=rng,
+        )
+        self.map = map
+
+    def update_weights(self, z):
+        """Updates weights of all tags according to map noise estimations.
+
+        Measurement batches of different sizes are padded to a common size, padded entries do
+        not contribute to the weights.
+
+        Args:
+            z: sequence of K measurement batches with format (Z_k, d) or array with format
+              (K, Z, d). Tags without new measurements pass None or an empty batch.
+        """
+        z, mask = _pad_measurements(
+            z, self.particles.shape[0], self.particles.shape[-1]
+        )
+        if not mask.any():
+            return
+
+        log_likelihood = self.map.conditioned_log_likelihood(z, self.particles)
+        self._reweight(np.where(mask[:, None, :], log_likelihood, 0.0).sum(axis=-1))
+
+    def resample(self, tags=None):
+        """Resamples particles of all or the selected tags.
+
+        Args:
+            tags: Optional; indices of the tags to resample.
+        """
+        tags = np.arange(len(self.particles)) if tags is None else np.asarray(tags)
+        if len(tags) == 0:
+            return
+
+        ancestors = resample_indices(
+            self.weights[tags], self.resample_scheme, rng=self.rng
+        )
+        self.velocities[tags] = self.velocities[tags[:, None], ancestors]
+        selected = self.particles[tags[:, None], ancestors]
+        self.particles[tags] = self.map.sample_from(
+            selected.reshape(-1, selected.shape[-1]), rng=self.rng
+        ).reshape(selected.shape)
+        self._reset_weights(tags)
+
+    def maybe_resample(self):
+        """Resamples the tags whose effective sample size fell below the threshold.
+
+        Without :attr:`ess_threshold` all tags are resampled.
+
+        Returns:
+            True if any tag was resampled.
+        """
+        if self.ess_threshold is None:
+            self.resample()
+            return True
+
+        tags = np.flatnonzero(self.ess < self.ess_threshold * self.weights.shape[-1])
+        self.resample(tags)
+        return len(tags) > 0
+
+
+def _pad_measurements(z, K, d):
+    """Stacks ragged measurement batches to format (K, Z, d) with a validity mask (K, Z)."""
+    if isinstance(z, np.ndarray) and z.ndim == 3:
+        return z, np.ones(z.shape[:2], dtype=bool)
+
+    batches = [
+        np.empty((0, d)) if b is None else np.asarray(b).reshape(-1, d) for b in z
+    ]
+    if len(batches) != K:
+        raise ValueError(
+            "Expected measurements for %d tags, got %d" % (K, len(batches))
+        )
+
+    lengths = np.array([len(b) for b in batches])
+    mask = np.arange(lengths.max(initial=0)) < lengths[:, None]
+    padded = np.zeros(mask.shape + (d,))
+    if mask.any():
+        padded[mask] = np.concatenate(batches)  # row major order matches the batches
+    return padded, mask
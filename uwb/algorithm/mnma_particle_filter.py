@@ -1,5 +1,3 @@
-import numpy as np
-
 from uwb.algorithm.particle_filter import ParticleFilter
 from uwb.map import NoiseMap
 
@@ -15,34 +13,51 @@ class MNMAParticleFilter(ParticleFilter):
         init_particles: initial positions for particles
         init_weights: initial weights for particles
         map: Noise Map for location which was previously empirically estimated.
+        resample_scheme: Optional; resampling scheme (see :class:`uwb.algorithm.ParticleFilter`).
+        ess_threshold: Optional; adaptive resampling threshold (see
+          :class:`uwb.algorithm.ParticleFilter`).
+        dynamics: Optional; dynamic model used by :meth:`step`.
+        init_velocities: Optional; initial particle velocities with the format of the particles.
+        rng: Optional; numpy Generator or seed used for resampling.
     """
 
-    def __init__(self, init_particles, init_weights, map: NoiseMap):
+    def __init__(
+        self,
+        init_particles,
+        init_weights,
+        map: NoiseMap,
+        resample_scheme="multinomial",
+        ess_threshold=None,
+        dynamics=None,
+        init_velocities=None,
+        rng=None,
+    ):
         """Initializes particles, weights and noise map."""
-        super().__init__(init_particles, init_weights)
+        super().__init__(
+            init_particles,
+            init_weights,
+            resample_scheme=resample_scheme,
+            ess_threshold=ess_threshold,
+            dynamics=dynamics,
+            init_velocities=init_velocities,
+            rng=rng,
+        )
         self.map = map
 
     def update_weights(self, z):
-        """Updates weights according to map noise estimations"""
-        for i in range(len(self.particles)):
-            self.weights[i] *= np.prod(
-                self.map.conditioned_probability(
-                    z, np.tile(self.particles[i], (len(z), 1))
-                )
-            )  # iid assumption
+        """Updates weights according to map noise estimations
 
-        # normalize weights ... numerical instabilities may happen here
-        self.weights = self.weights / np.sum(self.weights)
+        Log likelihoods of all particle and measurement pairs are computed by the map in one
+        call and summed over the measurements (iid assumption).
+        """
+        if len(z) == 0:
+            return
+        self._reweight(
+            self.map.conditioned_log_likelihood(z, self.particles).sum(axis=1)
+        )
 
     def resample(self):
-        """Resamples particles."""
-        M = len(self.particles)
-        acc_weights = np.cumsum(self.weights)
-        acc_weights[-1] = 1  # in case of rounding errors
-
-        uniform_samples = np.random.uniform(0.0, 1.0, M)  # samples uniform from [0,1)
-        positions = np.searchsorted(
-            acc_weights, uniform_samples
-        )  # find matching positions
-        self.particles = self.map.sample_from(self.particles[positions])
-        self.weights = np.ones_like(self.weights) * (1 / M)
+        """Resamples particles, the velocities are inherited from the ancestors."""
+        self._select_ancestors(self._resample_indices())
+        self.particles[...] = self.map.sample_from(self.particles, rng=self.rng)
+        self._reset_weights()
@@ -1,15 +1,103 @@
+from collections import deque
+
+import numpy as np
+from scipy.special import logsumexp
+
+from uwb.algorithm.resampling import SCHEMES, resample_indices
+from uwb.util.metrics import ess
+
+
 class ParticleFilter:
     """Base class for particle filters.
 
     Attributes:
         init_particles: initial particle positions
         init_weights: initial particle weights
+        resample_scheme: Optional; name of the resampling scheme, one of
+          :data:`uwb.algorithm.resampling.SCHEMES`.
+        ess_threshold: Optional; fraction of the number of particles. If set,
+          :meth:`maybe_resample` only resamples once the effective sample size falls below it.
+        ess_trace_length: Optional; number of most recent effective sample sizes kept in
+          :attr:`ess_trace` for monitoring.
+        dynamics: Optional; :class:`uwb.algorithm.DynamicModel` predicting the particles in
+          :meth:`step`.
+        init_velocities: Optional; initial particle velocities with the format of the
+          particles, zero by default.
+        rng: Optional; numpy Generator or seed drawing the random numbers of resampling, see
+          :mod:`uwb.util.rng` for independent streams of parallel filters.
+
+    Particles, velocities and weights are held in buffers owned by the filter which are
+    updated in place by :meth:`step`, so long running tracking keeps a flat memory use.
     """
 
-    def __init__(self, init_particles, init_weights):
+    def __init__(
+        self,
+        init_particles,
+        init_weights,
+        resample_scheme="multinomial",
+        ess_threshold=None,
+        ess_trace_length=1000,
+        dynamics=None,
+        init_velocities=None,
+        rng=None,
+    ):
         """Initializes particles and weights"""
-        self.particles = init_particles
-        self.weights = init_weights
+        if resample_scheme not in SCHEMES:
+            raise ValueError("Unknown resampling scheme '%s'" % resample_scheme)
+        self.particles = np.array(init_particles, dtype=float)
+        self.weights = np.array(init_weights, dtype=float)
+        self.resample_scheme = resample_scheme
+        self.ess_threshold = ess_threshold
+        self.dynamics = dynamics
+        self.rng = np.random.default_rng(rng)
+
+        if init_velocities is None:
+            self.velocities = np.zeros_like(self.particles)
+        else:
+            self.velocities = np.array(init_velocities, dtype=float)
+        if self.velocities.shape != self.particles.shape:
+            raise ValueError(
+                "Velocities of shape %s do not match particles of shape %s"
+                % (self.velocities.shape, self.particles.shape)
+            )
+
+        # scratch buffers reused by every step
+        self._scratch = np.empty_like(self.particles)
+        self._log_weights = np.empty_like(self.weights)
+
+        self.ess = ess(init_weights)
+        self.ess_trace = deque(maxlen=ess_trace_length)
+        # int for a single particle set, array of counts per set otherwise
+        batch = np.shape(init_weights)[:-1]
+        self.n_resamples = np.zeros(batch, dtype=int) if batch else 0
+
+    def step(self, z, resample=None):
+        """Runs one filter cycle of prediction, weight update and resampling.
+
+        Particles are moved in place by :attr:`dynamics` (if set), weighted by the measurements
+        and resampled.
+
+        Args:
+            z: measurements of this time step, see :meth:`update_weights`.
+            resample: Optional; True or False forces or skips resampling, by default
+              :meth:`maybe_resample` decides.
+
+        Returns:
+            True if particles were resampled.
+        """
+        if self.dynamics is not None:
+            self.dynamics.step_inplace(self.particles, self.velocities, self._scratch)
+        self.update_weights(z)
+
+        if resample is None:
+            return self.maybe_resample()
+        if resample:
+            self.resample()
+        return bool(resample)
+
+    def estimate(self):
+        """Weighted mean of the particles, with format (d,) or (K, d) for K particle sets."""
+        return np.einsum("...n,...nd->...d", self.weights, self.particles)
 
     def update_weights(self, z):
         """Updates weights of particles"""
@@ -18,3 +106,76 @@ class ParticleFilter:
     def resample(self):
         """Resamples particles."""
         pass
+
+    def maybe_resample(self):
+        """Resamples if the effective sample size fell below the threshold.
+
+        Without :attr:`ess_threshold` particles are always resampled.
+
+        Returns:
+            True if particles were resampled.
+        """
+        if self.ess_threshold is not None and np.all(
+            self.ess >= self.ess_threshold * self.weights.shape[-1]
+        ):
+            return False
+        self.resample()
+        return True
+
+    def _reset_weights(self, tags=...):
+        """Sets uniform weights after resampling and counts the resampling.
+
+        Args:
+            tags: Optional; index of the resampled rows for weights with format (K, N).
+        """
+        self.weights[tags] = 1 / self.weights.shape[-1]
+        self.ess = ess(self.weights)
+        if np.ndim(self.n_resamples) == 0:
+            self.n_resamples += 1
+        else:
+            self.n_resamples[tags] += 1
+
+    def _resample_indices(self):
+        """Draws ancestor indices for all particles with the configured scheme."""
+        return resample_indices(self.weights, self.resample_scheme, rng=self.rng)
+
+    def _select_ancestors(self, ancestors):
+        """Replaces particles and velocities by those of their ancestors.
+
+        The gathers write into the scratch buffer which is then swapped in, so no new arrays
+        are allocated.
+
+        Args:
+            ancestors: Numpy array of ancestor indices with format (N,).
+        """
+        np.take(self.particles, ancestors, axis=0, out=self._scratch)
+        self.particles, self._scratch = self._scratch, self.particles
+        np.take(self.velocities, ancestors, axis=0, out=self._scratch)
+        self.velocities, self._scratch = self._scratch, self.velocities
+
+    def _reweight(self, log_likelihood):
+        """Multiplies weights with likelihoods given in log space and normalizes them.
+
+        Accumulation happens in log space and normalization uses log-sum-exp, which avoids the
+        underflow of multiplying many small densities. Weights of shape (K, N) are normalized
+        row wise. The effective sample size of the new weights is recorded.
+
+        Args:
+            log_likelihood: Numpy array of log likelihoods per particle with format (N,) or
+              (K, N).
+        """
+        log_weights = self._log_weights
+        with np.errstate(divide="ignore"):
+            np.log(self.weights, out=log_weights)
+        log_weights += log_likelihood
+        log_norm = logsumexp(log_weights, axis=-1, keepdims=True)
+
+        with np.errstate(invalid="ignore", over="ignore"):
+            log_weights -= log_norm
+            np.exp(log_weights, out=self.weights)
+        # all particles degenerated, nothing left to distinguish them
+        degenerated = ~np.isfinite(log_norm[..., 0])
+        if np.any(degenerated):
+            self.weights[degenerated] = 1 / self.weights.shape[-1]
+        self.ess = ess(self.weights)
+        self.ess_trace.append(self.ess)
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def multinomial(weights, rng=None):
+    """Draws ancestors independently according to the weights.
+
+    Args:
+        weights: Numpy array of normalized weights with format (N,) or (K, N) for K independent
+          particle sets.
+        rng: Optional; numpy Generator or seed drawing the uniform samples.
+    """
+    w = np.atleast_2d(weights)
+    ancestors = _invert_cdf(w, np.random.default_rng(rng).random(w.shape))
+    return ancestors.reshape(np.shape(weights))
+
+
+def stratified(weights, rng=None):
+    """Draws one uniform sample in each of the N strata [i/N, (i+1)/N).
+
+    Args:
+        weights: Numpy array of normalized weights with format (N,) or (K, N).
+        rng: Optional; numpy Generator or seed drawing the uniform samples.
+    """
+    w = np.atleast_2d(weights)
+    uniform_samples = (
+        np.arange(w.shape[1]) + np.random.default_rng(rng).random(w.shape)
+    ) / w.shape[1]
+    return _invert_cdf(w, uniform_samples).reshape(np.shape(weights))
+
+
+def systematic(weights, rng=None):
+    """Uses a single uniform offset shared by all N strata.
+
+    Args:
+        weights: Numpy array of normalized weights with format (N,) or (K, N).
+        rng: Optional; numpy Generator or seed drawing the offsets.
+    """
+    w = np.atleast_2d(weights)
+    offsets = np.random.default_rng(rng).random((w.shape[0], 1))
+    uniform_samples = (np.arange(w.shape[1]) + offsets) / w.shape[1]
+    return _invert_cdf(w, uniform_samples).reshape(np.shape(weights))
+
+
+def residual(weights, rng=None):
+    """Copies each particle floor(N * w) times and draws the rest multinomially.
+
+    Args:
+        weights: Numpy array of normalized weights with format (N,) or (K, N).
+        rng: Optional; numpy Generator or seed drawing the remaining ancestors.
+    """
+    w = np.atleast_2d(weights)
+    K, N = w.shape
+    counts = np.floor(N * w).astype(int)
+    n_copies = counts.sum(axis=1)
+
+    remainder = N * w - counts
+    remainder_sum = remainder.sum(axis=1, keepdims=True)
+    remainder = np.where(remainder_sum > 0, remainder, 1.0)  # nothing left to draw
+    remainder = remainder / remainder.sum(axis=1, keepdims=True)
+    drawn = _invert_cdf(remainder, np.random.default_rng(rng).random(w.shape))
+
+    # row-major boolean assignment keeps the copies of each row in their own row
+    copied = np.arange(N) < n_copies[:, None]
+    ancestors = np.empty((K, N), dtype=int)
+    ancestors[copied] = np.repeat(np.tile(np.arange(N), K), counts.ravel())
+    ancestors[~copied] = drawn[~copied]
+    return ancestors.reshape(np.shape(weights))
+
+
+SCHEMES = {
+    "multinomial": multinomial,
+    "stratified": stratified,
+    "systematic": systematic,
+    "residual": residual,
+}
+
+
+def resample_indices(weights, scheme="multinomial", rng=None):
+    """Computes ancestor indices for the given weights with the selected resampling scheme.
+
+    Args:
+        weights: Numpy array of normalized weights with format (N,) or (K, N).
+        scheme: Optional; one of :data:`SCHEMES`.
+        rng: Optional; numpy Generator or seed, a freshly seeded Generator if not provided.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(
+            "Unknown resampling scheme '%s', expected one of %s"
+            % (scheme, list(SCHEMES))
+        )
+    return SCHEMES[scheme](weights, rng=rng)
+
+
+def _invert_cdf(weights, uniform_samples):
+    """Finds ancestors for uniform samples row wise with a single search.
+
+    Every row k is shifted by k so that all rows can be searched in one flat sorted array.
+    """
+    K, N = weights.shape
+    acc_weights = np.cumsum(weights, axis=1)
+    acc_weights /= acc_weights[:, -1:]  # in case of rounding errors
+
+    shift = np.arange(K)[:, None]
+    positions = np.searchsorted(
+        (acc_weights + shift).ravel(), (uniform_samples + shift).ravel(), side="right"
+    ).reshape(uniform_samples.shape)
+    return np.clip(positions - shift * N, 0, N - 1)
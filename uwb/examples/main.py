@@ -1,10 +1,24 @@
+import logging
+
 import hydra
 import numpy as np
+from hydra.utils import to_absolute_path
 from omegaconf import DictConfig
 
-from uwb.algorithm import BasicParticleFilter, MNMAParticleFilter
-from uwb.generator import BlobGenerator, FileMeasurements, RngSensorMeasurements
-from uwb.map import NoiseMapGM, NoiseMapNormal
+from uwb.algorithm import BasicParticleFilter, DynamicModel, MNMAParticleFilter
+from uwb.generator import FileMeasurements, RngSensorMeasurements
+from uwb.util.builder import create_noise_map
+from uwb.util.cache import MapCache
+from uwb.util.instrumentation import (
+    HistogramSink,
+    Instrumentation,
+    JsonLinesSink,
+    PrometheusSink,
+)
+from uwb.util.rng import spawn_rngs
+
+# hydra writes the records to the console and to the log file of the run
+log = logging.getLogger(__name__)
 
 
 def get_initial_particles():
@@ -16,37 +30,40 @@ def get_initial_particles():
 
 @hydra.main(config_path="conf", config_name="main")
 def run(cfg: DictConfig):
-    if cfg.generator.name == "BlobGenerator":
-        generator = BlobGenerator(
-            grid_dims=cfg.generator.grid_dims,
-            step_size=cfg.generator.step_size,
-            measurements_per_location=cfg.generator.measurements_per_location,
-            modal_range=cfg.generator.modal_range,
-            deviation=cfg.generator.deviation,
-        )
+    # independent streams of the filter, the dynamics and the simulated measurements
+    filter_rng, dynamics_rng, measurement_rng = spawn_rngs(cfg.seed, 3)
 
+    dynamics = None
     if cfg.dynamics.name == "DynamicModel":
-        pass
-        # model = DynamicModel(std=cfg.dynamics.std)
+        dynamics = DynamicModel(std=cfg.dynamics.std, rng=dynamics_rng)
 
-    if cfg.map.name == "NoiseMapNormal":
-        noise_map = NoiseMapNormal(generator=generator)
-    elif cfg.map.name == "NoiseMapGM":
-        noise_map = NoiseMapGM(
-            generator=generator, eps=cfg.map.eps, min_samples=cfg.map.min_samples
+    cache = None
+    if cfg.map_cache.dir is not None:
+        cache = MapCache(
+            to_absolute_path(cfg.map_cache.dir),
+            max_size=cfg.map_cache.max_size_mb * 1024**2,
         )
-    else:
-        raise ValueError("No noise map provided")
-    noise_map.gen()
+    noise_map = create_noise_map(cfg, cache=cache)
 
     particles, weights = get_initial_particles()
     if cfg.algorithm.name == "BasicParticleFilter":
-        pf = BasicParticleFilter(particles, weights)
+        pf = BasicParticleFilter(
+            particles,
+            weights,
+            resample_scheme=cfg.algorithm.resample_scheme,
+            ess_threshold=cfg.algorithm.ess_threshold,
+            dynamics=dynamics,
+            rng=filter_rng,
+        )
     elif cfg.algorithm.name == "MNMAParticleFilter":
         pf = MNMAParticleFilter(
             particles,
             weights,
             map=noise_map,
+            resample_scheme=cfg.algorithm.resample_scheme,
+            ess_threshold=cfg.algorithm.ess_threshold,
+            dynamics=dynamics,
+            rng=filter_rng,
         )
     else:
         raise ValueError("No particle filter provided")
@@ -57,14 +74,33 @@ def run(cfg: DictConfig):
         )
     elif cfg.measurements.name == "RngSensorMeasurements":
         measurement_generator = RngSensorMeasurements(
-            cfg.measurements.ranges, cfg.measurements.amount, cfg.measurements.dim
+            cfg.measurements.ranges,
+            cfg.measurements.amount,
+            cfg.measurements.dim,
+            rng=measurement_rng,
         )
+    instrumentation = None
+    if cfg.instrumentation.sink == "histogram":
+        instrumentation = Instrumentation(HistogramSink())
+    elif cfg.instrumentation.sink == "jsonl":
+        instrumentation = Instrumentation(JsonLinesSink(cfg.instrumentation.path))
+    elif cfg.instrumentation.sink == "prometheus":
+        instrumentation = Instrumentation(PrometheusSink(cfg.instrumentation.path))
+    if instrumentation is not None:
+        instrumentation.enable()
+
     # main loop
     for i, mb in enumerate(measurement_generator):
-        pf.update_weights(mb)
+        # adaptive filters resample only on low ESS
+        resample = None if pf.ess_threshold is not None else i % cfg.resample_each == 0
+        pf.step(mb, resample=resample)
 
-        if i % cfg.resample_each == 0:
-            pf.resample()
+    if instrumentation is not None:
+        instrumentation.disable()
+        instrumentation.sink.close()
+        if isinstance(instrumentation.sink, HistogramSink):
+            for stage, stats in instrumentation.sink.summary().items():
+                log.info("%s: %s", stage, stats)
 
 
 if __name__ == "__main__":
@@ -2,10 +2,12 @@ from uwb.generator.base_gen import BaseGenerator
 from uwb.generator.blob_gen import BlobGenerator
 from uwb.generator.file_measurements import FileMeasurements
 from uwb.generator.rng_sensor_measurements import RngSensorMeasurements
+from uwb.generator.survey_gen import SurveyGenerator
 
 __all__ = [
     "BaseGenerator",
     "BlobGenerator",
     "FileMeasurements",
     "RngSensorMeasurements",
+    "SurveyGenerator",
 ]
@@ -1,3 +1,8 @@
+import numpy as np
+
+from uwb.util.registry import find_subclass
+
+
 class BaseGenerator:
     """Base class for generators.
 
@@ -33,6 +38,49 @@ class BaseGenerator:
         """
         pass
 
+    def get_closest_cell(self, coordinates, out=None):
+        """Finds flat and multi indices in the map for the given coordinates.
+
+        Flat indices address the map parameters raveled over :attr:`shape`, so parameters of
+        all coordinates can be gathered with a single ``take``. Falls back to
+        :meth:`get_closest_position`, generators should override it with a faster lookup.
+
+        Attributes:
+            coordinates: coordinates to look up map position.
+            out: Optional; integer array receiving the flat indices.
+        """
+        idxs, _ = self.get_closest_position(coordinates)
+        idxs = np.asarray(idxs, dtype=np.intp)
+        flat = np.ravel_multi_index(tuple(idxs.T), self.shape)
+        if out is None:
+            return flat, idxs
+        out[...] = flat
+        return out, idxs
+
+    def get_position(self, idxs):
+        """Coordinates of the map positions given by their indices.
+
+        Attributes:
+            idxs: Numpy array of indices with format (N, len(shape)).
+        """
+        pass
+
+    def get_metadata(self):
+        """JSON serializable description of the underlying structure.
+
+        Metadata is stored together with noise maps and has to be sufficient to restore the
+        position lookup with :meth:`from_metadata`, not the measurements themselves.
+        """
+        return {"name": type(self).__name__}
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Restores a generator from :meth:`get_metadata` without generating measurements."""
+        generator_cls = find_subclass(BaseGenerator, metadata["name"])
+        if generator_cls is None:
+            raise ValueError("Unknown generator '%s'" % metadata["name"])
+        return generator_cls.from_metadata(metadata)
+
     @property
     def shape(self):
         """Shape of the underlying structure.
@@ -42,3 +90,8 @@ class BaseGenerator:
         with than obscure shapes. For memory efficiency this decision can be altered.
         """
         return (1,)
+
+    @property
+    def dim(self):
+        """Dimension of the coordinates and measurements, one per axis of a grid by default."""
+        return len(self.shape)
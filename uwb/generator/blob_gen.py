@@ -3,7 +3,6 @@ from itertools import product
 from typing import List, Tuple
 
 import numpy as np
-from sklearn.datasets import make_blobs
 
 from uwb.generator.base_gen import BaseGenerator
 
@@ -21,6 +20,12 @@ class BlobGenerator(BaseGenerator):
         measurements_per_location: number of measurements per position in grid.
         model_range: tuple with minimum and maximum number of clusters.
         deviation: standard deviation for Gaussian distribution.
+        rng: Optional; numpy random Generator or seed used for generation, runs with the same
+          seed are reproducible.
+        storage: Optional; path of a ``.npy`` file the samples are written to. Samples are kept
+          in memory if not provided.
+        dtype: Optional; floating point type of the samples.
+        chunk_size: Optional; number of positions generated at once.
     """
 
     def __init__(
@@ -30,6 +35,10 @@ class BlobGenerator(BaseGenerator):
         measurements_per_location: int,
         modal_range: Tuple[int, int],
         deviation: float = 10.0,
+        rng=None,
+        storage=None,
+        dtype=np.float64,
+        chunk_size=4096,
     ):
         """Pre-allocates data structures for generation."""
         super().__init__()
@@ -38,6 +47,10 @@ class BlobGenerator(BaseGenerator):
         self.range = modal_range
         self.deviation = deviation
         self.grid_dims = grid_dims
+        self.rng = np.random.default_rng(rng)
+        self.storage = storage
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
         self.grid = []
         self._data = None
         self._iter = None
@@ -45,34 +58,54 @@ class BlobGenerator(BaseGenerator):
         for dim in grid_dims:
             self.grid.append((np.arange(dim) + 1) * step_size)
 
+        # lookup tables for the arithmetic grid lookup
+        self._upper = np.asarray(self.shape) - 1
+        self._strides = np.cumprod((1,) + self.shape[:0:-1])[::-1].astype(np.intp)
+
     def gen(self):
-        """Initializes generation process."""
+        """Initializes generation process.
+
+        Mixture centers, component assignments and Gaussian noise are drawn in bulk for chunks
+        of :attr:`chunk_size` positions. Samples of a component have unit standard deviation
+        around their center. If :attr:`storage` is set, chunks are written to a memory-mapped
+        ``.npy`` file and the data is read back from disk on iteration.
+        """
         prod = reduce((lambda x, y: x * y), self.grid_dims)  # multiplies all dimensions
-        samples = np.zeros(self.grid_dims + [self.amount, len(self.grid_dims)])
-        clusters = np.random.randint(
-            self.range[0], self.range[1] + 1, size=self.grid_dims
-        )
+        shape = tuple(self.grid_dims) + (self.amount, len(self.grid_dims))
+        if self.storage is None:
+            samples = np.empty(shape, dtype=self.dtype)
+        else:
+            samples = np.lib.format.open_memmap(
+                self.storage, mode="w+", dtype=self.dtype, shape=shape
+            )
+
+        flat_samples = samples.reshape((prod,) + shape[-2:])
+        for start in range(0, prod, self.chunk_size):
+            stop = min(start + self.chunk_size, prod)
+            flat_samples[start:stop] = self._gen_positions(np.arange(start, stop))
+
+        if self.storage is not None:
+            samples.flush()
+            del flat_samples, samples
+            samples = np.load(self.storage, mmap_mode="r")
 
-        mean = np.array(np.meshgrid(*self.grid, indexing="ij")).reshape(
-            prod, len(self.grid_dims)
-        )
-        noise = (
-            np.random.randn(self.range[1], prod, len(self.grid_dims)) * self.deviation
-        )
-        centers = (noise + mean).reshape(
-            [self.range[1]] + list(self.grid_dims) + [len(list(self.grid_dims))]
-        )
+        self._data = samples
+        return samples
 
-        # transpose hack for selection
-        roll_idx = np.roll(np.arange(centers.ndim), -1).tolist()
-        centers = np.transpose(centers, roll_idx)
+    def _gen_positions(self, flat_idxs):
+        """Draws samples for the positions given by their flat grid indices."""
+        n, d = len(flat_idxs), len(self.grid_dims)
+        clusters = self.rng.integers(self.range[0], self.range[1] + 1, size=n)
 
-        for idxs in product(*[range(i) for i in self.grid_dims]):
-            samples[idxs] = make_blobs(
-                n_samples=self.amount, centers=(centers[idxs][:, 0 : clusters[idxs]]).T
-            )[0]
+        mean = (
+            np.stack(np.unravel_index(flat_idxs, self.shape), axis=-1) + 1
+        ) * self.step
+        noise = self.rng.standard_normal((n, self.range[1], d)) * self.deviation
+        centers = mean[:, None, :] + noise  # (positions, components, d)
 
-        self._data = samples
+        assignment = (self.rng.random((n, self.amount)) * clusters[:, None]).astype(int)
+        samples = centers[np.arange(n)[:, None], assignment]
+        samples += self.rng.standard_normal((n, self.amount, d))
         return samples
 
     def get_closest_position(self, coordinates):
@@ -83,20 +116,62 @@ class BlobGenerator(BaseGenerator):
         Args:
             coordinates: Numpy array (N, d) where N, d are batch size and dimensions respectively.
         """
+        _, idxs = self.get_closest_cell(coordinates)
+        return idxs, self.get_position(idxs)
+
+    def get_closest_cell(self, coordinates, out=None):
+        """Finds flat and multi indices of the closest grid positions.
+
+        The grid is uniform, so the closest position per dimension is found by rounding the
+        scaled coordinates and clipping them to the grid. Coordinates half way between two grid
+        positions map to the upper one.
+
+        Args:
+            coordinates: Numpy array (N, d) where N, d are batch size and dimensions respectively.
+            out: Optional; integer array with format (N,) receiving the flat indices.
+
+        Returns:
+            Flat indices into the grid with format (N,) and multi indices with format (N, d).
+        """
+        coordinates = np.asarray(coordinates)
         assert coordinates.shape[1] == len(self.grid_dims)
-        pos = np.empty((coordinates.shape[0], len(self.grid_dims)))
 
-        for i in range(len(self.grid_dims)):
-            i_pos = np.searchsorted(self.grid[i], coordinates[:, i], side="left")
-            i_valid = (i_pos != 0) & (i_pos < len(self.grid[0]))
-            i_pos = np.clip(i_pos, 0, len(self.grid[i]) - 1)
-            i_dist_right = self.grid[i][i_pos] - coordinates[:, i]
-            i_dist_left = coordinates[:, i] - self.grid[i][i_pos - 1]
-            i_pos[i_valid & (i_dist_right > i_dist_left)] -= 1
+        scaled = np.floor(coordinates / self.step - 0.5)
+        np.clip(scaled, 0, self._upper, out=scaled)
+        idxs = scaled.astype(np.intp)
+        return np.dot(idxs, self._strides, out=out), idxs
 
-            pos[:, i] = i_pos
+    def get_position(self, idxs):
+        """Coordinates of the grid positions given by their indices.
 
-        return pos.astype(int), (pos + 1) * self.step
+        Args:
+            idxs: Numpy array of indices with format (N, d).
+        """
+        return (np.asarray(idxs) + 1) * self.step
+
+    def get_metadata(self):
+        """Grid description, see :meth:`uwb.generator.BaseGenerator.get_metadata`."""
+        return {
+            "name": type(self).__name__,
+            "grid_dims": [int(dim) for dim in self.grid_dims],
+            "step_size": self.step,
+            "grid": [g.tolist() for g in self.grid],
+            "shape": list(self.shape),
+            "measurements_per_location": self.amount,
+            "modal_range": list(self.range),
+            "deviation": self.deviation,
+        }
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Restores the grid of a generator, see :meth:`get_metadata`."""
+        return cls(
+            grid_dims=metadata["grid_dims"],
+            step_size=metadata["step_size"],
+            measurements_per_location=metadata["measurements_per_location"],
+            modal_range=tuple(metadata["modal_range"]),
+            deviation=metadata["deviation"],
+        )
 
     def __iter__(self):
         """Provides iterator for samples. Generation will be performed if not invoked previously"""
@@ -1,33 +1,148 @@
+import io
 import os
+import struct
+import warnings
+from itertools import islice
 
 import numpy as np
-from numpy import genfromtxt
+
+# header of raw measurement files: magic, format version, dimension, number of measurements
+BINARY_MAGIC = b"UWBM"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHHQ")
 
 
 class FileMeasurements:
     """Reads in measurement batches from specified file.
 
+    Measurements are streamed in batches of :attr:`batch_size` rows, the last batch may be
+    smaller. Supported layouts are
+
+    * CSV files, parsed in chunks of :attr:`chunk_size` lines, so memory stays bounded.
+    * ``.npy`` files and raw float32 files with a header (see :func:`save_binary`), which are
+      memory-mapped. Batches are views into the mapped file.
+
     Arguments:
-        file_name: name of file
-        batch_size: batch size of measurements
+        file_name: name of file, relative paths are resolved from the repository root.
+        batch_size: number of measurements per batch.
+        chunk_size: Optional; number of CSV lines parsed at once.
     """
 
-    def __init__(self, file_name, batch_size):
+    def __init__(self, file_name, batch_size, chunk_size=65536):
         dir_path = os.path.dirname(os.path.realpath(__file__))
-        file_name = ("%s/../../" % dir_path) + file_name
-
-        measurements = genfromtxt(file_name, delimiter=",")
-        self.idx = 0
+        self.file_name = os.path.join(dir_path, "..", "..", file_name)
         self.batch_size = batch_size
-        self.measurements = np.array_split(measurements, batch_size)
+        self.chunk_size = chunk_size
+        self.idx = 0
+        self._batches = None
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.idx >= len(self.measurements):
-            raise StopIteration
+        if self._batches is None:
+            self._batches = self._read()
 
-        ret = self.measurements[self.idx]
+        ret = next(self._batches)
         self.idx += 1
         return ret
+
+    def _read(self):
+        """Yields batches from the layout of the file."""
+        if self.file_name.endswith(".npy"):
+            yield from _split(np.load(self.file_name, mmap_mode="r"), self.batch_size)
+            return
+
+        with open(self.file_name, "rb") as f:
+            header = f.read(BINARY_HEADER.size)
+        if header[: len(BINARY_MAGIC)] == BINARY_MAGIC:
+            yield from _split(load_binary(self.file_name), self.batch_size)
+        else:
+            yield from self._read_csv()
+
+    def _read_csv(self):
+        """Parses the CSV file chunk wise and yields batches of fixed size.
+
+        Like :func:`numpy.genfromtxt` on the whole file, missing or non numeric fields, e.g. of
+        a header row, are read as NaN.
+        """
+        pending = None
+        with open(self.file_name, "r") as f:
+            while True:
+                lines = [line for line in islice(f, self.chunk_size) if line.strip()]
+                if not lines:
+                    break
+
+                chunk = _parse_csv(lines)
+                if pending is not None:
+                    chunk = np.concatenate([pending, chunk])
+
+                n_full = len(chunk) - len(chunk) % self.batch_size
+                yield from _split(chunk[:n_full], self.batch_size)
+                pending = chunk[n_full:]
+
+        if pending is not None and len(pending):
+            yield pending
+
+
+def _parse_csv(lines):
+    """Parses CSV lines with the fast :func:`numpy.fromstring`.
+
+    Chunks it can not parse or which do not give the same number of fields per line, e.g. with
+    missing fields or a header row, are parsed with :func:`numpy.genfromtxt` instead.
+
+    Args:
+        lines: list of non empty lines.
+
+    Returns:
+        Numpy array with one row per line.
+    """
+    n_fields = lines[0].count(",") + 1
+    with warnings.catch_warnings():
+        # older numpy versions warn on unparsable data instead of raising
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            chunk = np.fromstring("".join(lines).replace("\n", ","), sep=",")
+        except (ValueError, DeprecationWarning):
+            chunk = None
+    if chunk is not None and chunk.size == len(lines) * n_fields:
+        return chunk.reshape(len(lines), n_fields)
+
+    chunk = np.genfromtxt(io.StringIO("".join(lines)), delimiter=",")
+    return chunk.reshape(len(lines), -1)
+
+
+def save_binary(file_name, measurements):
+    """Writes measurements as raw float32 with a header for memory-mapped replay.
+
+    Args:
+        file_name: name of the file.
+        measurements: Numpy array of measurements with format (N, d).
+    """
+    measurements = np.ascontiguousarray(measurements, dtype="<f4")
+    with open(file_name, "wb") as f:
+        f.write(
+            BINARY_HEADER.pack(
+                BINARY_MAGIC, BINARY_VERSION, measurements.shape[1], len(measurements)
+            )
+        )
+        f.write(measurements.tobytes())
+
+
+def load_binary(file_name):
+    """Memory-maps a raw float32 measurement file written by :func:`save_binary`."""
+    with open(file_name, "rb") as f:
+        magic, version, dim, n = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(
+            "%s is no measurement file of version %d" % (file_name, BINARY_VERSION)
+        )
+    return np.memmap(
+        file_name, dtype="<f4", mode="r", offset=BINARY_HEADER.size, shape=(n, dim)
+    )
+
+
+def _split(measurements, batch_size):
+    """Yields consecutive views of batch size rows."""
+    for start in range(0, len(measurements), batch_size):
+        yield measurements[start : start + batch_size]
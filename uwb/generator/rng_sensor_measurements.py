@@ -6,17 +6,24 @@ class RngSensorMeasurements:
 
     This class is just for testing purposes. Similar interface structure is expected for
     sensor input.
+
+    Attributes:
+        ranges: lower and upper bound of the measurements.
+        amount: number of measurements per batch.
+        dim: dimension of the measurements.
+        rng: Optional; numpy Generator or seed drawing the measurements.
     """
 
-    def __init__(self, ranges, amount, dim):
+    def __init__(self, ranges, amount, dim, rng=None):
         """Initializes ranges."""
         self.ranges = ranges
         self.amount = amount
         self.dim = dim
+        self.rng = np.random.default_rng(rng)
 
     def __next__(self):
         return np.tile(
-            np.random.uniform(
+            self.rng.uniform(
                 low=self.ranges[0],
                 high=self.ranges[1],
                 size=(self.amount, self.dim),
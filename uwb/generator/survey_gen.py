@@ -0,0 +1,108 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from uwb.generator.base_gen import BaseGenerator
+
+
+class SurveyGenerator(BaseGenerator):
+    """Measurements recorded at irregular survey points.
+
+    Unlike grid generators (see :class:`uwb.generator.BlobGenerator`) only the measured points
+    make up the map, so the shape is (M,) for M survey points and noise maps keep parameters
+    for the measured points only. Closest points are found with a prebuilt KD-tree.
+
+    Attributes:
+        points: Numpy array of survey point coordinates with format (M, d).
+        measurements: Optional; sequence of M arrays with format (S_i, d) holding the
+          measurements of each point. Only required to build a noise map, lookups work without.
+        workers: Optional; number of threads used by KD-tree queries, -1 uses all cores.
+    """
+
+    def __init__(self, points, measurements=None, workers=1):
+        """Builds the spatial index over the survey points."""
+        super().__init__()
+        self.points = np.asarray(points, dtype=float)
+        if self.points.ndim != 2:
+            raise ValueError("Survey points need the format (M, d)")
+        if measurements is not None and len(measurements) != len(self.points):
+            raise ValueError(
+                "Expected measurements for %d points, got %d"
+                % (len(self.points), len(measurements))
+            )
+        self.measurements = measurements
+        self.workers = workers
+        self._tree = cKDTree(self.points)
+        self._iter = None
+
+    def gen(self):
+        """Measurements are recorded, nothing to generate."""
+        return self.measurements
+
+    def get_closest_position(self, coordinates):
+        """Finds the closest (L2-norm) survey points.
+
+        Args:
+            coordinates: Numpy array (N, d) where N, d are batch size and dimensions respectively.
+        """
+        _, idxs = self.get_closest_cell(coordinates)
+        return idxs, self.get_position(idxs)
+
+    def get_closest_cell(self, coordinates, out=None):
+        """Finds the indices of the closest survey points with one batched KD-tree query.
+
+        See :meth:`uwb.generator.BaseGenerator.get_closest_cell`, flat indices are the point
+        indices and multi indices have format (N, 1).
+        """
+        _, cells = self._tree.query(coordinates, workers=self.workers)
+        if out is not None:
+            out[...] = cells
+            cells = out
+        return cells, cells[:, None]
+
+    def get_position(self, idxs):
+        """Coordinates of the survey points given by their indices with format (N, 1)."""
+        return self.points[np.asarray(idxs)[..., 0]]
+
+    def get_metadata(self):
+        """Survey points, see :meth:`uwb.generator.BaseGenerator.get_metadata`."""
+        return {
+            "name": type(self).__name__,
+            "points": self.points.tolist(),
+            "shape": list(self.shape),
+        }
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Restores the survey points of a generator, see :meth:`get_metadata`."""
+        return cls(np.array(metadata["points"]))
+
+    def __iter__(self):
+        """Provides iterator over the measurements of all survey points."""
+        if self.measurements is None:
+            raise ValueError("Survey generator holds no measurements")
+        return self
+
+    def __next__(self):
+        """Measurements for next survey point."""
+        if self._iter is None:
+            self._iter = iter(range(len(self.points)))
+        try:
+            i = next(self._iter)
+        except StopIteration:
+            self._iter = None
+            raise StopIteration
+        return (
+            np.asarray(self.measurements[i]),
+            (i,),
+            self.points[i],
+        )  # samples, index, position
+
+    @property
+    def shape(self):
+        """One entry per survey point."""
+        return (len(self.points),)
+
+    @property
+    def dim(self):
+        """Dimension of the survey point coordinates."""
+        return self.points.shape[1]
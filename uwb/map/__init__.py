@@ -1,9 +1,21 @@
 from uwb.map.noise_map import NoiseMap
 from uwb.map.noise_map_gm import NoiseMapGM
 from uwb.map.noise_map_normal import NoiseMapNormal
+from uwb.map.tiled import (
+    TiledNoiseMapGM,
+    TiledNoiseMapNormal,
+    TileStore,
+    load_tiled,
+    save_tiled,
+)
 
 __all__ = [
     "NoiseMap",
     "NoiseMapGM",
     "NoiseMapNormal",
+    "TiledNoiseMapGM",
+    "TiledNoiseMapNormal",
+    "TileStore",
+    "load_tiled",
+    "save_tiled",
 ]
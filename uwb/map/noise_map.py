@@ -1,18 +1,39 @@
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 import numpy as np
 
 from uwb.generator import BaseGenerator
+from uwb.util.registry import find_subclass
+
+FORMAT_VERSION = 3
 
 
 class NoiseMap:
     """Base class for noise maps
 
+    Estimated maps can be stored with :meth:`save` and restored with :meth:`load`. A stored map
+    is a directory with one ``.npy`` file per parameter array listed in :attr:`_param_names` and
+    a ``meta.json`` file containing the format version, the constructor arguments of the map
+    given by :meth:`_get_params` and the metadata of the generator.
+
+    Likelihoods depend on the particles only through their closest map cell. With
+    :attr:`group_cells` enabled (default), particles sharing a cell are evaluated once per cell,
+    so the cost of a converged filter scales with the number of occupied cells instead of the
+    number of particles.
+
     Attributes:
         generator: measurement that can be accessed by an iterator.
+        group_cells: Optional; evaluates likelihoods once per occupied cell.
     """
 
+    _param_names = ()
+
     def __init__(self, generator: BaseGenerator):
         """Initializes the estimation of the parameters."""
         self.generator = generator
+        self.group_cells = True
 
     def get_params(self, coordinates: np.array):
         """Returns list of lists with parameter estimates for the given coordinates.
@@ -28,6 +49,254 @@ class NoiseMap:
         """
         pass
 
-    def sample_from(self, coordinates):
-        """Samples from distributions of the map for given coordinates."""
+    def conditioned_log_likelihood(self, z, particles):
+        """Computes log p(z|x) for every pair of measurement and particle.
+
+        Batched counterpart of :meth:`conditioned_probability`. Every measurement is evaluated
+        under the map distribution of every particle in a single call. Leading dimensions are
+        treated as independent batches, e.g. K tags with their own particles and measurements.
+
+        Args:
+            z: Numpy array of measurements with format (..., Z, d).
+            particles: Numpy array of particles with format (..., P, d).
+
+        Returns:
+            Numpy array of log likelihoods with format (..., P, Z).
+        """
+        batch, d = particles.shape[:-1], particles.shape[-1]
+        cells, pos = self._lookup(particles.reshape(-1, d))
+        if not self.group_cells:
+            return self._cell_log_likelihood(z, cells, pos, batch)
+
+        # leading dimensions of measurements and particles broadcast against each other,
+        # particles repeated along them are looked up once and grouped per batch row
+        lead = np.broadcast_shapes(z.shape[:-2], batch[:-1])
+        batch = lead + batch[-1:]
+        rows = np.arange(len(cells)).reshape(particles.shape[:-1])
+        rows = np.broadcast_to(rows, batch).reshape(-1)
+        cells, pos = cells[rows], pos[rows]
+
+        # every group is evaluated as a batch of a single particle with its measurements
+        first, groups, inverse = self._group_cells(cells, batch)
+        z = np.broadcast_to(z, lead + z.shape[-2:]).reshape((-1,) + z.shape[-2:])
+        log_likelihood = self._cell_log_likelihood(
+            z[groups], cells[first], pos[first], (len(first), 1)
+        )
+        return log_likelihood[inverse, 0].reshape(batch + (z.shape[-2],))
+
+    def sample_from(self, coordinates, rng=None):
+        """Samples from distributions of the map for given coordinates.
+
+        Maps are shared between filters, so the random stream is supplied by the caller.
+
+        Args:
+            coordinates: Numpy array of positions with format (N, d).
+            rng: Optional; numpy Generator or seed, a freshly seeded Generator if not provided.
+        """
         pass
+
+    def finalize(self):
+        """Completes pending estimates before parameters are read, nothing to do by default."""
+        pass
+
+    def save(self, path):
+        """Saves the estimated parameters and the generator metadata to a directory.
+
+        Pending estimates are completed with :meth:`finalize` before.
+
+        Args:
+            path: directory to store the map in, created if it does not exist.
+        """
+        self.finalize()
+        os.makedirs(path, exist_ok=True)
+        for name in self._param_names:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+
+        meta = self.get_metadata()
+        # written last, marks completion
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap=True, generator=None):
+        """Loads a map stored with :meth:`save`.
+
+        Called on :class:`NoiseMap` the stored map type is restored, called on a subclass the
+        stored type has to match.
+
+        Args:
+            path: directory the map was saved to.
+            mmap: Optional; memory-maps the parameter arrays read-only instead of reading them,
+              processes loading the same map share one page-cached copy.
+            generator: Optional; generator to use, restored from the stored metadata otherwise.
+        """
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(
+                os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None
+            )
+            for name in meta["arrays"]
+        }
+        return cls.from_arrays(meta, arrays, generator=generator)
+
+    @classmethod
+    def from_arrays(cls, meta, arrays, generator=None):
+        """Restores a map from its metadata and parameter arrays.
+
+        Args:
+            meta: metadata as written to ``meta.json`` by :meth:`save`.
+            arrays: dictionary of parameter arrays by name, used without copying, e.g.
+              memory-mapped or shared memory arrays.
+            generator: Optional; generator to use, restored from the metadata otherwise.
+        """
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported noise map format version %s" % meta["format_version"]
+            )
+
+        map_cls = find_subclass(NoiseMap, meta["map"])
+        if map_cls is None or not issubclass(map_cls, cls):
+            raise ValueError("Stored map '%s' is no %s" % (meta["map"], cls.__name__))
+
+        if generator is None:
+            generator = BaseGenerator.from_metadata(meta["generator"])
+        noise_map = map_cls(generator, **meta["params"])
+        for name, array in arrays.items():
+            setattr(noise_map, name, array)
+        return noise_map
+
+    def get_metadata(self):
+        """Metadata of the map as written to ``meta.json`` by :meth:`save`."""
+        return {
+            "format_version": FORMAT_VERSION,
+            "map": type(self).__name__,
+            "params": self._get_params(),
+            "arrays": list(self._param_names),
+            "generator": self.generator.get_metadata(),
+        }
+
+    def _get_params(self):
+        """JSON serializable constructor arguments besides the generator."""
+        return {}
+
+    def _lookup(self, coordinates):
+        """Flat indices and positions of the map cells closest to the coordinates."""
+        cells, idxs = self.generator.get_closest_cell(coordinates)
+        return cells, self.generator.get_position(idxs)
+
+    def _cell_log_likelihood(self, z, cells, pos, batch):
+        """Computes log p(z|x) for particles given by their map cells.
+
+        Args:
+            z: Numpy array of measurements with format (..., Z, d).
+            cells: Numpy array of flat cell indices of the particles with format (N,).
+            pos: Numpy array of the cell positions with format (N, d).
+            batch: leading shape (..., P) the N particles are reshaped to.
+
+        Returns:
+            Numpy array of log likelihoods with format (..., P, Z).
+        """
+        pass
+
+    def _group_cells(self, cells, batch=None):
+        """Groups particles sharing a map cell within each batch of particles.
+
+        Without :attr:`group_cells` every particle forms its own group.
+
+        Args:
+            cells: Numpy array of flat cell indices of the particles with format (N,).
+            batch: Optional; leading shape of the particles, the last entry being the number of
+              particles per batch. All particles form one batch if not provided.
+
+        Returns:
+            Index of one particle per group with format (U,), batch index per group with format
+            (U,) and the group of every particle with format (N,).
+        """
+        n_particles = len(cells) if batch is None else batch[-1]
+        batch_idxs = np.arange(len(cells)) // max(n_particles, 1)
+        if not self.group_cells:
+            return np.arange(len(cells)), batch_idxs, np.arange(len(cells))
+
+        keys = batch_idxs * np.prod(self.generator.shape, dtype=np.int64) + cells
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        return first, batch_idxs[first], inverse.reshape(-1)
+
+    def _gather(self, param, cells):
+        """Gathers a parameter array for flat cell indices with a single ``take``."""
+        n = len(self.generator.shape)
+        return np.take(param.reshape((-1,) + param.shape[n:]), cells, axis=0)
+
+    def _gather_params(self, cells, names):
+        """Gathers the parameter arrays of the given names for flat cell indices.
+
+        Returns:
+            list of the gathered arrays in the order of the names.
+        """
+        return [self._gather(getattr(self, name), cells) for name in names]
+
+    def _fit_chunks(self, fit, *args, n_jobs=1, chunk_size=256):
+        """Fits the positions of the generator chunk wise, optionally in a process pool.
+
+        Positions are grouped into chunks of :attr:`chunk_size`. The samples of a chunk are
+        stacked into one contiguous array and passed to the module level function
+        ``fit(samples, counts, positions, *args)`` together with the number of samples per
+        position, so a chunk is sent to a worker as a few arrays. ``fit`` returns parameter
+        arrays for the whole chunk. With more than one job chunks are fitted in a process pool,
+        only a bounded number of chunks is in flight at any time and results are yielded as
+        they complete, in no particular order.
+
+        Args:
+            fit: picklable function fitting a chunk of positions.
+            n_jobs: Optional; number of worker processes, -1 uses all cores.
+            chunk_size: Optional; number of positions per chunk.
+
+        Yields:
+            tuple of index arrays of the chunk positions and the result of ``fit``.
+        """
+        n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        chunks = _chunk_generator(self.generator, chunk_size)
+        if n_jobs is None or n_jobs <= 1:
+            for idxs, samples, counts, positions in chunks:
+                yield idxs, fit(samples, counts, positions, *args)
+            return
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            pending = {}
+            for idxs, samples, counts, positions in chunks:
+                future = pool.submit(fit, samples, counts, positions, *args)
+                pending[future] = idxs
+                if len(pending) >= 2 * n_jobs:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            for future in wait(pending).done:
+                yield pending[future], future.result()
+
+
+def _chunk_generator(generator, chunk_size):
+    """Groups (samples, idx, position) of a generator into chunks of stacked arrays.
+
+    Yields:
+        tuple of index arrays of the positions, samples of all positions stacked with format
+        (M, d), number of samples per position and the positions with format (C, d).
+    """
+    samples, idxs, positions = [], [], []
+    for s, idx, pos in generator:
+        samples.append(s)
+        idxs.append(idx)
+        positions.append(pos)
+        if len(samples) == chunk_size:
+            yield _stack_chunk(samples, idxs, positions)
+            samples, idxs, positions = [], [], []
+    if samples:
+        yield _stack_chunk(samples, idxs, positions)
+
+
+def _stack_chunk(samples, idxs, positions):
+    """Stacks the samples of a chunk into one contiguous array."""
+    positions = np.array(positions)
+    d = positions.shape[1]
+    counts = np.array([len(s) for s in samples])
+    samples = np.concatenate([np.reshape(s, (-1, d)) for s in samples])
+    return tuple(np.array(idxs).T), samples, counts, positions
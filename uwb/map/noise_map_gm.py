@@ -1,106 +1,262 @@
-from copy import deepcopy
-from functools import reduce
-
 import numpy as np
-from scipy.stats import multivariate_normal
+from scipy.special import logsumexp
 from sklearn.cluster import DBSCAN
 
 from uwb.generator import BaseGenerator
 from uwb.map import NoiseMap
+from uwb.util.gaussian import (
+    LOG_2PI,
+    log_determinant,
+    mvn_log_pdf,
+    robust_cholesky,
+    sample_categorical,
+    sample_mvn,
+    variance_floor,
+)
 
 
 class NoiseMapGM(NoiseMap):
     """Provides estimates for each position with Gaussian Mixtures via DBSCAN preprocessing.
 
-    This module is just a prove of concept and has to be rewritten for performance purposes.
-    The simpler :class:`uwb.map.NoiseMapNormal` should be used in most cases.
+    Parameters are kept in dense arrays padded to the maximum number of components K found over
+    the map, i.e. weights (..., K), means (..., K, d), lower Cholesky factors of the covariances
+    and their inverses (..., K, d, d), where ... is the shape of the generator. The boolean
+    :attr:`mask` (..., K) marks valid components, padded ones have zero weight and an identity
+    covariance. Covariances are not stored, :attr:`covs` rebuilds them from the factors.
+
+    Covariances of components which are not positive definite, e.g. of clusters with no more
+    samples than dimensions, are regularized by flooring their eigenvalues at
+    :attr:`min_variance`, they would otherwise become spikes dominating the particle weights.
+    All other components keep their sample covariance.
 
     Attributes:
         generator: provides iterator for measurements
         eps: Optional; distance between samples for DBSCAN clustering.
         min_samples: Optional; min number of samples for a group to be considered a cluster.
+        dtype: Optional; floating point type of the parameter arrays.
+        min_variance: Optional; eigenvalue floor of degenerate covariances in squared measurement
+          units, derived from the estimates with :func:`uwb.util.gaussian.variance_floor` on the
+          first build if not provided.
     """
 
-    def __init__(self, generator: BaseGenerator, eps=2, min_samples=3):
+    _param_names = ("weights", "means", "chol", "inv_chol", "log_det", "mask")
+
+    def __init__(
+        self,
+        generator: BaseGenerator,
+        eps=2,
+        min_samples=3,
+        dtype=np.float64,
+        min_variance=None,
+    ):
         """Pre-allocates data structures for parameter estimations."""
         super().__init__(generator)
         self.db = DBSCAN(eps=eps, min_samples=min_samples)
+        self.dtype = np.dtype(dtype)
+        self.min_variance = min_variance
+        self._dim = generator.dim
+        self._allocate(1)
+
+    def _get_params(self):
+        """Constructor arguments stored by :meth:`uwb.map.NoiseMap.save`."""
+        return {
+            "eps": self.db.eps,
+            "min_samples": self.db.min_samples,
+            "dtype": self.dtype.name,
+            "min_variance": self.min_variance,
+        }
 
-        def _rec_array(shapes):
-            if not shapes:
-                return []
-            else:
-                first = shapes.pop(0)
-                return [_rec_array(deepcopy(shapes)) for _ in range(first)]
+    @property
+    def covs(self):
+        """Covariances rebuilt from the Cholesky factors with format (..., K, d, d)."""
+        chol = np.asarray(self.chol)
+        return chol @ np.swapaxes(chol, -1, -2)
 
-        self.params = _rec_array(list(generator.shape))
-        self._dim = sum(map(lambda x: 1, list(generator.shape)))
+    def _allocate(self, K):
+        """Allocates parameter arrays for K components per position."""
+        shape = self.generator.shape + (K,)
+        d = self._dim
+        self.weights = np.zeros(shape, dtype=self.dtype)
+        self.means = np.zeros(shape + (d,), dtype=self.dtype)
+        self.chol = np.zeros(shape + (d, d), dtype=self.dtype)
+        self.inv_chol = np.zeros(shape + (d, d), dtype=self.dtype)
+        self.log_det = np.zeros(shape, dtype=self.dtype)
+        self.mask = np.zeros(shape, dtype=bool)
 
-    def gen(self):
+    def _grow(self, K):
+        """Pads the parameter arrays to K components per position."""
+        n = len(self.generator.shape)
+        for name in self._param_names:
+            param = getattr(self, name)
+            grown = np.zeros(param.shape[:n] + (K,) + param.shape[n + 1 :], param.dtype)
+            grown[(slice(None),) * n + (slice(0, param.shape[n]),)] = param
+            setattr(self, name, grown)
+
+    def gen(self, n_jobs=1, chunk_size=64):
         """Calculates estimates. (See paper W.Suski <https://ieeexplore.ieee.org/document/6514113>`)
 
         If DBSCAN finds a cluster with less than :attr:`min_samples` samples, they will be thrown
-        away.
+        away. Positions where DBSCAN finds no cluster at all are described by a single component
+        estimated from all samples.
+
+        Args:
+            n_jobs: Optional; number of processes fitting chunks of positions in parallel, -1
+              uses all cores. Results are identical to the serial build.
+            chunk_size: Optional; number of positions fitted per chunk.
         """
-        for (samples, idxs, pos) in self.generator:
-            db = self.db.fit(samples)
-            core_samples_mask = np.zeros_like(db.labels_, dtype=bool)
-            core_samples_mask[db.core_sample_indices_] = True
-            labels = db.labels_
-
-            n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-            n_noise = list(labels).count(-1)
-            param_list = reduce(lambda params, idx: params[idx], idxs, self.params)
-            used_data = samples.shape[0] - n_noise
-
-            weights = []
-            means = []
-            covariances = []
-
-            for i in range(n_clusters):
-                mask = labels == i
-                means.append(samples[mask, :].mean(axis=0) - pos)
-                covariances.append(np.cov(samples[mask, :].T))
-                weights.append(mask.sum() / used_data)
-
-            weights = np.stack(weights)
-            means = np.stack(means)
-            covariances = np.stack(covariances)
-            param_list.append((weights, means, covariances))
-
-    def sample_from(self, coordinates):
+        # chunks are written as they complete, the arrays grow with the number of components,
+        # sample covariances are staged in the Cholesky buffer and factorized in place
+        self._allocate(1)
+        for idxs, (weights, means, covs) in self._fit_chunks(
+            _fit_gm,
+            self.db.eps,
+            self.db.min_samples,
+            n_jobs=n_jobs,
+            chunk_size=chunk_size,
+        ):
+            if weights.shape[1] > self.weights.shape[-1]:
+                self._grow(weights.shape[1])
+            components = idxs + (slice(0, weights.shape[1]),)
+            self.weights[components] = weights
+            self.means[components] = means
+            self.chol[components] = covs
+            self.mask[components] = weights > 0
+        self._factorize()
+
+    def _factorize(self):
+        """Factorizes the sample covariances staged in :attr:`chol` in place.
+
+        Computes Cholesky factors, their inverses and log determinants of all components.
+        """
+        if self.min_variance is None:
+            self.min_variance = variance_floor(self.chol[self.mask])
+        covs = np.where(self.mask[..., None, None], self.chol, np.eye(self._dim))
+        chol = robust_cholesky(covs, self.min_variance)
+        self.chol[...] = chol
+        self.inv_chol[...] = np.linalg.inv(chol)
+        self.log_det[...] = log_determinant(chol)
+
+    def _log_weights(self, weights, log_det, mask):
+        """Log normalization constants plus log weights, -inf for padded components."""
+        log_norm = -0.5 * (self._dim * LOG_2PI + log_det)
+        with np.errstate(divide="ignore"):
+            return np.where(mask, np.log(weights) + log_norm, -np.inf)
+
+    def sample_from(self, coordinates, rng=None):
         """Samples for each coordinate using a Gaussian Mixture.
 
-        This is generally to slow for most applications. TODO C++/Numpy reimplementation.
+        Mixture components are selected for all coordinates at once by inverting the cumulative
+        weights, only the parameters of the selected components are gathered and all Gaussian
+        samples are drawn in a single batch.
+
+        Args:
+            coordinates: particles to find nearest positions from, which are used for sampling.
+            rng: Optional; numpy Generator or seed drawing components and samples.
         """
-        pos_coords, pos = self.generator.get_closest_position(coordinates)
-        samples = np.empty(pos_coords.shape, dtype=float)
-        for i, p in enumerate(pos_coords):
-            weights, means, covs = self[p]
-            selection = np.random.choice(np.arange(len(weights)), p=weights)
-            samples[i] = multivariate_normal.rvs(
-                mean=means[selection] + pos[i], cov=covs[selection]
-            )
-        return samples
+        rng = np.random.default_rng(rng)
+        cells, pos = self._lookup(coordinates)
+        selection = sample_categorical(self._gather(self.weights, cells), rng=rng)
+
+        means, chol = self._gather_components(cells, selection, ("means", "chol"))
+        return sample_mvn(means + pos, chol, rng=rng)
+
+    def _gather_components(self, cells, components, names):
+        """Gathers parameters of one component per flat cell index with a ``take`` each.
+
+        Returns:
+            list of the gathered arrays in the order of the names.
+        """
+        n = len(self.generator.shape)
+        flat = cells * self.weights.shape[n] + components
+        return [
+            np.take(param.reshape((-1,) + param.shape[n + 1 :]), flat, axis=0)
+            for param in (getattr(self, name) for name in names)
+        ]
 
     def conditioned_probability(self, z, particles):
         """Computes conditioned probabilities p(z|x) using Gaussian Mixtures.
 
         See :class:`uwb.map.NoiseMap` and :class:`uwb.map.NoiseMapNormal` for more information.
-        This is generally to slow for most applications. TODO C++/Numpy reimplementation.
+        Whitened component means and log weights are computed once per occupied cell and the
+        components of all particles are combined with a masked log-sum-exp.
         """
-        pos_coords, pos = self.generator.get_closest_position(particles)
-        prob = np.zeros((len(z)))
-        for i, p in enumerate(pos_coords):
-            weights, means, covs = self[p]
-            for j, w in enumerate(weights):
-                prob[i] += w * multivariate_normal.pdf(
-                    z[i], mean=means[j] + pos[i], cov=covs[j]
-                )
-        return prob
+        cells, pos = self._lookup(particles)
+        first, _, inverse = self._group_cells(cells)
+        inv_chol, means, weights, log_det, mask = self._gather_params(
+            cells[first], ("inv_chol", "means", "weights", "log_det", "mask")
+        )
+        shift = np.einsum("ukij,ukj->uki", inv_chol, means + pos[first][:, None, :])
+        white = np.einsum("nkij,nj->nki", inv_chol[inverse], z) - shift[inverse]
+        log_weights = self._log_weights(weights, log_det, mask)
+        log_prob = log_weights[inverse] - 0.5 * np.sum(white**2, axis=-1)
+        return np.exp(logsumexp(log_prob, axis=-1))
+
+    def _cell_log_likelihood(self, z, cells, pos, batch):
+        """Mixture log densities, see :meth:`uwb.map.NoiseMap._cell_log_likelihood`.
+
+        Mixture components are combined with a masked log-sum-exp.
+        """
+        K, d = self.weights.shape[-1], pos.shape[-1]
+        means, inv_chol, weights, log_det, mask = self._gather_params(
+            cells, ("means", "inv_chol", "weights", "log_det", "mask")
+        )
+        log_prob = mvn_log_pdf(
+            z[..., None, :, :],
+            (means + pos[:, None, :]).reshape(batch + (K, d)),
+            inv_chol.reshape(batch + (K, d, d)),
+            self._log_weights(weights, log_det, mask).reshape(batch + (K,)),
+        )  # (..., P, K, Z)
+        return logsumexp(log_prob, axis=-2)
 
     def __getitem__(self, item):
-        """Access to parameters given tuple indices."""
-        if len(item) == self._dim:
-            param_list = reduce(lambda params, idx: params[idx], item, self.params)
-            return param_list[0]
+        """Access to parameters (weights, means, covariances) given tuple indices."""
+        if len(item) == len(self.generator.shape):
+            item = tuple(item)
+            mask = self.mask[item]
+            chol = self.chol[item][mask]
+            return (
+                self.weights[item][mask],
+                self.means[item][mask],
+                chol @ np.swapaxes(chol, -1, -2),
+            )
+
+
+def _fit_gm(samples, counts, positions, eps, min_samples):
+    """Fits mixtures for a chunk of positions, padded to the largest number of components.
+
+    Args:
+        samples: Numpy array of the samples of all positions stacked with format (M, d).
+        counts: Numpy array of the number of samples per position with format (C,).
+        positions: Numpy array of the positions with format (C, d).
+        eps: DBSCAN distance.
+        min_samples: DBSCAN cluster size.
+    """
+    db = DBSCAN(eps=eps, min_samples=min_samples)
+    samples = np.split(samples, np.cumsum(counts)[:-1])
+    estimates = [_fit_mixture(db, s, pos) for s, pos in zip(samples, positions)]
+
+    K = max(len(weights) for weights, _, _ in estimates)
+    d = positions.shape[1]
+    weights = np.zeros((len(estimates), K))
+    means = np.zeros((len(estimates), K, d))
+    covs = np.zeros((len(estimates), K, d, d))
+    for i, (w, m, c) in enumerate(estimates):
+        weights[i, : len(w)] = w
+        means[i, : len(w)] = m
+        covs[i, : len(w)] = c
+    return weights, means, covs
+
+
+def _fit_mixture(db, samples, pos):
+    """Fits mixture parameters for the samples of a single position."""
+    labels = db.fit(samples).labels_
+    n_clusters = labels.max() + 1
+    if n_clusters == 0:
+        labels = np.zeros_like(labels)
+        n_clusters = 1
+
+    masks = labels == np.arange(n_clusters)[:, None]
+    weights = masks.sum(axis=1) / masks.sum()
+    means = np.stack([samples[mask].mean(axis=0) - pos for mask in masks])
+    covs = np.stack([np.cov(samples[mask].T) for mask in masks])
+    return weights, means, covs
@@ -1,7 +1,14 @@
 import numpy as np
-from scipy.stats import multivariate_normal
 
 from uwb.map import NoiseMap
+from uwb.util.gaussian import (
+    LOG_2PI,
+    log_determinant,
+    mvn_log_pdf,
+    robust_cholesky,
+    sample_mvn,
+    variance_floor,
+)
 
 
 class NoiseMapNormal(NoiseMap):
@@ -9,69 +16,321 @@ class NoiseMapNormal(NoiseMap):
 
     For given generator (see :class:`uwb.generator.BaseGenerator`) of arbitrary dimension,
     this class provides a noise map with sampling and conditional probabilities functionality.
+    Per position the map keeps the mean, the lower Cholesky factor of the covariance, its
+    inverse and the log determinant, so lookups only gather precomputed parameters. Sampling
+    needs the factor and likelihoods its inverse, both are kept as the hot paths would pay a
+    triangular solve per particle otherwise. Covariances are not stored, :attr:`covs` rebuilds
+    them from the factors. The raw estimate is kept as sample count and co-moments, i.e. the
+    sums of products of deviations from the mean, packed as lower triangle with format
+    (..., d * (d + 1) / 2).
+
+    Covariances of positions with no more samples than dimensions or collinear samples are
+    regularized by flooring their eigenvalues at :attr:`min_variance` when they are factorized,
+    such that they do not become spikes dominating the particle weights. All other positions
+    keep their sample covariance.
+
+    Estimates can be refined incrementally with :meth:`partial_fit`, which updates the counts,
+    means and co-moments per position (Welford). Parameters of updated positions are recomputed
+    lazily on the next query or an explicit :meth:`finalize`. Positions without samples so far
+    hold a standard normal distribution around the position. Read-only parameter arrays, e.g. of
+    a memory-mapped map from :meth:`uwb.map.NoiseMap.load`, are copied into memory on the first
+    :meth:`partial_fit`, the stored map is never modified.
 
     Attributes:
         generator: generator that provides measurements for given position
           this class must be iterable with valid format of (samples, idx, position).
+        dtype: Optional; floating point type of the parameter arrays, e.g. np.float32 to halve
+          the memory footprint.
+        min_variance: Optional; eigenvalue floor of degenerate covariances in squared measurement
+          units. If not provided it is derived from the estimates with
+          :func:`uwb.util.gaussian.variance_floor`, it is fixed by :meth:`gen` and follows the
+          estimates of maps built with :meth:`partial_fit` only.
     """
 
-    def __init__(self, generator):
+    _param_names = ("means", "chol", "inv_chol", "log_det", "counts", "comoments")
+
+    def __init__(self, generator, dtype=np.float64, min_variance=None):
         """Inits and allocates numpy arrays for parameters."""
         super().__init__(generator)
-        self.means = np.zeros(generator.shape + (len(generator.shape),))
-        self.covs = np.zeros(
-            generator.shape + (len(generator.shape),) + (len(generator.shape),)
+        d = generator.dim
+        self.dtype = np.dtype(dtype)
+        self.min_variance = min_variance
+        self.means = np.zeros(generator.shape + (d,), dtype=self.dtype)
+        self.chol = np.zeros(generator.shape + (d, d), dtype=self.dtype)
+        self.inv_chol = np.zeros(generator.shape + (d, d), dtype=self.dtype)
+        self.log_det = np.zeros(generator.shape, dtype=self.dtype)
+        self.counts = np.zeros(generator.shape, dtype=np.int64)
+        self.comoments = np.zeros(generator.shape + (d * (d + 1) // 2,), self.dtype)
+
+        # running estimates for partial_fit, flat over positions, allocated on first use
+        self._acc_means = None
+        self._comoments = None
+        self._dirty = None
+        self._regularized = None
+        self._floor = None
+
+    @property
+    def covs(self):
+        """Covariances rebuilt from the Cholesky factors with format (..., d, d)."""
+        chol = np.asarray(self.chol)
+        return chol @ np.swapaxes(chol, -1, -2)
+
+    def _get_params(self):
+        """Constructor arguments stored by :meth:`uwb.map.NoiseMap.save`."""
+        return {"dtype": self.dtype.name, "min_variance": self.min_variance}
+
+    def gen(self, n_jobs=1, chunk_size=256):
+        """Calculates estimates for a gaussian distribution
+
+        Covariances of degenerated positions (e.g. too few samples) are regularized here, such
+        that every position of the map provides a valid distribution. The eigenvalue floor is
+        fixed from the complete estimates if not provided.
+
+        Args:
+            n_jobs: Optional; number of processes fitting chunks of positions in parallel, -1
+              uses all cores. Results are identical to the serial build.
+            chunk_size: Optional; number of positions fitted per chunk.
+        """
+        for idxs, (means, comoments, counts) in self._fit_chunks(
+            _fit_normal, n_jobs=n_jobs, chunk_size=chunk_size
+        ):
+            self.means[idxs] = means
+            self.comoments[idxs] = comoments
+            self.counts[idxs] = counts
+        self._acc_means = self._comoments = self._dirty = None
+        if self.min_variance is None:
+            self.min_variance = self._variance_floor()
+        self._factorize(np.arange(self.counts.size), self.min_variance)
+
+    def partial_fit(self, samples, idxs):
+        """Folds new samples into the estimates without revisiting previous samples.
+
+        Counts, means and co-moments of the affected positions are merged with the statistics
+        of the new batch. Positions become dirty and are finalized lazily.
+
+        Args:
+            samples: Numpy array of measurements with format (N, d).
+            idxs: Numpy array of map indices per measurement with format (N, len(shape)) or a
+              single index tuple for all measurements.
+        """
+        samples = np.atleast_2d(np.asarray(samples, dtype=float))
+        idxs = np.broadcast_to(
+            np.asarray(idxs, dtype=int), (len(samples), self.counts.ndim)
+        )
+        if self._comoments is None:
+            self._init_accumulators()
+
+        flat = np.ravel_multi_index(tuple(idxs.T), self.generator.shape)
+        order = np.argsort(flat, kind="stable")
+        cells, starts, n_new = np.unique(
+            flat[order], return_index=True, return_counts=True
+        )
+
+        # statistics of the new batch per position, co-moments packed as lower triangle
+        rows, cols = np.tril_indices(samples.shape[1])
+        rel = (samples - self.generator.get_position(idxs))[order]
+        batch_means = np.add.reduceat(rel, starts) / n_new[:, None]
+        centered = rel - np.repeat(batch_means, n_new, axis=0)
+        batch_comoments = np.add.reduceat(centered[:, rows] * centered[:, cols], starts)
+
+        # merge with running statistics (Chan et al.)
+        counts = self.counts.reshape(-1)
+        n_old = counts[cells]
+        n = n_old + n_new
+        delta = batch_means - self._acc_means[cells]
+        self._acc_means[cells] += delta * (n_new / n)[:, None]
+        self._comoments[cells] += (
+            batch_comoments
+            + delta[:, rows] * delta[:, cols] * (n_old * n_new / n)[:, None]
+        )
+        counts[cells] = n
+        self._dirty[cells] = True
+
+    def finalize(self):
+        """Recomputes parameters of positions updated by :meth:`partial_fit`.
+
+        Without a fixed :attr:`min_variance` the floor is derived from the current estimates,
+        positions regularized with a previous floor are recomputed as well when it changes.
+        """
+        if self._dirty is None or not self._dirty.any():
+            return
+
+        cells = np.flatnonzero(self._dirty)
+        d = self.means.shape[-1]
+        self.means.reshape(-1, d)[cells] = self._acc_means[cells]
+        self.comoments.reshape(len(self._dirty), -1)[cells] = self._comoments[cells]
+
+        min_variance = self.min_variance
+        if min_variance is None:
+            min_variance = self._variance_floor()
+            if min_variance != self._floor:
+                cells = np.flatnonzero(self._dirty | self._regularized)
+                self._floor = min_variance
+        self._regularized[cells] = self._factorize(cells, min_variance)
+        self._dirty[cells] = False
+
+    def _init_accumulators(self):
+        """Initializes running statistics from the current estimates.
+
+        Read-only parameter arrays are replaced by writable copies and positions without
+        samples are set to a standard normal distribution.
+        """
+        for name in self._param_names:
+            array = getattr(self, name)
+            if not array.flags.writeable:
+                setattr(self, name, np.array(array))
+
+        d = self.means.shape[-1]
+        n = self.counts.reshape(-1)
+        empty = n == 0
+        self.chol.reshape(-1, d, d)[empty] = np.eye(d)
+        self.inv_chol.reshape(-1, d, d)[empty] = np.eye(d)
+        self.log_det.reshape(-1)[empty] = 0
+        self._acc_means = self.means.reshape(-1, d).astype(float)
+        self._comoments = self.comoments.reshape(n.size, -1).astype(float)
+        self._dirty = np.zeros(n.size, dtype=bool)
+        # the floor of stored estimates is unknown unless fixed, they are all recomputed once
+        self._regularized = (n > 0) & (self.min_variance is None)
+        self._floor = None
+
+    def _sample_covs(self, cells):
+        """Sample covariances of flat cells from the co-moments, NaN below two samples."""
+        d = self.means.shape[-1]
+        n = self.counts.reshape(-1)[cells]
+        covs = np.zeros((len(n), d, d))
+        rows, cols = np.tril_indices(d)
+        packed = self.comoments.reshape(self.counts.size, -1)[cells]
+        covs[:, rows, cols] = covs[:, cols, rows] = packed
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                (n > 1)[:, None, None], covs / (n - 1)[:, None, None], np.nan
+            )
+
+    def _variance_floor(self):
+        """Eigenvalue floor derived from the well estimated positions if there are any."""
+        d = self.means.shape[-1]
+        n = self.counts.reshape(-1)
+        cells = np.flatnonzero(n > d)
+        if len(cells) == 0:
+            cells = np.flatnonzero(n > 1)
+        return variance_floor(self._sample_covs(cells))
+
+    def _factorize(self, cells, min_variance):
+        """Precomputes Cholesky factors, their inverses and log determinants.
+
+        Args:
+            cells: Numpy array of flat indices of the positions to update.
+            min_variance: eigenvalue floor of degenerate covariances.
+
+        Returns:
+            Boolean Numpy array flagging the regularized positions.
+        """
+        d = self.means.shape[-1]
+        degenerate = self.counts.reshape(-1)[cells] <= d
+        chol, regularized = robust_cholesky(
+            self._sample_covs(cells), min_variance, degenerate, return_regularized=True
         )
+        self.chol.reshape(-1, d, d)[cells] = chol
+        self.inv_chol.reshape(-1, d, d)[cells] = np.linalg.inv(chol)
+        self.log_det.reshape(-1)[cells] = log_determinant(chol)
+        return regularized
 
-    def gen(self):
-        """Calculates estimates for a gaussian distribution"""
-        for (samples, idxs, pos) in self.generator:
-            self.means[idxs] = samples.mean(axis=0) - pos
-            self.covs[idxs] = np.cov(samples.T)
+    def _log_norm(self, log_det):
+        """Log normalization constants of distributions given their log determinants."""
+        return -0.5 * (self.means.shape[-1] * LOG_2PI + log_det)
 
     def conditioned_probability(self, z, particles):
         """Computes conditioned probabilities.
 
         Computes the conditioned probabilities p(z|x) where x is given by the nearest map position
-        in the map for the provided samples.
+        in the map for the provided samples. Whitened means and normalization constants are
+        computed once per occupied cell (see :attr:`uwb.map.NoiseMap.group_cells`).
 
         Args:
             z: Numpy array of measurements with format (N,d).
             particles: particles from the particle filter used for density estimation.
         """
-        pos_coord, pos = self.generator.get_closest_position(particles)
-        probs = np.empty(len(pos))
-
-        # couldn't find a faster way.. suggestions are appreciated
-        for i, (measurement, p, mean, cov) in enumerate(
-            zip(
-                z,
-                pos,
-                self.means[tuple(pos_coord.T.tolist())],
-                self.covs[tuple(pos_coord.T.tolist())],
-            )
-        ):
-            probs[i] = multivariate_normal.pdf(measurement, mean=mean + p, cov=cov)
+        self.finalize()
+        cells, pos = self._lookup(particles)
+        first, _, inverse = self._group_cells(cells)
+        inv_chol, means, log_det = self._gather_params(
+            cells[first], ("inv_chol", "means", "log_det")
+        )
+        shift = np.einsum("uij,uj->ui", inv_chol, means + pos[first])
+        white = np.einsum("nij,nj->ni", inv_chol[inverse], z) - shift[inverse]
+        return np.exp(
+            self._log_norm(log_det)[inverse] - 0.5 * np.sum(white**2, axis=-1)
+        )
 
-        return probs
+    def conditioned_log_likelihood(self, z, particles):
+        """Computes log p(z|x) for all measurements and particles.
 
-    def sample_from(self, coordinates):
+        See :meth:`uwb.map.NoiseMap.conditioned_log_likelihood`.
+
+        Args:
+            z: Numpy array of measurements with format (..., Z, d).
+            particles: Numpy array of particles with format (..., P, d).
+        """
+        self.finalize()
+        return super().conditioned_log_likelihood(z, particles)
+
+    def _cell_log_likelihood(self, z, cells, pos, batch):
+        """Gaussian log densities, see :meth:`uwb.map.NoiseMap._cell_log_likelihood`."""
+        d = pos.shape[-1]
+        means, inv_chol, log_det = self._gather_params(
+            cells, ("means", "inv_chol", "log_det")
+        )
+        return mvn_log_pdf(
+            z,
+            (means + pos).reshape(batch + (d,)),
+            inv_chol.reshape(batch + (d, d)),
+            self._log_norm(log_det).reshape(batch),
+        )
+
+    def sample_from(self, coordinates, rng=None):
         """Samples particles from a normal distribution.
 
-        Samples particles for given coordinates from a normal distribution.
+        Samples particles for given coordinates from a normal distribution. All samples are drawn
+        at once using the precomputed Cholesky factors.
 
         Args:
             coordinates: particles to find nearest positions from, which are used for sampling.
+            rng: Optional; numpy Generator or seed drawing the samples.
         """
-        samples = np.empty((len(coordinates), self.means.shape[-1]), dtype=float)
-        pos_coord, pos = self.generator.get_closest_position(coordinates)
-        for i, (p, mean, cov) in enumerate(
-            zip(
-                pos,
-                self.means[tuple(pos_coord.T.tolist())],
-                self.covs[tuple(pos_coord.T.tolist())],
-            )
-        ):
-            samples[i] = multivariate_normal.rvs(mean=mean, cov=cov) + p
+        self.finalize()
+        cells, pos = self._lookup(coordinates)
+        means, chol = self._gather_params(cells, ("means", "chol"))
+        return sample_mvn(means + pos, chol, rng=rng)
+
+
+def _fit_normal(samples, counts, positions):
+    """Estimates means relative to the positions, co-moments and sample counts of a chunk.
+
+    Co-moments are packed as lower triangle, see :class:`NoiseMapNormal`.
+
+    Args:
+        samples: Numpy array of the samples of all positions stacked with format (M, d).
+        counts: Numpy array of the number of samples per position with format (C,).
+        positions: Numpy array of the positions with format (C, d).
+    """
+    samples = samples.astype(float, copy=False)
+    C, d = positions.shape
+    rows, cols = np.tril_indices(d)
+    # equally sized positions are fitted at once
+    if np.all(counts == counts[0]):
+        samples = samples.reshape(C, counts[0], d)
+        means = samples.mean(axis=1)
+        centered = samples - means[:, None, :]
+        comoments = np.sum(centered[..., rows] * centered[..., cols], axis=1)
+        return means - positions, comoments, counts
 
-        return samples
+    segments = np.repeat(np.arange(C), counts)
+    sums = [np.bincount(segments, samples[:, j], C) for j in range(d)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.stack(sums, axis=-1) / counts[:, None]
+    centered = samples - means[segments]
+    comoments = [
+        np.bincount(segments, centered[:, j] * centered[:, k], C)
+        for j, k in zip(rows, cols)
+    ]
+    return means - positions, np.stack(comoments, axis=-1), counts
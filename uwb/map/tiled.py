@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from uwb.generator import BaseGenerator
+from uwb.map.noise_map import FORMAT_VERSION, NoiseMap
+from uwb.map.noise_map_gm import NoiseMapGM
+from uwb.map.noise_map_normal import NoiseMapNormal
+from uwb.util.registry import find_subclass
+
+
+def save_tiled(noise_map, path, tile_shape):
+    """Splits the parameters of a built map into spatial tiles stored in a directory.
+
+    Every tile holds the parameters of a block of :attr:`tile_shape` positions in one ``.npz``
+    file, tiles at the border are padded. Parameters are read tile by tile, so maps loaded
+    memory-mapped with :meth:`uwb.map.NoiseMap.load` are tiled without reading them at once.
+
+    Args:
+        noise_map: built noise map, e.g. :class:`uwb.map.NoiseMapNormal`.
+        path: directory to store the tiles in, created if it does not exist.
+        tile_shape: number of positions per tile along each axis of the generator shape.
+    """
+    shape = noise_map.generator.shape
+    tile_shape = tuple(int(t) for t in tile_shape)
+    if len(tile_shape) != len(shape):
+        raise ValueError(
+            "Tile shape %s does not match map shape %s" % (tile_shape, shape)
+        )
+
+    noise_map.finalize()
+    os.makedirs(os.path.join(path, "tiles"), exist_ok=True)
+    n_tiles = tuple(-(-s // t) for s, t in zip(shape, tile_shape))
+    for tile_id, tile in enumerate(np.ndindex(*n_tiles)):
+        block = tuple(slice(i * t, (i + 1) * t) for i, t in zip(tile, tile_shape))
+        arrays = {}
+        for name in noise_map._param_names:
+            param = np.asarray(getattr(noise_map, name)[block])
+            pad = [(0, t - s) for t, s in zip(tile_shape, param.shape)]
+            pad += [(0, 0)] * (param.ndim - len(shape))
+            param = np.pad(param, pad, mode="edge")
+            arrays[name] = param.reshape((-1,) + param.shape[len(shape) :])
+        np.savez(os.path.join(path, "tiles", "%d.npz" % tile_id), **arrays)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "map": type(noise_map).__name__,
+        "params": noise_map._get_params(),
+        "tile_shape": list(tile_shape),
+        "arrays": {
+            name: {
+                "shape": list(getattr(noise_map, name).shape),
+                "dtype": getattr(noise_map, name).dtype.name,
+            }
+            for name in noise_map._param_names
+        },
+        "generator": noise_map.generator.get_metadata(),
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:  # written last
+        json.dump(meta, f, indent=2)
+
+
+def load_tiled(path, max_tiles=64, generator=None):
+    """Opens a map stored with :func:`save_tiled`, tiles are loaded on demand.
+
+    Args:
+        path: directory the tiles were saved to.
+        max_tiles: Optional; number of tiles kept in memory.
+        generator: Optional; generator to use, restored from the stored metadata otherwise.
+    """
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    if meta["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            "Unsupported noise map format version %s" % meta["format_version"]
+        )
+
+    map_cls = find_subclass(NoiseMap, "Tiled" + meta["map"])
+    if map_cls is None:
+        raise ValueError("No tiled backend for map '%s'" % meta["map"])
+    if generator is None:
+        generator = BaseGenerator.from_metadata(meta["generator"])
+
+    store = TileStore(
+        os.path.join(path, "tiles"),
+        generator.shape,
+        meta["tile_shape"],
+        max_tiles=max_tiles,
+    )
+    arrays = {
+        name: TiledArray(store, name, tuple(array["shape"]), array["dtype"])
+        for name, array in meta["arrays"].items()
+    }
+    return map_cls(generator, arrays, **meta["params"])
+
+
+class TileStore:
+    """Loads tiles of a map from disk and keeps the most recently used ones in memory.
+
+    The store is thread-safe, e.g. for filters of several tags updating concurrently against
+    one map. Tiles are read from disk outside the lock.
+
+    Attributes:
+        tile_dir: directory with one ``.npz`` file per tile.
+        shape: shape of the map positions.
+        tile_shape: number of positions per tile along each axis.
+        max_tiles: Optional; number of tiles kept in memory.
+        hits: number of tile lookups served from memory.
+        misses: number of tile lookups that loaded the tile from disk.
+    """
+
+    def __init__(self, tile_dir, shape, tile_shape, max_tiles=64):
+        """Initializes an empty tile cache."""
+        self.tile_dir = tile_dir
+        self.shape = tuple(shape)
+        self.tile_shape = tuple(tile_shape)
+        self.n_tiles = tuple(-(-s // t) for s, t in zip(self.shape, self.tile_shape))
+        self.max_tiles = max_tiles
+        self.hits = 0
+        self.misses = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, arrays, cells):
+        """Gathers parameters for flat position indices spread over any number of tiles.
+
+        All parameters of a tile are gathered while it is loaded, so a batch touching more
+        tiles than :attr:`max_tiles` loads every tile once.
+
+        Args:
+            arrays: list of :class:`TiledArray` to gather.
+            cells: Numpy array of flat position indices with format (N,).
+
+        Returns:
+            list of the gathered arrays with format (N, ...) in the order of the arrays.
+        """
+        n = len(self.shape)
+        out = [
+            np.empty((len(cells),) + array.shape[n:], dtype=array.dtype)
+            for array in arrays
+        ]
+        multi = np.unravel_index(cells, self.shape)
+        tiles = np.ravel_multi_index(
+            tuple(m // t for m, t in zip(multi, self.tile_shape)), self.n_tiles
+        )
+        local = np.ravel_multi_index(
+            tuple(m % t for m, t in zip(multi, self.tile_shape)), self.tile_shape
+        )
+
+        # cells are grouped by tile, every tile is looked up once
+        order = np.argsort(tiles, kind="stable")
+        tile_ids, starts = np.unique(tiles[order], return_index=True)
+        for tile_id, selected in zip(tile_ids, np.split(order, starts[1:])):
+            tile = self.get(tile_id)
+            for array, gathered in zip(arrays, out):
+                gathered[selected] = tile[array.name][local[selected]]
+        return out
+
+    def get(self, tile_id):
+        """Parameters of a tile as dictionary of arrays, loaded from disk on a miss."""
+        tile_id = int(tile_id)
+        with self._lock:
+            tile = self._tiles.get(tile_id)
+            if tile is not None:
+                self.hits += 1
+                self._tiles.move_to_end(tile_id)
+                return tile
+            self.misses += 1
+
+        with np.load(os.path.join(self.tile_dir, "%d.npz" % tile_id)) as f:
+            tile = dict(f)
+        with self._lock:
+            # another thread may have loaded the tile meanwhile
+            tile = self._tiles.setdefault(tile_id, tile)
+            self._tiles.move_to_end(tile_id)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def __len__(self):
+        """Number of tiles in memory."""
+        return len(self._tiles)
+
+
+class TiledArray:
+    """Stand-in for a parameter array of a tiled map, elements are read through the tiles.
+
+    Attributes:
+        store: tile store holding the data.
+        name: name of the parameter array.
+        shape: shape of the full parameter array.
+        dtype: data type of the parameter array.
+    """
+
+    def __init__(self, store, name, shape, dtype):
+        """Describes the full array without loading it."""
+        self.store = store
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def ndim(self):
+        """Number of dimensions of the full array."""
+        return len(self.shape)
+
+    def take(self, cells):
+        """Gathers the array for flat position indices."""
+        return self.store.take([self], np.asarray(cells).reshape(-1))[0]
+
+    def __getitem__(self, item):
+        """Parameters of a single position given its full index tuple."""
+        cell = np.ravel_multi_index(item, self.store.shape)
+        return self.take([cell])[0]
+
+
+class TiledNoiseMap:
+    """Read-only noise map backend gathering parameters from tiles on demand.
+
+    Mixed into the dense maps, such that likelihoods and sampling run the same code. Tiles are
+    created from a built map with :func:`save_tiled` and opened with :func:`load_tiled`.
+    """
+
+    def _attach(self, arrays):
+        """Sets the tiled parameter arrays."""
+        self.store = next(iter(arrays.values())).store
+        for name in self._param_names:
+            setattr(self, name, arrays[name])
+
+    @property
+    def covs(self):
+        """Tiled maps hold no dense parameters, covariances are not rebuilt for the map."""
+        raise TypeError(
+            "Tiled noise maps provide no dense covariances, "
+            "gather the Cholesky factors of the positions of interest instead"
+        )
+
+    def _gather(self, param, cells):
+        """Gathers parameters for flat cell indices through the tile cache."""
+        return param.take(cells)
+
+    def _gather_params(self, cells, names):
+        """Gathers several parameters for flat cell indices in one pass over the tiles."""
+        return self.store.take([getattr(self, name) for name in names], cells)
+
+    def gen(self, *args, **kwargs):
+        """Tiled maps are read-only, build a dense map and tile it with :func:`save_tiled`."""
+        raise TypeError("Tiled noise maps are read-only")
+
+    def save(self, path):
+        """Tiled maps are read-only, see :func:`save_tiled`."""
+        raise TypeError("Tiled noise maps are read-only")
+
+
+class TiledNoiseMapNormal(TiledNoiseMap, NoiseMapNormal):
+    """Tiled backend of :class:`uwb.map.NoiseMapNormal`.
+
+    Attributes:
+        generator: generator providing the position lookup.
+        arrays: dictionary of :class:`TiledArray` per parameter.
+        dtype: Optional; floating point type of the parameter arrays.
+        min_variance: Optional; eigenvalue floor the map was built with.
+    """
+
+    def __init__(self, generator, arrays, dtype=np.float64, min_variance=None):
+        """Attaches the tiled parameters without allocating dense arrays."""
+        NoiseMap.__init__(self, generator)
+        self.dtype = np.dtype(dtype)
+        self.min_variance = min_variance
+        self._acc_means = self._comoments = self._dirty = None
+        self._attach(arrays)
+
+    def partial_fit(self, samples, idxs):
+        """Tiled maps are read-only."""
+        raise TypeError("Tiled noise maps are read-only")
+
+
+class TiledNoiseMapGM(TiledNoiseMap, NoiseMapGM):
+    """Tiled backend of :class:`uwb.map.NoiseMapGM`.
+
+    Attributes:
+        generator: generator providing the position lookup.
+        arrays: dictionary of :class:`TiledArray` per parameter.
+        eps: Optional; DBSCAN distance the map was built with.
+        min_samples: Optional; DBSCAN cluster size the map was built with.
+        dtype: Optional; floating point type of the parameter arrays.
+        min_variance: Optional; eigenvalue floor the map was built with.
+    """
+
+    def __init__(
+        self,
+        generator,
+        arrays,
+        eps=2,
+        min_samples=3,
+        dtype=np.float64,
+        min_variance=None,
+    ):
+        """Attaches the tiled parameters without allocating dense arrays."""
+        NoiseMap.__init__(self, generator)
+        self.db = DBSCAN(eps=eps, min_samples=min_samples)
+        self.dtype = np.dtype(dtype)
+        self.min_variance = min_variance
+        self._dim = generator.dim
+        self._attach(arrays)
+
+    def _gather_components(self, cells, components, names):
+        """Tiles hold whole positions, all components are gathered and one is selected."""
+        rows = np.arange(len(cells))
+        return [param[rows, components] for param in self._gather_params(cells, names)]
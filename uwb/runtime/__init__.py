@@ -0,0 +1,27 @@
+from uwb.runtime.pipeline import PipelineMetrics, TagQueue, TrackingPipeline
+from uwb.runtime.server import (
+    SharedNoiseMap,
+    TrackingServer,
+    attach_shared_map,
+    shard_of,
+)
+from uwb.runtime.sources import (
+    ReplaySource,
+    UDPSource,
+    decode_packet,
+    encode_packet,
+)
+
+__all__ = [
+    "PipelineMetrics",
+    "ReplaySource",
+    "SharedNoiseMap",
+    "TagQueue",
+    "TrackingPipeline",
+    "TrackingServer",
+    "UDPSource",
+    "attach_shared_map",
+    "decode_packet",
+    "encode_packet",
+    "shard_of",
+]
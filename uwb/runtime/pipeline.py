@@ -0,0 +1,242 @@
+import asyncio
+from collections import deque
+
+import numpy as np
+
+POLICIES = ("drop", "merge")
+
+
+class TagQueue:
+    """Bounded queue of pending measurement batches of a single tag.
+
+    If the queue is full the oldest batch is dropped to make room for the newest one.
+
+    Attributes:
+        max_pending: Optional; number of batches kept.
+    """
+
+    def __init__(self, max_pending=8):
+        """Initializes an empty queue."""
+        self.max_pending = max_pending
+        self.event = asyncio.Event()
+        self._batches = deque()
+
+    def put(self, measurements, received):
+        """Adds a batch and wakes up the consumer.
+
+        Returns:
+            Number of batches dropped to make room.
+        """
+        dropped = 0
+        while len(self._batches) >= self.max_pending:
+            self._batches.popleft()
+            dropped += 1
+        self._batches.append((measurements, received))
+        self.event.set()
+        return dropped
+
+    def take(self, now, latency_budget, policy="drop"):
+        """Removes the next batch to process.
+
+        Batches which waited longer than the latency budget are stale. With the ``drop`` policy
+        they are discarded, with ``merge`` they are concatenated with the next batch, such that
+        the filter catches up with a single update.
+
+        Args:
+            now: current monotonic time in seconds.
+            latency_budget: seconds a batch may wait, None never considers batches stale.
+            policy: Optional; one of :data:`POLICIES`.
+
+        Returns:
+            The measurements, the receive time of the oldest included batch and the number of
+            stale batches, or None if no batch is left.
+        """
+        stale = []
+        while (
+            self._batches
+            and latency_budget is not None
+            and now - self._batches[0][1] > latency_budget
+        ):
+            stale.append(self._batches.popleft())
+
+        if policy == "drop":
+            if not self._batches:
+                return None if not stale else (None, None, len(stale))
+            measurements, received = self._batches.popleft()
+            return measurements, received, len(stale)
+
+        if self._batches:
+            stale.append(self._batches.popleft())
+        if not stale:
+            return None
+        measurements = np.concatenate([m for m, _ in stale])
+        return measurements, stale[0][1], len(stale) - 1
+
+    def __len__(self):
+        """Number of pending batches."""
+        return len(self._batches)
+
+
+class PipelineMetrics:
+    """Queue depths, end-to-end latencies and counters of a :class:`TrackingPipeline`.
+
+    Latencies are measured from the arrival of a batch until its filter update finished.
+
+    Attributes:
+        max_latencies: Optional; number of most recent latencies kept.
+    """
+
+    def __init__(self, max_latencies=10000):
+        """Initializes empty metrics."""
+        self.queue_depth = {}
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=max_latencies)
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.merged = 0
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        """Latency percentiles in seconds, NaN before the first update."""
+        if not self.latencies:
+            return {p: float("nan") for p in percentiles}
+        values = np.percentile(np.fromiter(self.latencies, dtype=float), percentiles)
+        return dict(zip(percentiles, values.tolist()))
+
+    def snapshot(self):
+        """JSON serializable summary of the metrics."""
+        return {
+            "queue_depth": {str(tag): n for tag, n in self.queue_depth.items()},
+            "max_queue_depth": self.max_queue_depth,
+            "latency": {"p%d" % p: v for p, v in self.latency_percentiles().items()},
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "merged": self.merged,
+        }
+
+
+class TrackingPipeline:
+    """Feeds measurements of an asynchronous source into one particle filter per tag.
+
+    Batches are coalesced into a bounded :class:`TagQueue` per tag. Every tag is served by its
+    own task running :meth:`uwb.algorithm.ParticleFilter.step` in an executor, so the event
+    loop keeps receiving while filters update and a slow tag does not delay the others. Once
+    a tag falls behind the latency budget its stale batches are dropped or merged.
+
+    Attributes:
+        source: asynchronous iterable of ``(tag, measurements, received)`` tuples, see
+          :mod:`uwb.runtime.sources`.
+        filter_factory: callable creating the particle filter of a new tag given its id, e.g.
+          with a Generator of :func:`uwb.util.rng.tag_rng` per tag, since filters of different
+          tags update concurrently.
+        latency_budget: Optional; seconds a batch may wait before it is stale, None disables
+          stale handling.
+        max_pending: Optional; number of batches queued per tag.
+        policy: Optional; handling of stale batches, one of :data:`POLICIES`.
+        executor: Optional; executor running the filter updates, the default thread pool of
+          the event loop if not provided.
+    """
+
+    def __init__(
+        self,
+        source,
+        filter_factory,
+        latency_budget=0.1,
+        max_pending=8,
+        policy="drop",
+        executor=None,
+    ):
+        """Initializes queues and metrics."""
+        if policy not in POLICIES:
+            raise ValueError(
+                "Unknown policy '%s', expected one of %s" % (policy, list(POLICIES))
+            )
+        self.source = source
+        self.filter_factory = filter_factory
+        self.latency_budget = latency_budget
+        self.max_pending = max_pending
+        self.policy = policy
+        self.executor = executor
+        self.filters = {}
+        self.queues = {}
+        self.metrics = PipelineMetrics()
+        self._workers = {}
+        self._closed = False
+        self._stop = None
+
+    async def run(self):
+        """Processes the source until it is exhausted or :meth:`stop` is called.
+
+        Batches queued at that point are processed before returning.
+
+        Returns:
+            The :class:`PipelineMetrics` of the run.
+        """
+        self._closed = False
+        self._stop = asyncio.Event()
+        ingest = asyncio.ensure_future(self._ingest())
+        stop = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait([ingest, stop], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ingest.cancel()
+            stop.cancel()
+            (error,) = await asyncio.gather(ingest, return_exceptions=True)
+            self._closed = True
+            for queue in self.queues.values():
+                queue.event.set()
+            await asyncio.gather(*self._workers.values())
+        if isinstance(error, Exception):
+            raise error
+        return self.metrics
+
+    def stop(self):
+        """Stops receiving, queued batches are still processed."""
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _ingest(self):
+        """Distributes batches of the source to the tag queues."""
+        async for tag, measurements, received in self.source:
+            if tag not in self.queues:
+                self.queues[tag] = TagQueue(self.max_pending)
+                self.filters[tag] = self.filter_factory(tag)
+                self._workers[tag] = asyncio.ensure_future(self._serve(tag))
+
+            queue = self.queues[tag]
+            self.metrics.received += 1
+            self.metrics.dropped += queue.put(measurements, received)
+            self._record_depth(tag)
+
+    async def _serve(self, tag):
+        """Updates the filter of a tag whenever batches are pending."""
+        loop = asyncio.get_running_loop()
+        queue, pf = self.queues[tag], self.filters[tag]
+        while True:
+            await queue.event.wait()
+            queue.event.clear()
+            while True:
+                batch = queue.take(loop.time(), self.latency_budget, self.policy)
+                if batch is None:
+                    break
+                measurements, received, n_stale = batch
+                self._record_depth(tag)
+                if self.policy == "drop":
+                    self.metrics.dropped += n_stale
+                else:
+                    self.metrics.merged += n_stale
+                if measurements is None:
+                    continue
+
+                await loop.run_in_executor(self.executor, pf.step, measurements)
+                self.metrics.processed += 1
+                self.metrics.latencies.append(loop.time() - received)
+            if self._closed:
+                return
+
+    def _record_depth(self, tag):
+        """Updates the queue depth metrics of a tag."""
+        depth = len(self.queues[tag])
+        self.metrics.queue_depth[tag] = depth
+        self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, depth)
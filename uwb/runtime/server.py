@@ -0,0 +1,195 @@
+import multiprocessing
+import queue
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from uwb.map import NoiseMap
+
+
+def shard_of(tag, n_workers):
+    """Worker owning a tag, stable across processes and runs unlike :func:`hash`."""
+    return zlib.crc32(str(tag).encode("utf-8")) % n_workers
+
+
+class SharedNoiseMap:
+    """Places the parameter arrays of a built noise map once in shared memory.
+
+    The owning process creates one shared memory block per parameter array listed in the
+    ``_param_names`` of the map. Other processes restore the map from the picklable
+    :attr:`descriptor` with :func:`attach_shared_map`, their arrays are read-only views into
+    the shared blocks, so map memory does not grow with the number of workers.
+
+    Attributes:
+        noise_map: built noise map with in-memory or memory-mapped parameter arrays.
+    """
+
+    def __init__(self, noise_map: NoiseMap):
+        """Copies the parameter arrays into shared memory."""
+        noise_map.finalize()
+        self.descriptor = {"meta": noise_map.get_metadata(), "arrays": {}}
+        self._blocks = []
+        for name in noise_map._param_names:
+            array = np.asarray(getattr(noise_map, name))
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.descriptor["arrays"][name] = (
+                block.name,
+                array.shape,
+                array.dtype.str,
+            )
+
+    def close(self):
+        """Releases the shared memory blocks, attached maps must not be used afterwards."""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_shared_map(descriptor):
+    """Restores a noise map from a :class:`SharedNoiseMap` descriptor without copying.
+
+    The map keeps the shared memory blocks open for the lifetime of the map.
+    """
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in descriptor["arrays"].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+
+    noise_map = NoiseMap.from_arrays(descriptor["meta"], arrays)
+    noise_map._shared_blocks = blocks
+    return noise_map
+
+
+class TrackingServer:
+    """Tracks tags in a pool of worker processes sharing one noise map.
+
+    Tags are sharded over the workers by :func:`shard_of`, so all batches of a tag are handled
+    by the same worker, which keeps the particle filter of the tag in its own memory. The map
+    parameters live once in shared memory (see :class:`SharedNoiseMap`).
+
+    Every processed batch yields a ``(tag, estimate, ess)`` result with the weighted mean of
+    the particles, see :meth:`results`.
+
+    Attributes:
+        noise_map: built noise map shared by all workers.
+        filter_factory: picklable callable creating the filter of a new tag given the tag id and
+          the noise map of the worker, e.g. a module level function.
+          Filters seeded with :func:`uwb.util.rng.tag_rng` give the same results for any
+          number of workers.
+        n_workers: Optional; number of worker processes, -1 uses all cores.
+        mp_context: Optional; multiprocessing context, the default context if not provided.
+    """
+
+    def __init__(self, noise_map, filter_factory, n_workers=-1, mp_context=None):
+        """Initializes the server, workers are started by :meth:`start`."""
+        self.noise_map = noise_map
+        self.filter_factory = filter_factory
+        self.n_workers = multiprocessing.cpu_count() if n_workers == -1 else n_workers
+        self.mp_context = mp_context or multiprocessing.get_context()
+        self._shared = None
+        self._workers = []
+        self._inboxes = []
+        self._outbox = None
+
+    def start(self):
+        """Shares the map and starts the workers."""
+        self._shared = SharedNoiseMap(self.noise_map)
+        self._outbox = self.mp_context.Queue()
+        for _ in range(self.n_workers):
+            inbox = self.mp_context.Queue()
+            worker = self.mp_context.Process(
+                target=_serve,
+                args=(
+                    self._shared.descriptor,
+                    self.filter_factory,
+                    inbox,
+                    self._outbox,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self._inboxes.append(inbox)
+            self._workers.append(worker)
+
+    def submit(self, tag, z):
+        """Sends a measurement batch with format (Z, d) to the worker owning the tag."""
+        self._inboxes[shard_of(tag, self.n_workers)].put((tag, np.asarray(z)))
+
+    def results(self, timeout=None):
+        """Collects results of processed batches.
+
+        Args:
+            timeout: Optional; seconds to wait for the first result, returns the results
+              available right away if not provided.
+
+        Returns:
+            List of ``(tag, estimate, ess)`` tuples.
+        """
+        results = []
+        try:
+            if timeout is not None:
+                results.append(self._outbox.get(timeout=timeout))
+            while True:
+                results.append(self._outbox.get_nowait())
+        except queue.Empty:
+            pass
+        return results
+
+    def stop(self):
+        """Lets the workers finish their pending batches and releases the shared map.
+
+        Does nothing if the server is not running.
+
+        Returns:
+            Results not collected by :meth:`results` so far.
+        """
+        if self._shared is None:
+            return []
+
+        for inbox in self._inboxes:
+            inbox.put(None)
+
+        # results are drained while waiting, workers block on exit with unread results
+        results = []
+        for worker in self._workers:
+            while worker.is_alive():
+                results += self.results(timeout=0.1)
+                worker.join(timeout=0.1)
+        results += self.results()
+
+        self._shared.close()
+        self._shared = None
+        self._workers, self._inboxes = [], []
+        return results
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _serve(descriptor, filter_factory, inbox, outbox):
+    """Worker loop updating the filters of its tags until it receives None."""
+    noise_map = attach_shared_map(descriptor)
+    filters = {}
+    for tag, z in iter(inbox.get, None):
+        if tag not in filters:
+            filters[tag] = filter_factory(tag, noise_map)
+        pf = filters[tag]
+        pf.step(z)
+        outbox.put((tag, pf.estimate(), float(np.mean(pf.ess))))
@@ -0,0 +1,145 @@
+import asyncio
+import struct
+
+import numpy as np
+
+# header of measurement packets: tag id, sender timestamp, number of measurements, dimension
+PACKET_HEADER = struct.Struct("<IdHH")
+
+
+def encode_packet(tag, measurements, timestamp=0.0):
+    """Encodes a measurement batch of a tag as binary packet with float32 payload.
+
+    Args:
+        tag: integer id of the tag.
+        measurements: Numpy array of measurements with format (Z, d).
+        timestamp: Optional; sender timestamp in seconds.
+    """
+    measurements = np.ascontiguousarray(measurements, dtype="<f4")
+    n, dim = measurements.shape
+    return PACKET_HEADER.pack(tag, timestamp, n, dim) + measurements.tobytes()
+
+
+def decode_packet(data):
+    """Decodes a packet written by :func:`encode_packet`.
+
+    Returns:
+        Tag id, sender timestamp and measurements with format (Z, d).
+    """
+    tag, timestamp, n, dim = PACKET_HEADER.unpack_from(data)
+    if len(data) != PACKET_HEADER.size + 4 * n * dim:
+        raise ValueError("Packet of tag %d is truncated" % tag)
+    measurements = np.frombuffer(data, dtype="<f4", offset=PACKET_HEADER.size)
+    return tag, timestamp, measurements.reshape(n, dim)
+
+
+class UDPSource:
+    """Receives measurement packets (see :func:`encode_packet`) on a UDP socket.
+
+    Iterating the source asynchronously yields ``(tag, measurements, received)`` tuples, where
+    received is the monotonic event loop time of arrival. Packets are buffered in a bounded
+    queue, if the consumer falls behind further packets are dropped and counted in
+    :attr:`dropped`. Malformed packets are counted in :attr:`malformed`.
+
+    Attributes:
+        host: Optional; address to bind to.
+        port: Optional; port to bind to, 0 picks a free port (see :attr:`address`).
+        max_buffered: Optional; number of packets buffered before dropping.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, max_buffered=1024):
+        """Initializes the source, the socket is bound by :meth:`start`."""
+        self.host = host
+        self.port = port
+        self.max_buffered = max_buffered
+        self.address = None
+        self.dropped = 0
+        self.malformed = 0
+        self._transport = None
+        self._queue = None
+
+    async def start(self):
+        """Binds the socket, called on first iteration if not invoked previously."""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_buffered)
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=(self.host, self.port)
+        )
+        self.address = self._transport.get_extra_info("sockname")
+
+    def close(self):
+        """Closes the socket."""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def __aiter__(self):
+        return self._packets()
+
+    async def _packets(self):
+        if self._transport is None:
+            await self.start()
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            self.close()
+
+    def _receive(self, data):
+        """Decodes a datagram and buffers it."""
+        try:
+            tag, _, measurements = decode_packet(data)
+        except (struct.error, ValueError):
+            self.malformed += 1
+            return
+        try:
+            self._queue.put_nowait(
+                (tag, measurements, asyncio.get_running_loop().time())
+            )
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Forwards datagrams to a :class:`UDPSource`."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def datagram_received(self, data, addr):
+        self.source._receive(data)
+
+
+class ReplaySource:
+    """Local stand-in for a live source replaying recorded batches of several tags.
+
+    Batches are yielded round robin over the tags as ``(tag, measurements, received)`` tuples
+    like :class:`UDPSource`, one round every :attr:`interval` seconds, until all streams are
+    exhausted.
+
+    Attributes:
+        streams: dictionary of tag ids to iterables of measurement batches, e.g.
+          :class:`uwb.generator.FileMeasurements`.
+        interval: Optional; seconds between two rounds, 0 replays as fast as possible.
+    """
+
+    def __init__(self, streams, interval=0.0):
+        """Initializes the streams."""
+        self.streams = streams
+        self.interval = interval
+
+    def __aiter__(self):
+        return self._packets()
+
+    async def _packets(self):
+        loop = asyncio.get_running_loop()
+        streams = {tag: iter(stream) for tag, stream in self.streams.items()}
+        while streams:
+            for tag, stream in list(streams.items()):
+                try:
+                    measurements = next(stream)
+                except StopIteration:
+                    del streams[tag]
+                    continue
+                yield tag, np.asarray(measurements), loop.time()
+            await asyncio.sleep(self.interval)
@@ -1,6 +1,13 @@
+from omegaconf import OmegaConf
+
+import uwb
 from uwb.algorithm import BasicParticleFilter, DynamicModel, MNMAParticleFilter
 from uwb.generator import BlobGenerator
 from uwb.map import NoiseMapGM, NoiseMapNormal
+from uwb.util.cache import cache_key
+
+# config entries which change how a map is built but not the built map itself
+BUILD_ONLY_KEYS = ("n_jobs", "storage")
 
 
 def create_blob_gen(cfg):
@@ -12,6 +19,8 @@ def create_blob_gen(cfg):
         measurements_per_location=cfg.generator.measurements_per_location,
         modal_range=cfg.generator.modal_range,
         deviation=cfg.generator.deviation,
+        rng=cfg.seed,
+        storage=cfg.generator.storage,
     )
 
 
@@ -33,26 +42,74 @@ def create_gm_noise_map(cfg, gen):
     )
 
 
-def create_basic_pf(cfg, init_particles, init_weights):
+def create_noise_map(cfg, cache=None):
+    """Creates the generator and builds the noise map of the config.
+
+    With a :class:`uwb.util.cache.MapCache` a previously built map with the same key (see
+    :func:`noise_map_cache_key`) is loaded instead of being rebuilt.
+    """
+    key = None
+    if cache is not None:
+        key = noise_map_cache_key(cfg)
+        noise_map = cache.get(key)
+        if noise_map is not None:
+            return noise_map
+
+    gen = create_blob_gen(cfg)
+    if cfg.map.name == "NoiseMapNormal":
+        noise_map = create_normal_noise_map(cfg, gen)
+    elif cfg.map.name == "NoiseMapGM":
+        noise_map = create_gm_noise_map(cfg, gen)
+    else:
+        raise ValueError("No noise map provided")
+    noise_map.gen(n_jobs=cfg.map.n_jobs)
+
+    if cache is not None:
+        cache.put(key, noise_map)
+    return noise_map
+
+
+def noise_map_cache_key(cfg):
+    """Hash of everything a built map depends on.
+
+    These are the resolved generator and map config sections without build only entries, the
+    seed and the package version.
+    """
+    sections = []
+    for section in (cfg.generator, cfg.map):
+        section = OmegaConf.to_container(section, resolve=True)
+        sections.append({k: v for k, v in section.items() if k not in BUILD_ONLY_KEYS})
+    return cache_key(*sections, cfg.seed, uwb.__version__)
+
+
+def create_basic_pf(cfg, init_particles, init_weights, dynamics=None, rng=None):
     assert cfg.algorithm.name == "BasicParticleFilter"
 
     return BasicParticleFilter(
         init_particles=init_particles,
         init_weights=init_weights,
+        resample_scheme=cfg.algorithm.resample_scheme,
+        ess_threshold=cfg.algorithm.ess_threshold,
+        dynamics=dynamics,
+        rng=rng,
     )
 
 
-def create_mnmapf(cfg, init_particles, init_weights, map):
+def create_mnmapf(cfg, init_particles, init_weights, map, dynamics=None, rng=None):
     assert cfg.algorithm.name == "MNMAParticleFilter"
 
     return MNMAParticleFilter(
         init_particles=init_particles,
         init_weights=init_weights,
         map=map,
+        resample_scheme=cfg.algorithm.resample_scheme,
+        ess_threshold=cfg.algorithm.ess_threshold,
+        dynamics=dynamics,
+        rng=rng,
     )
 
 
-def create_dyn_model(cfg):
+def create_dyn_model(cfg, rng=None):
     assert cfg.dynamics.name == "DynamicModel"
 
-    return DynamicModel(std=cfg.dynamics.std)
+    return DynamicModel(std=cfg.dynamics.std, rng=rng)
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+from uwb.map import NoiseMap
+
+
+def cache_key(*parts):
+    """Content hash of JSON serializable parts, e.g. resolved config sections."""
+    content = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class MapCache:
+    """Content addressed cache of built noise maps in a local directory.
+
+    Every entry is a map stored with :meth:`uwb.map.NoiseMap.save` in a directory named by its
+    key. Entries are touched on every hit and the least recently used ones are evicted once the
+    cache grows beyond :attr:`max_size` bytes.
+
+    Attributes:
+        cache_dir: directory holding the cache entries.
+        max_size: Optional; maximal size of all entries in bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=1024**3):
+        """Creates the cache directory if necessary."""
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key, mmap=True):
+        """Loads the map stored under the key or returns None on a miss."""
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        os.utime(path)  # marks entry as recently used
+        return NoiseMap.load(path, mmap=mmap)
+
+    def put(self, key, noise_map):
+        """Stores a built map under the key and evicts least recently used entries."""
+        path = os.path.join(self.cache_dir, key)
+        tmp_path = os.path.join(self.cache_dir, ".tmp-" + uuid.uuid4().hex)
+        # unlike mkdtemp, which is private to the owner, mkdir applies the umask
+        os.mkdir(tmp_path, 0o777)
+        noise_map.save(tmp_path)
+        try:
+            # atomic, concurrent jobs never see partial entries
+            os.rename(tmp_path, path)
+        except OSError:  # entry was stored concurrently
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits :attr:`max_size`."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:  # the most recent entry is always kept
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,134 @@
+import numpy as np
+
+LOG_2PI = np.log(2 * np.pi)
+
+# floor of covariance eigenvalues in map estimates relative to the median variance
+MIN_VARIANCE_RATIO = 0.1
+
+
+def robust_cholesky(
+    covs, min_variance=0.0, degenerate=None, eps=1e-9, return_regularized=False
+):
+    """Computes lower Cholesky factors for a batch of covariance matrices.
+
+    Only degenerate covariances are regularized, i.e. non finite ones, ones flagged by
+    ``degenerate`` (e.g. estimated from no more samples than dimensions) and ones which are not
+    positive definite. Their eigenvalues are clipped to a floor, non finite covariances are
+    replaced by the identity before. All other covariances are factorized unchanged.
+
+    Args:
+        covs: Numpy array of covariances with format (..., d, d).
+        min_variance: Optional; absolute eigenvalue floor of degenerate covariances in squared
+          measurement units, e.g. from :func:`variance_floor`.
+        degenerate: Optional; boolean Numpy array with format (...) flagging covariances which
+          are regularized in any case.
+        eps: Optional; relative eigenvalue floor keeping the factorization numerically valid.
+        return_regularized: Optional; additionally returns a boolean Numpy array with format
+          (...) flagging the regularized covariances.
+    """
+    covs = np.array(covs, dtype=float)
+    d = covs.shape[-1]
+    flat = covs.reshape(-1, d, d)
+    regularize = ~np.isfinite(flat).all(axis=(-2, -1))
+    flat[regularize] = np.eye(d)
+    if degenerate is not None:
+        regularize |= np.broadcast_to(degenerate, covs.shape[:-2]).reshape(-1)
+
+    chol = np.zeros_like(flat)
+    try:
+        chol[~regularize] = np.linalg.cholesky(flat[~regularize])
+    except np.linalg.LinAlgError:
+        # covariances which are not positive definite are found by their eigenvalues
+        eig_vals = np.linalg.eigvalsh(flat)
+        floor = eps * np.maximum(np.abs(eig_vals).max(axis=-1), 1.0)
+        regularize |= eig_vals[:, 0] <= floor
+        chol[~regularize] = np.linalg.cholesky(flat[~regularize])
+
+    if regularize.any():
+        eig_vals, eig_vecs = np.linalg.eigh(flat[regularize])
+        floor = eps * np.maximum(np.abs(eig_vals).max(axis=-1, keepdims=True), 1.0)
+        eig_vals = np.maximum(eig_vals, np.maximum(floor, min_variance))
+        chol[regularize] = np.linalg.cholesky(
+            (eig_vecs * eig_vals[..., None, :]) @ np.swapaxes(eig_vecs, -1, -2)
+        )
+    chol = chol.reshape(covs.shape)
+    if return_regularized:
+        return chol, regularize.reshape(covs.shape[:-2])
+    return chol
+
+
+def variance_floor(covs, ratio=MIN_VARIANCE_RATIO):
+    """Eigenvalue floor relative to the typical variance of a batch of covariances.
+
+    Rank deficient covariances, e.g. of clusters with fewer samples than dimensions, would
+    otherwise become spikes with a tiny determinant which dominate or annihilate the weights
+    of particles. Flooring their eigenvalues at a fraction of the median variance of the
+    estimates ties the regularization to the scale of the measurements.
+
+    Args:
+        covs: Numpy array of covariances with format (..., d, d), non finite ones are ignored.
+        ratio: Optional; fraction of the median variance.
+
+    Returns:
+        The floor, zero if no covariance is finite.
+    """
+    covs = np.asarray(covs, dtype=float)
+    variances = np.trace(covs, axis1=-2, axis2=-1).reshape(-1) / covs.shape[-1]
+    variances = variances[np.isfinite(variances)]
+    if len(variances) == 0:
+        return 0.0
+    return float(ratio * np.median(variances))
+
+
+def log_determinant(chol):
+    """Log determinants of covariances given by their lower Cholesky factors."""
+    return 2 * np.log(np.diagonal(chol, axis1=-2, axis2=-1)).sum(axis=-1)
+
+
+def log_normalizer(chol):
+    """Log normalization constant of Gaussians given by their lower Cholesky factors."""
+    return -0.5 * (chol.shape[-1] * LOG_2PI + log_determinant(chol))
+
+
+def mvn_log_pdf(x, means, inv_chol, log_norm):
+    """Evaluates Gaussian log densities for every pair of sample and distribution.
+
+    Args:
+        x: Numpy array of samples with format (..., Z, d).
+        means: Numpy array of means with format (..., P, d).
+        inv_chol: Numpy array of inverse lower Cholesky factors with format (..., P, d, d).
+        log_norm: Numpy array of log normalization constants with format (..., P,).
+
+    Returns:
+        Numpy array of log densities with format (..., P, Z).
+    """
+    x_t = np.swapaxes(x, -1, -2)[..., None, :, :]  # (..., 1, d, Z)
+    white = inv_chol @ x_t - (inv_chol @ means[..., None])  # (..., P, d, Z)
+    return log_norm[..., None] - 0.5 * np.sum(white**2, axis=-2)
+
+
+def sample_mvn(means, chol, rng=None):
+    """Draws one sample from each Gaussian with a single standard normal draw.
+
+    Args:
+        means: Numpy array of means with format (..., d).
+        chol: Numpy array of lower Cholesky factors with format (..., d, d).
+        rng: Optional; numpy Generator or seed drawing the noise.
+    """
+    noise = np.random.default_rng(rng).standard_normal(means.shape)
+    return means + np.einsum("...ij,...j->...i", chol, noise)
+
+
+def sample_categorical(weights, rng=None):
+    """Draws one category per row by inverting the cumulative weights.
+
+    Args:
+        weights: Numpy array of (unnormalized) weights with format (N, K).
+        rng: Optional; numpy Generator or seed drawing the uniform samples.
+    """
+    acc_weights = np.cumsum(weights, axis=-1)
+    uniform_samples = (
+        np.random.default_rng(rng).random((len(weights), 1)) * acc_weights[:, -1:]
+    )
+    selection = np.sum(acc_weights <= uniform_samples, axis=-1)
+    return np.minimum(selection, weights.shape[-1] - 1)
@@ -0,0 +1,379 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from uwb.algorithm import ParticleFilter
+from uwb.generator import BaseGenerator
+from uwb.map import NoiseMap
+
+# upper bounds of the duration histogram buckets in seconds
+DURATION_BUCKETS = (
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _n_rows(x):
+    """Number of rows of an array (..., d) or a sequence of such arrays."""
+    if x is None:
+        return 0
+    if isinstance(x, (list, tuple)):
+        return sum(_n_rows(b) for b in x)
+    return int(np.prod(np.shape(x)[:-1]))
+
+
+def _particle_counts(pf, args):
+    return {"particles": int(np.size(pf.weights))}
+
+
+def _update_counts(pf, args):
+    return {"particles": int(np.size(pf.weights)), "measurements": _n_rows(args[0])}
+
+
+def _filter_gauges(pf):
+    """Mean effective sample size and weight entropy over all particle sets."""
+    w = pf.weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.sum(np.where(w > 0, w * np.log(w), 0.0), axis=-1)
+    return {"ess": float(np.mean(pf.ess)), "entropy": float(np.mean(entropy))}
+
+
+def _likelihood_counts(noise_map, args):
+    return {"measurements": _n_rows(args[0]), "particles": _n_rows(args[1])}
+
+
+def _lookup_counts(obj, args):
+    return {"particles": _n_rows(args[0])}
+
+
+# instrumented methods: base class, method, stage name, counts and gauges after the call
+STAGES = (
+    (ParticleFilter, "update_weights", "filter.update_weights", _update_counts, None),
+    (ParticleFilter, "_reweight", "filter.normalize", _particle_counts, _filter_gauges),
+    (ParticleFilter, "resample", "filter.resample", _particle_counts, _filter_gauges),
+    (
+        NoiseMap,
+        "conditioned_probability",
+        "map.conditioned_probability",
+        _likelihood_counts,
+        None,
+    ),
+    (
+        NoiseMap,
+        "conditioned_log_likelihood",
+        "map.conditioned_log_likelihood",
+        _likelihood_counts,
+        None,
+    ),
+    (NoiseMap, "sample_from", "map.sample_from", _lookup_counts, None),
+    (
+        BaseGenerator,
+        "get_closest_position",
+        "generator.get_closest_position",
+        _lookup_counts,
+        None,
+    ),
+    (
+        BaseGenerator,
+        "get_closest_cell",
+        "generator.get_closest_cell",
+        _lookup_counts,
+        None,
+    ),
+)
+
+
+class Instrumentation:
+    """Opt-in per-stage timers and filter statistics published to a sink.
+
+    While enabled, the methods listed in :data:`STAGES` are replaced by timing wrappers on their
+    base class and every subclass defining them. Each call records its duration, particle and
+    measurement counts and, for filter stages, the effective sample size and weight entropy.
+    Timers are inclusive, e.g. ``filter.update_weights`` contains the map likelihood. Disabling
+    restores the original methods, so there is no overhead while instrumentation is off.
+
+    Only one instrumentation can be enabled at a time. Subclasses defined while enabled are not
+    instrumented.
+
+    Example::
+
+        with Instrumentation(HistogramSink()) as instrumentation:
+            pf.update_weights(z)
+        instrumentation.sink.summary()
+
+    Attributes:
+        sink: receives the records, see :class:`Sink`.
+        stages: Optional; names of the stages to instrument, all of :data:`STAGES` by default.
+        clock: Optional; monotonic clock in seconds.
+    """
+
+    _enabled = None
+
+    def __init__(self, sink, stages=None, clock=time.perf_counter):
+        """Initializes the instrumentation, methods are patched by :meth:`enable`."""
+        self.sink = sink
+        self.stages = stages
+        self.clock = clock
+        self._patched = []
+        self._active = threading.local()
+
+    def enable(self):
+        """Replaces the instrumented methods by timing wrappers."""
+        if Instrumentation._enabled is not None:
+            raise RuntimeError("Another instrumentation is enabled")
+        Instrumentation._enabled = self
+
+        for base, name, stage, counts, gauges in STAGES:
+            if self.stages is not None and stage not in self.stages:
+                continue
+            for cls in _class_tree(base):
+                if name in cls.__dict__:
+                    method = cls.__dict__[name]
+                    self._patched.append((cls, name, method))
+                    setattr(cls, name, self._wrap(method, stage, counts, gauges))
+
+    def disable(self):
+        """Restores the original methods and flushes the sink."""
+        for cls, name, method in reversed(self._patched):
+            setattr(cls, name, method)
+        self._patched = []
+        if Instrumentation._enabled is self:
+            Instrumentation._enabled = None
+        self.sink.flush()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def _wrap(self, method, stage, counts, gauges):
+        """Timing wrapper of a method, nested calls of the same stage are recorded once."""
+        active = self._active
+        clock = self.clock
+        sink = self.sink
+
+        @functools.wraps(method)
+        def wrapper(obj, *args, **kwargs):
+            stages = active.__dict__.setdefault("stages", set())
+            if stage in stages:  # e.g. a subclass calling the instrumented super method
+                return method(obj, *args, **kwargs)
+
+            stages.add(stage)
+            start = clock()
+            try:
+                return method(obj, *args, **kwargs)
+            finally:
+                duration = clock() - start
+                stages.discard(stage)
+                values = counts(obj, args)
+                values["duration"] = duration
+                if gauges is not None:
+                    values.update(gauges(obj))
+                sink.record(stage, values)
+
+        return wrapper
+
+
+def _class_tree(cls):
+    """The class and all its (transitive) subclasses."""
+    classes = [cls]
+    for subclass in cls.__subclasses__():
+        classes += [c for c in _class_tree(subclass) if c not in classes]
+    return classes
+
+
+class Sink:
+    """Base class of instrumentation sinks."""
+
+    def record(self, stage, values):
+        """Receives the values of one instrumented call.
+
+        Args:
+            stage: name of the stage, see :data:`STAGES`.
+            values: dictionary with ``duration`` in seconds and ``particles``, optionally
+              ``measurements``, ``ess`` and ``entropy``.
+        """
+        pass
+
+    def flush(self):
+        """Publishes buffered records."""
+        pass
+
+    def close(self):
+        """Releases resources of the sink."""
+        pass
+
+
+class HistogramSink(Sink):
+    """Aggregates records in memory per stage.
+
+    Durations are counted in histogram buckets, particles and measurements are summed up and
+    the most recent ESS and entropy are kept.
+
+    Attributes:
+        buckets: Optional; increasing upper bounds of the duration buckets in seconds.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        """Initializes empty statistics."""
+        self.buckets = tuple(buckets)
+        self.stats = {}
+
+    def record(self, stage, values):
+        """Adds the values of one call to the statistics of the stage."""
+        stats = self.stats.get(stage)
+        if stats is None:
+            stats = self.stats[stage] = {
+                "count": 0,
+                "duration": 0.0,
+                "particles": 0,
+                "measurements": 0,
+                "histogram": [0] * (len(self.buckets) + 1),
+            }
+        duration = values["duration"]
+        stats["count"] += 1
+        stats["duration"] += duration
+        stats["histogram"][bisect.bisect_left(self.buckets, duration)] += 1
+        stats["particles"] += values.get("particles", 0)
+        stats["measurements"] += values.get("measurements", 0)
+        for gauge in ("ess", "entropy"):
+            if gauge in values:
+                stats[gauge] = values[gauge]
+
+    def summary(self):
+        """Call counts, mean durations and totals per stage."""
+        return {
+            stage: {
+                "count": stats["count"],
+                "mean_duration": stats["duration"] / stats["count"],
+                "total_duration": stats["duration"],
+                "particles": stats["particles"],
+                "measurements": stats["measurements"],
+                **{g: stats[g] for g in ("ess", "entropy") if g in stats},
+            }
+            for stage, stats in self.stats.items()
+        }
+
+
+class JsonLinesSink(Sink):
+    """Appends every record as JSON line to a file.
+
+    Attributes:
+        path: path of the file.
+    """
+
+    def __init__(self, path):
+        """Opens the file for appending."""
+        self.path = path
+        self._file = open(path, "a")
+
+    def record(self, stage, values):
+        """Writes one line with wall clock time, stage and values."""
+        self._file.write(
+            json.dumps({"time": time.time(), "stage": stage, **values}) + "\n"
+        )
+
+    def flush(self):
+        """Flushes buffered lines to the file."""
+        self._file.flush()
+
+    def close(self):
+        """Closes the file."""
+        self._file.close()
+
+
+class PrometheusSink(HistogramSink):
+    """Aggregates records like :class:`HistogramSink` and writes them as Prometheus text file.
+
+    The file is meant for the textfile collector of the node exporter, it is replaced
+    atomically on every flush.
+
+    Attributes:
+        path: path of the ``.prom`` file.
+        flush_interval: Optional; seconds between automatic flushes while recording.
+        buckets: Optional; increasing upper bounds of the duration buckets in seconds.
+    """
+
+    def __init__(self, path, flush_interval=10.0, buckets=DURATION_BUCKETS):
+        """Initializes empty statistics."""
+        super().__init__(buckets)
+        self.path = path
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def record(self, stage, values):
+        """Aggregates the values and flushes once the interval passed."""
+        super().record(stage, values)
+        if time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all statistics in the Prometheus text exposition format."""
+        self._last_flush = time.monotonic()
+        lines = [
+            "# HELP uwb_stage_duration_seconds Duration of instrumented stages.",
+            "# TYPE uwb_stage_duration_seconds histogram",
+        ]
+        for stage, stats in sorted(self.stats.items()):
+            cumulative = np.cumsum(stats["histogram"])
+            for bound, count in zip(self.buckets + ("+Inf",), cumulative):
+                lines.append(
+                    'uwb_stage_duration_seconds_bucket{stage="%s",le="%s"} %d'
+                    % (stage, bound, count)
+                )
+            lines.append(
+                'uwb_stage_duration_seconds_sum{stage="%s"} %r'
+                % (stage, stats["duration"])
+            )
+            lines.append(
+                'uwb_stage_duration_seconds_count{stage="%s"} %d'
+                % (stage, stats["count"])
+            )
+
+        for name, kind, description in (
+            ("particles", "counter", "Particles processed by instrumented stages."),
+            (
+                "measurements",
+                "counter",
+                "Measurements processed by instrumented stages.",
+            ),
+            ("ess", "gauge", "Most recent mean effective sample size."),
+            ("entropy", "gauge", "Most recent mean entropy of the particle weights."),
+        ):
+            metric = "uwb_stage_%s%s" % (name, "_total" if kind == "counter" else "")
+            lines += [
+                "# HELP %s %s" % (metric, description),
+                "# TYPE %s %s" % (metric, kind),
+            ]
+            for stage, stats in sorted(self.stats.items()):
+                if name in stats and (kind == "gauge" or stats[name]):
+                    lines.append('%s{stage="%s"} %r' % (metric, stage, stats[name]))
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
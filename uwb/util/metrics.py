@@ -2,9 +2,12 @@ import numpy as np
 
 
 def ess(weights):
-    """Computes effective sample size."""
+    """Computes effective sample size.
 
-    M = len(weights)
+    Weights with format (K, N) are evaluated row wise.
+    """
+
+    M = np.shape(weights)[-1]
     CV = cv(weights)
     return M / (1 + CV)
 
@@ -12,5 +15,5 @@ def ess(weights):
 def cv(weights):
     """Computes coefficient of variation."""
 
-    M = len(weights)
-    return np.mean((M * weights - 1) ** 2)
+    M = np.shape(weights)[-1]
+    return np.mean((M * weights - 1) ** 2, axis=-1)
@@ -0,0 +1,17 @@
+def find_subclass(cls, name):
+    """Finds a (transitive) subclass of the given class by its name.
+
+    Args:
+        cls: base class to search from.
+        name: class name of the subclass.
+
+    Returns:
+        The subclass or None if there is no subclass with the name.
+    """
+    for subclass in cls.__subclasses__():
+        if subclass.__name__ == name:
+            return subclass
+        found = find_subclass(subclass, name)
+        if found is not None:
+            return found
+    return None
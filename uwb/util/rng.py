@@ -0,0 +1,53 @@
+import zlib
+
+import numpy as np
+
+BIT_GENERATORS = {"pcg64": np.random.PCG64, "philox": np.random.Philox}
+
+
+def make_rng(seed=None, bit_generator="pcg64"):
+    """Creates a numpy Generator.
+
+    Args:
+        seed: Optional; seed, :class:`numpy.random.SeedSequence` or Generator, which is returned
+          unchanged. Fresh entropy is used if not provided.
+        bit_generator: Optional; one of :data:`BIT_GENERATORS`.
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if bit_generator not in BIT_GENERATORS:
+        raise ValueError(
+            "Unknown bit generator '%s', expected one of %s"
+            % (bit_generator, list(BIT_GENERATORS))
+        )
+    return np.random.Generator(BIT_GENERATORS[bit_generator](seed))
+
+
+def spawn_rngs(seed, n, bit_generator="pcg64"):
+    """Creates independent Generators for n parallel workers or filters from one seed.
+
+    The streams are derived with :meth:`numpy.random.SeedSequence.spawn`, so they do not
+    overlap and runs with the same seed are reproducible.
+
+    Args:
+        seed: seed of the run, fresh entropy if None.
+        n: number of Generators.
+        bit_generator: Optional; one of :data:`BIT_GENERATORS`.
+    """
+    return [make_rng(s, bit_generator) for s in np.random.SeedSequence(seed).spawn(n)]
+
+
+def tag_rng(seed, tag, bit_generator="pcg64"):
+    """Creates the Generator of a tag, independent of the streams of all other tags.
+
+    The stream only depends on the seed and the tag, not on the order tags appear in or the
+    worker a tag is assigned to, e.g. by :class:`uwb.runtime.TrackingServer`. Filters
+    created with it give the same results regardless of the number of workers.
+
+    Args:
+        seed: seed of the run, fresh entropy if None.
+        tag: id of the tag, hashed via its string representation.
+        bit_generator: Optional; one of :data:`BIT_GENERATORS`.
+    """
+    key = zlib.crc32(str(tag).encode("utf-8"))
+    return make_rng(np.random.SeedSequence(seed, spawn_key=(key,)), bit_generator)